@@ -0,0 +1,193 @@
+"""
+Équivalent asynchrone de upstream.py pour le mode de service ASGI.
+
+Les appels sortants passent par des httpx.AsyncClient (un pool par
+fournisseur, mêmes timeouts que le mode synchrone) : une requête qui attend
+OpenWeather ou OpenRouter n'occupe plus de thread, seulement une tâche sur
+la boucle d'événements.
+"""
+
+import asyncio
+import contextlib
+import time
+
+import httpx
+
+import quota
+from cache import geohash_center
+from upstream import CONFIG, check_rate_limited, get_timeout
+
+_clients = {}
+
+# Références vers les rafraîchissements en cours (évite leur ramasse-miettes)
+_background_tasks = set()
+
+
+def get_client(provider):
+    client = _clients.get(provider)
+    if client is None:
+        connect_timeout, read_timeout = get_timeout(provider)
+        client = httpx.AsyncClient(
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(
+                max_connections=CONFIG.get("ASYNC_HTTP_MAX_CONNECTIONS", 100),
+                max_keepalive_connections=CONFIG.get("HTTP_POOL_MAXSIZE", 20),
+            ),
+        )
+        _clients[provider] = client
+    return client
+
+
+async def get(provider, url, **kwargs):
+    await quota.manager.acquire_async(provider)
+    return check_rate_limited(provider, await get_client(provider).get(url, **kwargs))
+
+
+async def post(provider, url, **kwargs):
+    await quota.manager.acquire_async(provider)
+    return check_rate_limited(provider, await get_client(provider).post(url, **kwargs))
+
+
+@contextlib.asynccontextmanager
+async def stream(provider, method, url, **kwargs):
+    """Réponse lue au fil de l'eau (aiter_lines) ; la connexion est libérée à la sortie du bloc"""
+    await quota.manager.acquire_async(provider)
+    async with get_client(provider).stream(method, url, **kwargs) as response:
+        yield check_rate_limited(provider, response)
+
+
+class AsyncSingleFlight:
+    """Version asyncio de upstream.SingleFlight"""
+
+    def __init__(self):
+        self._calls = {}
+        self._stats = {"calls": 0, "collapsed": 0, "errors": 0}
+
+    async def do(self, key, fn):
+        task = self._calls.get(key)
+        if task is not None:
+            self._stats["collapsed"] += 1
+        else:
+            self._stats["calls"] += 1
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda t: self._done(key, t))
+        # shield : l'annulation d'un appelant n'annule pas l'appel partagé
+        return await asyncio.shield(task)
+
+    def _done(self, key, task):
+        self._calls.pop(key, None)
+        if not task.cancelled() and task.exception() is not None:
+            self._stats["errors"] += 1
+
+    def get_stats(self):
+        stats = dict(self._stats)
+        stats["in_flight"] = len(self._calls)
+        total = stats["calls"] + stats["collapsed"]
+        stats["collapse_rate"] = round(stats["collapsed"] / total, 3) if total else 0.0
+        return stats
+
+
+_single_flight = AsyncSingleFlight()
+
+
+async def fetch_json(provider, url):
+    async def call():
+        response = await get(provider, url)
+        response.raise_for_status()
+        return response.json()
+
+    return await _single_flight.do((provider, url), call)
+
+
+def get_singleflight_stats():
+    return _single_flight.get_stats()
+
+
+async def fan_out(calls, timeout=None, required=()):
+    """Version asyncio de upstream.fan_out : {nom: fonction coroutine}"""
+    if timeout is None:
+        timeout = CONFIG.get("FANOUT_TIMEOUT", 8)
+
+    tasks = {name: asyncio.ensure_future(call()) for name, call in calls.items()}
+    done, _ = await asyncio.wait(tasks.values(), timeout=timeout)
+
+    results = {}
+    for name, task in tasks.items():
+        if task not in done:
+            task.cancel()
+            if name in required:
+                raise TimeoutError(f"Délai dépassé pour {name} ({timeout}s)")
+            print(f"Appel {name} abandonné après {timeout}s")
+            results[name] = None
+            continue
+        error = task.exception()
+        if error is not None:
+            if name in required:
+                raise error
+            print(f"Appel {name} en échec: {str(error)}")
+            results[name] = None
+        else:
+            results[name] = task.result()
+    return results
+
+
+async def cached(cache, lat, lon, loader):
+    """Version asyncio de GeoCache.get_or_load_at avec une coroutine loader(lat, lon)"""
+    cell = cache.cell(lat, lon)
+    center_lat, center_lon = geohash_center(cell)
+    return await cached_key(cache, cell, lambda: loader(center_lat, center_lon))
+
+
+async def _lookup(cache, key):
+    """Niveau mémoire lu sur la boucle ; le niveau persistant (SQLite) dans un thread"""
+    result = cache.lookup(key, memory_only=True)
+    if result is None:
+        result = await asyncio.to_thread(cache.lookup, key)
+    return result
+
+
+async def _put(cache, key, value):
+    stored_at = time.time()
+    cache.put(key, value, stored_at, persist=False)
+    if cache.store is not None:
+        await asyncio.to_thread(cache.persist, key, value, stored_at)
+
+
+async def cached_key(cache, key, loader):
+    """Version asyncio de TTLCache.get_or_load avec une fonction coroutine loader()"""
+    value, state = await _lookup(cache, key)
+    if state == "fresh":
+        return value
+
+    if state == "stale":
+        if cache.begin_refresh(key):
+            task = asyncio.ensure_future(_refresh(cache, key, loader()))
+            _background_tasks.add(task)
+            task.add_done_callback(_background_tasks.discard)
+        return value
+
+    try:
+        fresh_value = await loader()
+    except cache.serve_expired_on:
+        if state == "expired":
+            cache.count_served_expired()
+            return value
+        raise
+    await _put(cache, key, fresh_value)
+    return fresh_value
+
+
+async def _refresh(cache, cell, coro):
+    try:
+        await _put(cache, cell, await coro)
+    except Exception as e:
+        cache.end_refresh(cell, e)
+    else:
+        cache.end_refresh(cell)
+
+
+async def close_clients():
+    for client in _clients.values():
+        await client.aclose()
+    _clients.clear()
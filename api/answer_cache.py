@@ -0,0 +1,162 @@
+"""
+Cache des réponses d'OpenRouter aux questions posées en début de
+conversation (sans contexte, donc réutilisables d'un agriculteur à l'autre).
+
+La clé est la forme normalisée de la question : termes de
+knowledge_base.tokenize (accents retirés, pluriels ramenés au singulier),
+dédoublonnés et triés. « Quand faut-il irriguer le maïs ? » et « Le maïs,
+quand l'irriguer ? » partagent donc la même entrée. La liste de mots vides
+est plus courte que celle de la recherche : mots interrogatifs, négations et
+quantités changent la réponse attendue et restent dans la clé (« Quand
+planter le riz ? » et « Comment planter le riz ? » sont deux entrées).
+
+En option, une question sans entrée exacte peut réutiliser la réponse d'une
+question quasi identique : similarité de Dice sur les trigrammes de
+caractères des formes normalisées, au-dessus d'un seuil, à mots
+interrogatifs, négations et quantités identiques. Les candidats sont
+trouvés par un index inversé trigramme -> clés, sans parcourir le cache.
+"""
+
+import threading
+
+from cache import TTLCache
+from conversation_store import estimate_tokens
+from knowledge_base import tokenize
+
+
+# Articles, prépositions, pronoms et auxiliaires seulement
+STOPWORDS = frozenset("""
+a ai au aux avec c ce ces cet cette dans de des du elle en est et etre eux il ils je la le les leur
+leurs lui ma me mes moi mon nos notre nous on par pour qu que qui sa se ses son sont sur ta te tes
+toi ton tu un une vos votre vous y avoir
+""".split())
+
+# Termes qu'une réponse quasi identique doit partager exactement
+MARKERS = frozenset(tokenize("""
+quand comment ou combien pourquoi quel quelle quels quelles quoi
+ne pas jamais plus sans aucun rien trop peu beaucoup moins
+""", stopwords=()))
+
+
+def normalize(question):
+    return " ".join(sorted(set(tokenize(question, stopwords=STOPWORDS))))
+
+
+def markers(key):
+    return frozenset(token for token in key.split() if token in MARKERS)
+
+
+def ngrams(text, size=3):
+    padded = f" {text} "
+    return frozenset(padded[i:i + size] for i in range(max(1, len(padded) - size + 1)))
+
+
+class AnswerCache:
+    def __init__(self, ttl=604800, max_entries=5000, max_bytes=None, near_duplicates=True,
+                 similarity_threshold=0.85, ngram_size=3, cost_per_million_tokens=None):
+        self._cache = TTLCache("answers", ttl=ttl, max_entries=max_entries, max_bytes=max_bytes)
+        self.near_duplicates = near_duplicates
+        self.similarity_threshold = similarity_threshold
+        self.ngram_size = ngram_size
+        # Prix estimés de l'appel évité (USD par million de tokens)
+        self.cost_per_million_tokens = cost_per_million_tokens or {"input": 0.25, "output": 1.25}
+        self._grams = {}  # clé -> trigrammes
+        self._markers = {}  # clé -> mots interrogatifs, négations et quantités
+        self._index = {}  # trigramme -> clés
+        self._lock = threading.Lock()
+        self._stats = {"exact_hits": 0, "near_hits": 0, "misses": 0, "stored": 0, "saved_tokens": 0, "saved_cost": 0.0}
+
+    def _near_match(self, key):
+        grams = ngrams(key, self.ngram_size)
+        required = markers(key)
+        with self._lock:
+            shared = {}
+            for gram in grams:
+                for candidate in self._index.get(gram, ()):
+                    shared[candidate] = shared.get(candidate, 0) + 1
+            # « Quand » ne répond pas à « Comment », ni « ne ... pas » à la forme affirmative
+            scored = [
+                (2 * count / (len(grams) + len(self._grams[candidate])), candidate)
+                for candidate, count in shared.items() if self._markers[candidate] == required
+            ]
+        for score, candidate in sorted(scored, reverse=True):
+            if score < self.similarity_threshold:
+                break
+            value, state = self._cache.lookup(candidate)
+            if state == "fresh":
+                return value
+            # Entrée expirée ou évincée du cache : retirée de l'index
+            self._unindex(candidate)
+        return None
+
+    def _unindex(self, key):
+        with self._lock:
+            self._markers.pop(key, None)
+            for gram in self._grams.pop(key, ()):
+                keys = self._index.get(gram)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del self._index[gram]
+
+    def _prune_index(self):
+        """Retire de l'index les clés que le cache a évincées"""
+        with self._lock:
+            keys = list(self._grams)
+        for key in keys:
+            if self._cache.time_to_expiry(key) is None:
+                self._unindex(key)
+
+    def get(self, question, messages=None):
+        """Réponse en cache pour la question, ou None ; messages = prompt qui aurait été envoyé"""
+        key = normalize(question)
+        if not key:
+            return None
+        value, state = self._cache.lookup(key)
+        kind = "exact_hits"
+        if state != "fresh":
+            value = self._near_match(key) if self.near_duplicates else None
+            kind = "near_hits"
+        with self._lock:
+            if value is None:
+                self._stats["misses"] += 1
+                return None
+            self._stats[kind] += 1
+            input_tokens = sum(estimate_tokens(message) for message in messages or [])
+            output_tokens = estimate_tokens({"content": value})
+            self._stats["saved_tokens"] += input_tokens + output_tokens
+            self._stats["saved_cost"] += (
+                input_tokens * self.cost_per_million_tokens["input"]
+                + output_tokens * self.cost_per_million_tokens["output"]
+            ) / 1e6
+        return value
+
+    def put(self, question, answer):
+        key = normalize(question)
+        if not key or not answer:
+            return
+        self._cache.put(key, answer)
+        grams = ngrams(key, self.ngram_size)
+        with self._lock:
+            self._stats["stored"] += 1
+            if key not in self._grams:
+                self._grams[key] = grams
+                self._markers[key] = markers(key)
+                for gram in grams:
+                    self._index.setdefault(gram, set()).add(key)
+            indexed = len(self._grams)
+        if indexed > 2 * self._cache.max_entries:
+            self._prune_index()
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["indexed"] = len(self._grams)
+        stats["saved_cost"] = round(stats["saved_cost"], 4)
+        hits = stats["exact_hits"] + stats["near_hits"]
+        lookups = hits + stats["misses"]
+        stats["hit_rate"] = round(hits / lookups, 3) if lookups else 0.0
+        cache_stats = self._cache.get_stats()
+        stats.update({"entries": cache_stats["entries"], "bytes": cache_stats["bytes"], "evictions": cache_stats["evictions"]})
+        return stats
+
@@ -0,0 +1,414 @@
+"""
+Mode de service asynchrone (ASGI) de l'API AGRIA.
+
+Les routes dominées par l'attente des fournisseurs externes (météo, qualité
+de l'air, climat, analyse de sol, AgriBot) tournent sur une boucle
+d'événements Quart avec un client HTTP non bloquant. Toutes les autres routes
+(/api/auth/*, /api/farms, ...) sont servies par l'application Flask de
+main.py, montée telle quelle via WsgiToAsgi : les contrats de réponse sont
+identiques dans les deux modes.
+
+Lancement : SERVER_MODE=async ./run_server.sh
+(ou directement : hypercorn asgi_app:app --bind 0.0.0.0:8000)
+"""
+
+import asyncio
+import functools
+import math
+import os
+import re
+
+import httpx
+from asgiref.wsgi import WsgiToAsgi
+from quart import Quart, request, jsonify, session
+from quart_cors import cors
+from quart.utils import run_sync
+
+import aio_upstream
+import chatbot
+import forecast
+import prefetch
+import providers
+import upstream
+from quota import QuotaExceeded, manager as quota_manager
+from auth import admin_user, get_auth_stats, users
+from farms import farm_registry
+from chatbot import handle_local_chat
+from geometry import InvalidGeometry
+from main import SSE_HEADERS, app as flask_app, parse_forecast_args
+from providers import OPEN_ROUTER_KEY
+
+quart_app = Quart(__name__, static_folder=None)
+quart_app.secret_key = flask_app.secret_key
+# Même politique que Flask-CORS(supports_credentials=True) : origine renvoyée en écho
+quart_app = cors(quart_app, allow_origin=re.compile(r".*"), allow_credentials=True)
+
+
+def quota_exceeded_response(error):
+    headers = {"Retry-After": str(math.ceil(error.retry_after))} if error.retry_after else {}
+    return jsonify({"error": f"Quota {error.provider} épuisé, réessayez plus tard"}), 429, headers
+
+
+async def get_current_weather(lat, lon):
+    async def load(lat, lon):
+        weather_data = await aio_upstream.fetch_json("openweather", providers.current_weather_url(lat, lon))
+        # Compaction périodique de l'historique : hors de la boucle
+        await run_sync(providers.weather_history.record)(lat, lon, weather_data)
+        return weather_data
+    return await aio_upstream.cached(providers.weather_cache, lat, lon, load)
+
+
+async def get_forecast(lat, lon):
+    async def load(lat, lon):
+        return await aio_upstream.fetch_json("openweather", providers.forecast_url(lat, lon))
+    return await aio_upstream.cached(providers.forecast_cache, lat, lon, load)
+
+
+async def get_air_pollution(lat, lon):
+    async def load(lat, lon):
+        return await aio_upstream.fetch_json("openweather", providers.air_pollution_url(lat, lon))
+    return await aio_upstream.cached(providers.air_cache, lat, lon, load)
+
+
+async def get_field_climate(field):
+    center_lon, center_lat = field["centroid"]
+
+    async def load():
+        return await aio_upstream.fetch_json("agromonitoring", providers.agro_soil_url(center_lat, center_lon))
+    return await aio_upstream.cached_key(providers.field_climate_cache, field["hash"], load)
+
+
+async def load_soil_analysis(lat, lon):
+    async def compute(lat, lon):
+        sources = await aio_upstream.fan_out({
+            "weather": lambda: get_current_weather(lat, lon),
+            "air": lambda: get_air_pollution(lat, lon),
+        }, required=("weather",))
+        return providers.analyze_soil(sources["weather"], sources["air"] or {})
+    return await aio_upstream.cached(providers.soil_cache, lat, lon, compute)
+
+
+@quart_app.route('/api/agribot', methods=['POST'])
+async def agribot():
+    try:
+        data = await request.get_json()
+        user_input = data.get("question", "").strip()
+
+        # Vérifier si l'entrée est vide
+        if not user_input:
+            return jsonify({"response": "Je n'ai pas compris votre question. Pouvez-vous reformuler?"}), 400
+
+        # Si la clé OpenRouter est configurée, utiliser ce service
+        if OPEN_ROUTER_KEY:
+            response = await handle_openrouter_chat(user_input)
+        else:
+            response = handle_local_chat(user_input)
+
+        return jsonify({"response": response})
+    except Exception as e:
+        print(f"Erreur dans l'API chatbot: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+
+def get_conversation_id():
+    session.pop("agribot_memory", None)
+    if "agribot_id" not in session:
+        session["agribot_id"] = chatbot.conversations.create()
+    return session["agribot_id"]
+
+
+def save_turn_in_background(conversation_id, user_input, reply):
+    """
+    Ajout de l'échange dans un thread (SQLite si persist), sans l'attendre :
+    appelé aussi à la fermeture d'un générateur, où plus rien ne peut être attendu
+    """
+    asyncio.get_running_loop().run_in_executor(None, functools.partial(
+        chatbot.conversations.append,
+        conversation_id,
+        {"role": "user", "content": user_input},
+        {"role": "assistant", "content": reply},
+    ))
+
+
+async def handle_openrouter_chat(user_input):
+    conversation_id = get_conversation_id()
+    # Conversations lues et écrites hors de la boucle (SQLite si persist)
+    messages = await run_sync(chatbot.conversations.prompt)(conversation_id, user_input)
+
+    assistant_message = chatbot.cached_answer(messages, user_input)
+
+    try:
+        if assistant_message is None:
+            response = await aio_upstream.post("openrouter", **chatbot.openrouter_request(messages, OPEN_ROUTER_KEY))
+            assistant_message = chatbot.extract_reply(response.json())
+            chatbot.remember_answer(messages, user_input, assistant_message)
+
+        await run_sync(chatbot.conversations.append)(
+            conversation_id,
+            {"role": "user", "content": user_input},
+            {"role": "assistant", "content": assistant_message},
+        )
+
+        return assistant_message
+    except Exception as e:
+        print(f"Erreur OpenRouter: {str(e)}")
+        # Fallback sur le système local
+        return handle_local_chat(user_input)
+
+
+@quart_app.route('/api/agribot/stream', methods=['POST'])
+async def agribot_stream():
+    data = await request.get_json() or {}
+    user_input = (data.get("question") or "").strip()
+    if not user_input:
+        return jsonify({"response": "Je n'ai pas compris votre question. Pouvez-vous reformuler?"}), 400
+
+    headers = dict(SSE_HEADERS, **{"Content-Type": "text/event-stream"})
+    if not OPEN_ROUTER_KEY:
+        async def local():
+            yield chatbot.sse_event({"delta": handle_local_chat(user_input)})
+            yield chatbot.sse_event({"source": "local"}, "done")
+        return local(), 200, headers
+
+    conversation_id = get_conversation_id()
+    messages = await run_sync(chatbot.conversations.prompt)(conversation_id, user_input)
+    cached = chatbot.cached_answer(messages, user_input)
+    if cached is not None:
+        await run_sync(chatbot.conversations.append)(
+            conversation_id, {"role": "user", "content": user_input}, {"role": "assistant", "content": cached}
+        )
+
+        async def from_cache():
+            yield chatbot.sse_event({"delta": cached})
+            yield chatbot.sse_event({"source": "cache"}, "done")
+        return from_cache(), 200, headers
+
+    openrouter_args = chatbot.openrouter_request(messages, OPEN_ROUTER_KEY, stream=True)
+    url = openrouter_args.pop("url")
+
+    async def generate():
+        reply = []
+        try:
+            try:
+                async with aio_upstream.stream("openrouter", "POST", url, **openrouter_args) as response:
+                    response.raise_for_status()
+                    async for line in response.aiter_lines():
+                        done, delta = chatbot.parse_stream_line(line)
+                        if delta:
+                            reply.append(delta)
+                            yield chatbot.sse_event({"delta": delta})
+                        if done:
+                            break
+            except Exception as e:
+                print(f"Erreur OpenRouter (streaming): {str(e)}")
+                if reply:
+                    yield chatbot.sse_event({"error": "Réponse interrompue"}, "error")
+                    return
+                reply.append(handle_local_chat(user_input))
+                yield chatbot.sse_event({"delta": reply[0]})
+                yield chatbot.sse_event({"source": "local"}, "done")
+                return
+            chatbot.remember_answer(messages, user_input, "".join(reply))
+            yield chatbot.sse_event({"source": "openrouter"}, "done")
+        except (GeneratorExit, asyncio.CancelledError):
+            # Client déconnecté : la sortie du bloc stream ferme la connexion amont
+            print("Client AgriBot déconnecté pendant le streaming")
+            raise
+        finally:
+            if reply:
+                save_turn_in_background(conversation_id, user_input, "".join(reply))
+
+    return generate(), 200, headers
+
+
+@quart_app.route('/api/weather', methods=['GET'])
+async def get_weather():
+    lat = request.args.get('lat')
+    lon = request.args.get('lon')
+
+    if not lat or not lon:
+        return jsonify({"error": "Latitude et longitude requises"}), 400
+
+    try:
+        lat, lon = float(lat), float(lon)
+        prefetch.scheduler.record_view(lat, lon)
+        weather_data = await get_current_weather(lat, lon)
+        return jsonify(providers.format_weather(weather_data))
+    except httpx.HTTPStatusError as e:
+        status_code = e.response.status_code
+        return jsonify({"error": f"Erreur OpenWeather: {status_code}"}), status_code
+    except QuotaExceeded as e:
+        return quota_exceeded_response(e)
+    except Exception as e:
+        return jsonify({"error": f"Erreur: {str(e)}"}), 500
+
+
+@quart_app.route('/api/forecast', methods=['GET'])
+async def get_forecast_route():
+    try:
+        lat, lon, resolution, hours, fields = parse_forecast_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        forecast_data = await get_forecast(lat, lon)
+        return jsonify(forecast.resample(forecast_data, resolution, hours, fields))
+    except httpx.HTTPStatusError as e:
+        status_code = e.response.status_code
+        return jsonify({"error": f"Erreur OpenWeather: {status_code}"}), status_code
+    except QuotaExceeded as e:
+        return quota_exceeded_response(e)
+    except Exception as e:
+        return jsonify({"error": f"Erreur: {str(e)}"}), 500
+
+
+@quart_app.route('/api/airquality', methods=['GET'])
+async def get_air_quality():
+    lat = request.args.get('lat')
+    lon = request.args.get('lon')
+
+    if not lat or not lon:
+        return jsonify({"error": "Latitude et longitude requises"}), 400
+
+    try:
+        lat, lon = float(lat), float(lon)
+        prefetch.scheduler.record_view(lat, lon)
+        air_data = await get_air_pollution(lat, lon)
+
+        formatted_data = providers.format_air_quality(air_data)
+        if formatted_data is None:
+            return jsonify({"error": "Données de qualité d'air non disponibles"}), 404
+
+        return jsonify(formatted_data)
+    except httpx.HTTPStatusError as e:
+        status_code = e.response.status_code
+        return jsonify({"error": f"Erreur OpenWeather: {status_code}"}), status_code
+    except QuotaExceeded as e:
+        return quota_exceeded_response(e)
+    except Exception as e:
+        return jsonify({"error": f"Erreur: {str(e)}"}), 500
+
+
+@quart_app.route('/api/climate', methods=['POST'])
+async def get_climate():
+    try:
+        data = await request.get_json()
+        if not data or not data.get('polygon'):
+            return jsonify({"error": "Coordonnées du polygone requises"}), 400
+
+        try:
+            # Validation et simplification NumPy du polygone hors de la boucle
+            field = await run_sync(providers.get_field)(data.get('polygon'))
+        except InvalidGeometry as e:
+            return jsonify({"error": f"Polygone invalide: {str(e)}"}), 400
+        center_lon, center_lat = field["centroid"]
+        prefetch.scheduler.record_view(center_lat, center_lon)
+
+        # Lecture raster hors de la boucle d'événements
+        ndvi_value = await run_sync(providers.latest_field_ndvi)(data.get('polygon'), field)
+
+        try:
+            data = await get_field_climate(field)
+            if not isinstance(data, dict):
+                return await get_climate_from_weather(center_lat, center_lon, ndvi_value)
+            climate_data = providers.format_climate(data)
+            if ndvi_value is not None:
+                climate_data["ndvi"] = ndvi_value
+            return jsonify(climate_data)
+        except (httpx.HTTPError, QuotaExceeded) as e:
+            print(f"Fallback vers données météo: {str(e)}")
+            return await get_climate_from_weather(center_lat, center_lon, ndvi_value)
+
+    except Exception as e:
+        print(f"Erreur générale: {str(e)}")
+        return jsonify({"error": f"Erreur: {str(e)}"}), 500
+
+
+async def get_climate_from_weather(lat, lon, ndvi_value=None):
+    try:
+        weather_data = await get_current_weather(lat, lon)
+        climate_data = providers.climate_from_weather(weather_data)
+        if ndvi_value is not None:
+            climate_data["ndvi"] = ndvi_value
+        return jsonify(climate_data)
+    except QuotaExceeded as e:
+        return quota_exceeded_response(e)
+    except Exception as e:
+        print(f"Erreur génération données climat: {str(e)}")
+        return jsonify({"error": f"Erreur génération données climat: {str(e)}"}), 503
+
+
+@quart_app.route('/api/soil-analysis', methods=['GET'])
+async def get_soil_analysis():
+    lat = request.args.get('lat')
+    lon = request.args.get('lon')
+
+    if not lat or not lon:
+        return jsonify({"error": "Latitude et longitude requises"}), 400
+
+    try:
+        lat, lon = float(lat), float(lon)
+        prefetch.scheduler.record_view(lat, lon)
+
+        return jsonify(await load_soil_analysis(lat, lon))
+    except QuotaExceeded as e:
+        return quota_exceeded_response(e)
+    except Exception as e:
+        print(f"Erreur analyse de sol: {str(e)}")
+        return jsonify({"error": f"Erreur analyse de sol: {str(e)}"}), 503
+
+
+@quart_app.route('/api/metrics', methods=['GET'])
+async def get_metrics():
+    # Même contrôle que le mode Flask (token_required + rôle admin) ; lecture du compte hors de la boucle
+    auth_header = request.headers.get('Authorization') or ''
+    token = auth_header.split(' ')[1] if auth_header.startswith('Bearer ') else None
+    if not token:
+        return jsonify({"message": "Token d'authentification manquant"}), 401
+    if await run_sync(admin_user)(token) is None:
+        return jsonify({"message": "Accès réservé aux administrateurs"}), 403
+    return jsonify({
+        "cache": providers.get_cache_stats(),
+        "singleflight": upstream.get_singleflight_stats(),
+        "async_singleflight": aio_upstream.get_singleflight_stats(),
+        "prefetch": prefetch.scheduler.get_stats(),
+        "quota": quota_manager.get_stats(),
+        "history": providers.weather_history.get_stats(),
+        "knowledge_base": chatbot.knowledge.get_stats(),
+        "conversations": chatbot.conversations.get_stats(),
+        "users": users.get_stats(),
+        "auth": get_auth_stats(),
+        "farms": farm_registry.get_stats(),
+        "answers": chatbot.answers.get_stats() if chatbot.answers is not None else None
+    })
+
+
+@quart_app.before_serving
+async def start_prefetch():
+    prefetch.start_if_enabled()
+
+
+@quart_app.after_serving
+async def close_clients():
+    await aio_upstream.close_clients()
+
+
+_wsgi_app = WsgiToAsgi(flask_app)
+_async_paths = {rule.rule for rule in quart_app.url_map.iter_rules()}
+
+
+async def app(scope, receive, send):
+    """Point d'entrée ASGI : routes asynchrones sur Quart, le reste sur Flask"""
+    if scope["type"] == "lifespan" or scope.get("path") in _async_paths:
+        await quart_app(scope, receive, send)
+    else:
+        await _wsgi_app(scope, receive, send)
+
+
+if __name__ == '__main__':
+    from hypercorn.asyncio import serve
+    from hypercorn.config import Config
+
+    hypercorn_config = Config()
+    hypercorn_config.bind = [f"0.0.0.0:{int(os.environ.get('PORT', 8000))}"]
+    asyncio.run(serve(app, hypercorn_config))
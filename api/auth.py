@@ -3,16 +3,38 @@ import hashlib
 import secrets
 import time
 import re
+import os
 import jwt
 from datetime import datetime, timedelta
 
+from passwords import HashingBusy, PasswordHasher
+from token_cache import RevocationList, VerifiedTokens, token_hash
+from user_store import UserExists, UserStore
+
+try:
+    from config import CONFIG
+except ImportError:
+    CONFIG = {}
+
 # Configuration
 SECRET_KEY = "dev_secret_key_for_auth_tokens"  # À changer en production
 TOKEN_EXPIRATION = 24 * 60 * 60  # 24 heures en secondes
 
-# Simuler une base de données utilisateurs (à remplacer par une vraie DB)
-users_db = {}
-# Ajouter un utilisateur de test
+# Base des utilisateurs (SQLite), recherche indexée par id et par email
+_user_settings = CONFIG.get("USER_STORE", {})
+_users_path = _user_settings.get("path", "var/users.db")
+if not os.path.isabs(_users_path):
+    _users_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), _users_path)
+users = UserStore(
+    _users_path,
+    pool_size=_user_settings.get("pool_size", 4),
+    cache_ttl=_user_settings.get("cache_ttl", 300),
+    cache_max_entries=_user_settings.get("cache_max_entries", 10000),
+)
+# Hachage des mots de passe dans un pool de processus (coût réglable)
+_password_settings = CONFIG.get("PASSWORDS", {})
+passwords = PasswordHasher(**_password_settings)
+# Ajouter un utilisateur de test (empreinte SHA-256 historique, réhachée à la première connexion)
 test_user = {
     "id": "1",
     "email": "test@example.com",
@@ -22,7 +44,17 @@ test_user = {
     "createdAt": datetime.now().isoformat(),
     "farms": []
 }
-users_db[test_user["email"]] = test_user
+users.ensure(test_user)
+
+# Chemin rapide : jetons déjà vérifiés et jetons révoqués à la déconnexion
+_auth_settings = CONFIG.get("AUTH", {})
+verified_tokens = VerifiedTokens(max_entries=_auth_settings.get("verified_cache_size", 10000))
+revoked_tokens = RevocationList(
+    capacity=_auth_settings.get("revocation_capacity", 100000),
+    error_rate=_auth_settings.get("revocation_error_rate", 0.001),
+    purge_interval=_auth_settings.get("purge_interval", 600),
+    store=users,
+)
 
 # Créer un blueprint pour les routes d'authentification
 auth_bp = Blueprint('auth', __name__)
@@ -39,11 +71,33 @@ def generate_token(user_id):
 
 # Fonction pour vérifier un token JWT
 def verify_token(token):
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
-        return payload['user_id']
-    except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
+    key = token_hash(token)
+    # Filtre de Bloom d'abord : un jeton non révoqué répond sans verrou
+    if revoked_tokens.is_revoked(key):
         return None
+    claims = verified_tokens.get(key)
+    if claims is None:
+        try:
+            claims = jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
+        except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
+            return None
+        # Le cache respecte l'expiration du jeton
+        verified_tokens.put(key, claims, claims['exp'])
+    return claims['user_id']
+
+# Token Bearer du header Authorization, ou None
+def bearer_token():
+    auth_header = request.headers.get('Authorization')
+    if not auth_header or not auth_header.startswith('Bearer '):
+        return None
+    return auth_header.split(' ')[1]
+
+def get_auth_stats():
+    return {
+        "verified": verified_tokens.get_stats(),
+        "revoked": revoked_tokens.get_stats(),
+        "passwords": passwords.get_stats()
+    }
 
 # Fonction pour valider un email
 def is_valid_email(email):
@@ -74,7 +128,7 @@ def register():
         return jsonify({"message": "Format d'email invalide"}), 400
     
     # Vérifier si l'email existe déjà
-    if data['email'] in users_db:
+    if users.get_by_email(data['email']) is not None:
         return jsonify({"message": "Cet email est déjà utilisé"}), 409
     
     # Vérifier la longueur du mot de passe
@@ -83,7 +137,10 @@ def register():
     
     # Créer un nouvel utilisateur
     user_id = secrets.token_hex(4)  # Générer un ID unique
-    hashed_password = hashlib.sha256(data['password'].encode()).hexdigest()
+    try:
+        hashed_password = passwords.hash(data['password'])
+    except HashingBusy:
+        return jsonify({"message": "Service momentanément surchargé, réessayez"}), 503
     
     new_user = {
         "id": user_id,
@@ -95,8 +152,11 @@ def register():
         "farms": []
     }
     
-    # Ajouter l'utilisateur à la "base de données"
-    users_db[data['email']] = new_user
+    # Ajouter l'utilisateur à la base (l'index unique tranche entre deux inscriptions simultanées)
+    try:
+        users.create(new_user)
+    except UserExists:
+        return jsonify({"message": "Cet email est déjà utilisé"}), 409
     
     # Générer un token d'authentification
     token = generate_token(user_id)
@@ -115,15 +175,20 @@ def login():
     if not data or not all(k in data for k in ('email', 'password')):
         return jsonify({"message": "L'email et le mot de passe sont requis"}), 400
     
-    # Vérifier si l'utilisateur existe
-    if data['email'] not in users_db:
-        return jsonify({"message": "Identifiants invalides"}), 401
-    
-    user = users_db[data['email']]
-    
-    # Vérifier le mot de passe
-    hashed_password = hashlib.sha256(data['password'].encode()).hexdigest()
-    if hashed_password != user['password_hash']:
+    # Vérifier si l'utilisateur existe, puis le mot de passe ; un compte inconnu coûte
+    # la même dérivation qu'un mot de passe erroné (pas d'énumération des emails par le temps)
+    user = users.get_by_email(data['email'])
+    try:
+        if user is None:
+            valid = passwords.verify_dummy(data['password'])
+        else:
+            valid, needs_rehash = passwords.verify(data['password'], user['password_hash'])
+        if valid and needs_rehash:
+            # Ancienne empreinte (SHA-256 ou paramètres dépassés) remplacée de façon transparente
+            users.update(user['id'], password_hash=passwords.hash(data['password']))
+    except HashingBusy:
+        return jsonify({"message": "Service momentanément surchargé, réessayez"}), 503
+    if not valid:
         return jsonify({"message": "Identifiants invalides"}), 401
     
     # Générer un token d'authentification
@@ -138,52 +203,93 @@ def login():
 @auth_bp.route('/me', methods=['GET'])
 def get_current_user():
     # Récupérer le token du header Authorization
-    auth_header = request.headers.get('Authorization')
-    if not auth_header or not auth_header.startswith('Bearer '):
+    token = bearer_token()
+    if not token:
         return jsonify({"message": "Token d'authentification manquant"}), 401
     
-    token = auth_header.split(' ')[1]
-    
     # Vérifier le token
     user_id = verify_token(token)
     if not user_id:
         return jsonify({"message": "Token invalide ou expiré"}), 401
     
     # Trouver l'utilisateur par son ID
-    for user in users_db.values():
-        if user['id'] == user_id:
-            # Retourner les données utilisateur
-            return jsonify({
-                "user": sanitize_user(user)
-            }), 200
+    user = users.get_by_id(user_id)
+    if user is None:
+        return jsonify({"message": "Utilisateur non trouvé"}), 404
     
-    return jsonify({"message": "Utilisateur non trouvé"}), 404
+    # Retourner les données utilisateur
+    return jsonify({
+        "user": sanitize_user(user)
+    }), 200
+
+@auth_bp.route('/me', methods=['PATCH'])
+def update_current_user():
+    token = bearer_token()
+    if not token:
+        return jsonify({"message": "Token d'authentification manquant"}), 401
+    
+    user_id = verify_token(token)
+    if not user_id:
+        return jsonify({"message": "Token invalide ou expiré"}), 401
+    
+    data = request.json or {}
+    fields = {k: data[k] for k in ('name', 'email') if data.get(k)}
+    if 'email' in fields and not is_valid_email(fields['email']):
+        return jsonify({"message": "Format d'email invalide"}), 400
+    
+    # La mise à jour invalide l'utilisateur en cache (par id et par ancien email)
+    try:
+        user = users.update(user_id, **fields)
+    except UserExists:
+        return jsonify({"message": "Cet email est déjà utilisé"}), 409
+    if user is None:
+        return jsonify({"message": "Utilisateur non trouvé"}), 404
+    
+    return jsonify({
+        "user": sanitize_user(user)
+    }), 200
 
 @auth_bp.route('/logout', methods=['POST'])
 def logout():
-    # Note: côté serveur, nous ne faisons rien avec le token
-    # Le client doit simplement supprimer le token localement
+    # Le token présenté est révoqué jusqu'à son expiration ; le client le supprime aussi localement
+    token = bearer_token()
+    if token:
+        key = token_hash(token)
+        try:
+            claims = jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
+        except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
+            claims = None
+        if claims is not None:
+            revoked_tokens.revoke(key, claims['exp'])
+            verified_tokens.discard(key)
     return jsonify({"message": "Déconnexion réussie"}), 200
 
+# Utilisateur du token s'il est administrateur, sinon None (métriques internes)
+def admin_user(token):
+    user_id = verify_token(token) if token else None
+    user = users.get_by_id(user_id) if user_id else None
+    if user is None or user.get("role") != "admin":
+        return None
+    return user
+
 # Fonction middleware pour protéger les routes
 def token_required(f):
     def decorated(*args, **kwargs):
-        auth_header = request.headers.get('Authorization')
-        if not auth_header or not auth_header.startswith('Bearer '):
+        token = bearer_token()
+        if not token:
             return jsonify({"message": "Token d'authentification manquant"}), 401
         
-        token = auth_header.split(' ')[1]
         user_id = verify_token(token)
         
         if not user_id:
             return jsonify({"message": "Token invalide ou expiré"}), 401
         
         # Trouver l'utilisateur et l'ajouter à la requête
-        for user in users_db.values():
-            if user['id'] == user_id:
-                return f(user, *args, **kwargs)
+        user = users.get_by_id(user_id)
+        if user is None:
+            return jsonify({"message": "Utilisateur non trouvé"}), 404
         
-        return jsonify({"message": "Utilisateur non trouvé"}), 404
+        return f(user, *args, **kwargs)
     
     decorated.__name__ = f.__name__
     return decorated 
\ No newline at end of file
@@ -0,0 +1,290 @@
+"""
+Caches en mémoire pour les données des fournisseurs externes.
+
+- TTLCache : cache LRU borné (nombre d'entrées et taille estimée) avec TTL et
+  stale-while-revalidate : une entrée périmée est servie immédiatement pendant
+  qu'un seul rafraîchissement tourne en arrière-plan.
+- GeoCache : TTLCache dont les clés sont des cellules geohash, pour que des
+  fermes distantes de quelques centaines de mètres partagent la même entrée.
+"""
+
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+_BASE32_INDEX = {c: i for i, c in enumerate(_BASE32)}
+
+# Pool partagé pour les rafraîchissements en arrière-plan
+_refresh_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="cache-refresh")
+
+
+def geohash_encode(lat, lon, precision=6):
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < precision:
+        rng, value = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        if value >= mid:
+            bits = (bits << 1) | 1
+            rng[0] = mid
+        else:
+            bits = bits << 1
+            rng[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return "".join(chars)
+
+
+def geohash_bounds(cell):
+    """Retourne (min_lat, min_lon, max_lat, max_lon) de la cellule"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    even = True
+    for c in cell:
+        bits = _BASE32_INDEX[c]
+        for shift in range(4, -1, -1):
+            rng = lon_range if even else lat_range
+            mid = (rng[0] + rng[1]) / 2
+            if (bits >> shift) & 1:
+                rng[0] = mid
+            else:
+                rng[1] = mid
+            even = not even
+    return lat_range[0], lon_range[0], lat_range[1], lon_range[1]
+
+
+def geohash_center(cell):
+    min_lat, min_lon, max_lat, max_lon = geohash_bounds(cell)
+    return round((min_lat + max_lat) / 2, 6), round((min_lon + max_lon) / 2, 6)
+
+
+def _estimate_size(value):
+    try:
+        return len(json.dumps(value, default=str))
+    except (TypeError, ValueError):
+        return 1024
+
+
+class TTLCache:
+    def __init__(self, name, ttl, stale_ttl=0, max_entries=1024, max_bytes=None, serve_expired_on=(),
+                 store=None, retention=0):
+        self.name = name
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # Exceptions du loader pour lesquelles une entrée expirée est servie
+        # plutôt que de propager l'erreur (ex. quota du fournisseur épuisé)
+        self.serve_expired_on = tuple(serve_expired_on)
+        # Niveau persistant optionnel (SnapshotStore) et durée de conservation sur disque
+        self.store = store
+        self.retention = retention
+        self._entries = OrderedDict()  # clé -> (valeur, stocké_à, taille)
+        self._bytes = 0
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "stale": 0,
+            "refreshes": 0,
+            "refresh_errors": 0,
+            "evictions": 0,
+            "served_expired": 0,
+            "disk_hits": 0,
+        }
+
+    def _state(self, stored_at, now):
+        age = now - stored_at
+        if age < self.ttl:
+            return "fresh"
+        if age < self.ttl + self.stale_ttl:
+            return "stale"
+        return "expired"
+
+    def lookup(self, key, memory_only=False):
+        """
+        Retourne (valeur, état) avec état parmi fresh, stale, expired, miss.
+        memory_only : None si l'entrée n'est pas en mémoire et qu'il faudrait lire le niveau persistant.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+
+        if entry is None and self.store is not None:
+            if memory_only:
+                return None
+            row = self.store.get(self.name, key)
+            if row is not None:
+                value, stored_at = row
+                self._put_memory(key, value, stored_at)
+                entry = (value, stored_at)
+                with self._lock:
+                    self._stats["disk_hits"] += 1
+
+        with self._lock:
+            if entry is None:
+                self._stats["misses"] += 1
+                return None, "miss"
+            state = self._state(entry[1], time.time())
+            if state == "fresh":
+                self._stats["hits"] += 1
+            elif state == "stale":
+                self._stats["stale"] += 1
+            else:
+                self._stats["misses"] += 1
+            return entry[0], state
+
+    def time_to_expiry(self, key):
+        """Secondes de fraîcheur restantes (négatif si périmée), None si absente"""
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            return None
+        return entry[1] + self.ttl - time.time()
+
+    def put(self, key, value, stored_at=None, persist=True):
+        """persist=False : mémoire seulement, l'appelant écrit ensuite le niveau persistant (persist())"""
+        stored_at = stored_at or time.time()
+        self._put_memory(key, value, stored_at)
+        if persist:
+            self.persist(key, value, stored_at)
+
+    def persist(self, key, value, stored_at):
+        if self.store is not None:
+            expires_at = stored_at + max(self.ttl + self.stale_ttl, self.retention)
+            self.store.put(self.name, key, value, stored_at, expires_at)
+
+    def _put_memory(self, key, value, stored_at):
+        size = _estimate_size(value)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+            self._entries[key] = (value, stored_at, size)
+            self._bytes += size
+            self._evict()
+
+    def warm(self):
+        """Recharge en mémoire les entrées encore valides du niveau persistant"""
+        if self.store is None:
+            return 0
+        rows = self.store.load(self.name, self.max_entries)
+        for key, value, stored_at in rows:
+            self._put_memory(key, value, stored_at)
+        return len(rows)
+
+    def _evict(self):
+        while self._entries and (
+            len(self._entries) > self.max_entries
+            or (self.max_bytes and self._bytes > self.max_bytes)
+        ):
+            _, (_, _, size) = self._entries.popitem(last=False)
+            self._bytes -= size
+            self._stats["evictions"] += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+        if self.store is not None:
+            self.store.delete(self.name, key)
+
+    def get_or_load(self, key, loader):
+        value, state = self.lookup(key)
+        if state == "fresh":
+            return value
+        if state == "stale":
+            self.refresh_in_background(key, loader)
+            return value
+        try:
+            fresh_value = loader()
+        except self.serve_expired_on:
+            if state == "expired":
+                self.count_served_expired()
+                return value
+            raise
+        self.put(key, fresh_value)
+        return fresh_value
+
+    def count_served_expired(self):
+        with self._lock:
+            self._stats["served_expired"] += 1
+
+    def refresh(self, key, loader):
+        value = loader()
+        self.put(key, value)
+        with self._lock:
+            self._stats["refreshes"] += 1
+        return value
+
+    def begin_refresh(self, key):
+        """Réserve le rafraîchissement de la clé ; False s'il y en a déjà un en cours"""
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            return True
+
+    def end_refresh(self, key, error=None):
+        with self._lock:
+            self._refreshing.discard(key)
+            if error is not None:
+                self._stats["refresh_errors"] += 1
+        if error is not None:
+            print(f"Erreur rafraîchissement cache {self.name} ({key}): {str(error)}")
+
+    def refresh_in_background(self, key, loader):
+        """Lance un rafraîchissement de la clé, sauf s'il y en a déjà un en cours"""
+        if not self.begin_refresh(key):
+            return False
+
+        def run():
+            try:
+                self.refresh(key, loader)
+            except Exception as e:
+                self.end_refresh(key, e)
+            else:
+                self.end_refresh(key)
+
+        _refresh_executor.submit(run)
+        return True
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+            stats["bytes"] = self._bytes
+        lookups = stats["hits"] + stats["stale"] + stats["misses"]
+        stats["hit_rate"] = round((stats["hits"] + stats["stale"]) / lookups, 3) if lookups else 0.0
+        return stats
+
+
+class GeoCache(TTLCache):
+    def __init__(self, name, ttl, precision=6, **kwargs):
+        super().__init__(name, ttl, **kwargs)
+        self.precision = precision
+
+    def cell(self, lat, lon):
+        return geohash_encode(lat, lon, self.precision)
+
+    def get_or_load_at(self, lat, lon, loader):
+        """Charge via loader(lat, lon) appelé au centre de la cellule"""
+        cell = self.cell(lat, lon)
+        return self.get_or_load(cell, lambda: loader(*geohash_center(cell)))
+
+    def refresh_cell(self, cell, loader):
+        return self.refresh(cell, lambda: loader(*geohash_center(cell)))
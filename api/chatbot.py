@@ -0,0 +1,172 @@
+"""
+Logique de l'assistant AgriBot partagée par les modes de service
+synchrone (Flask) et asynchrone (ASGI).
+"""
+
+import json
+import os
+
+from answer_cache import AnswerCache
+from conversation_store import ConversationStore, extractive_summary
+from knowledge_base import KnowledgeBase
+from snapshot_store import SnapshotStore
+
+try:
+    from config import CONFIG
+except ImportError:
+    CONFIG = {}
+
+OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
+OPENROUTER_MODEL = "anthropic/claude-3-haiku"  # Modèle économique et rapide
+
+SYSTEM_PROMPT = "Tu es AgriBot, un assistant agricole francophone expert en IA, en climat et en agriculture durable. Réponds de manière naturelle, polie et utile."
+
+
+def openrouter_request(messages, api_key, stream=False):
+    """Arguments (url, headers, json) de l'appel OpenRouter"""
+    body = {
+        "model": OPENROUTER_MODEL,
+        "messages": messages
+    }
+    if stream:
+        body["stream"] = True
+    return {
+        "url": OPENROUTER_URL,
+        "headers": {
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json"
+        },
+        "json": body
+    }
+
+
+def extract_reply(response_data):
+    return response_data["choices"][0]["message"]["content"]
+
+
+def parse_stream_line(line):
+    """
+    Ligne d'une réponse OpenRouter en streaming (SSE) -> (terminé, fragment).
+    Les commentaires de maintien de connexion et lignes vides sont ignorés.
+    """
+    if isinstance(line, bytes):
+        line = line.decode("utf-8")
+    if not line.startswith("data:"):
+        return False, None
+    payload = line[5:].strip()
+    if payload == "[DONE]":
+        return True, None
+    try:
+        chunk = json.loads(payload)
+    except ValueError:
+        return False, None
+    if chunk.get("error"):
+        raise ValueError(chunk["error"].get("message", "Erreur OpenRouter"))
+    choices = chunk.get("choices") or []
+    if not choices:
+        return False, None
+    return False, choices[0].get("delta", {}).get("content") or None
+
+
+def stream_deltas(lines):
+    """Fragments de texte d'une réponse OpenRouter en streaming"""
+    for line in lines:
+        done, delta = parse_stream_line(line)
+        if delta:
+            yield delta
+        if done:
+            return
+
+
+def sse_event(data, event=None):
+    """Événement Server-Sent Events (données JSON)"""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+DEFAULT_REPLY = "Je ne suis pas sûr de comprendre votre question. Pourriez-vous me demander quelque chose sur l'irrigation, les engrais, la rotation des cultures ou l'agriculture biologique ?"
+
+KNOWLEDGE_SETTINGS = CONFIG.get("KNOWLEDGE_BASE", {})
+
+
+def _data_path(path):
+    """Chemin relatif au dossier api/"""
+    if os.path.isabs(path):
+        return path
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), path)
+
+
+def _load_knowledge_base():
+    try:
+        return KnowledgeBase.from_file(
+            _data_path(KNOWLEDGE_SETTINGS.get("corpus", "knowledge_base.json")),
+            _data_path(KNOWLEDGE_SETTINGS.get("index", "var/knowledge_index.npz")),
+        )
+    except (OSError, ValueError) as e:
+        print(f"Base de connaissances indisponible: {str(e)}")
+        return KnowledgeBase([])
+
+
+# Index construit (ou relu depuis le disque) une seule fois, au démarrage
+knowledge = _load_knowledge_base()
+
+CONVERSATION_SETTINGS = CONFIG.get("CONVERSATIONS", {})
+
+
+def _open_conversation_store():
+    store = None
+    if CONVERSATION_SETTINGS.get("persist", False):
+        store = SnapshotStore(_data_path(CONVERSATION_SETTINGS.get("path", "var/conversations.db")))
+        store.start_compaction(CONVERSATION_SETTINGS.get("compaction_interval", 3600))
+    return ConversationStore(
+        SYSTEM_PROMPT,
+        token_budget=CONVERSATION_SETTINGS.get("token_budget", 1500),
+        summary_tokens=CONVERSATION_SETTINGS.get("summary_tokens", 200),
+        ttl=CONVERSATION_SETTINGS.get("ttl", 86400),
+        max_entries=CONVERSATION_SETTINGS.get("max_entries", 10000),
+        max_bytes=CONVERSATION_SETTINGS.get("max_bytes"),
+        store=store,
+        summarizer=extractive_summary if CONVERSATION_SETTINGS.get("summarize", True) else None,
+    )
+
+
+# Conversations côté serveur ; la session ne garde que leur identifiant
+conversations = _open_conversation_store()
+
+ANSWER_CACHE_SETTINGS = CONFIG.get("ANSWER_CACHE", {})
+
+
+def _open_answer_cache():
+    if not ANSWER_CACHE_SETTINGS.get("enabled", True):
+        return None
+    return AnswerCache(
+        ttl=ANSWER_CACHE_SETTINGS.get("ttl", 604800),
+        max_entries=ANSWER_CACHE_SETTINGS.get("max_entries", 5000),
+        max_bytes=ANSWER_CACHE_SETTINGS.get("max_bytes"),
+        near_duplicates=ANSWER_CACHE_SETTINGS.get("near_duplicates", True),
+        similarity_threshold=ANSWER_CACHE_SETTINGS.get("similarity_threshold", 0.85),
+        ngram_size=ANSWER_CACHE_SETTINGS.get("ngram_size", 3),
+        cost_per_million_tokens=ANSWER_CACHE_SETTINGS.get("cost_per_million_tokens"),
+    )
+
+
+# Réponses d'OpenRouter aux premières questions, partagées entre conversations
+answers = _open_answer_cache()
+
+
+def cached_answer(messages, user_input):
+    """Réponse en cache si la question ouvre la conversation (prompt = système + question)"""
+    if answers is None or len(messages) != 2:
+        return None
+    return answers.get(user_input, messages)
+
+
+def remember_answer(messages, user_input, answer):
+    if answers is not None and len(messages) == 2:
+        answers.put(user_input, answer)
+
+
+def handle_local_chat(user_input):
+    # Réponse locale : meilleure entrée de la base de connaissances (BM25)
+    answer = knowledge.answer(user_input, min_score=KNOWLEDGE_SETTINGS.get("min_score", 1.0))
+    return answer or DEFAULT_REPLY
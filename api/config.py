@@ -37,5 +37,221 @@ CONFIG = {
     
     # Email configuration
     "EMAIL_USER": "",
-    "EMAIL_PASS": ""
+    "EMAIL_PASS": "",
+    
+    # Upstream HTTP client: connection pools per provider
+    "HTTP_POOL_CONNECTIONS": 10,
+    "HTTP_POOL_MAXSIZE": 20,
+    "HTTP_MAX_RETRIES": 0,
+    
+    # Upstream timeouts per provider: [connect, read] in seconds
+    "HTTP_TIMEOUTS": {
+        "openweather": [3.05, 10],
+        "agromonitoring": [3.05, 15],
+        "openrouter": [3.05, 60]
+    },
+    
+    # Async (ASGI) serving mode: max concurrent connections per provider
+    "ASYNC_HTTP_MAX_CONNECTIONS": 100,
+    
+    # Concurrent upstream fan-out (handlers combining several sources)
+    "FANOUT_MAX_WORKERS": 16,
+    "FANOUT_TIMEOUT": 8,
+    
+    # Batch endpoints (/api/weather/batch, /api/airquality/batch)
+    "BATCH_MAX_ITEMS": 100,
+    "BATCH_MAX_CONCURRENCY": 8,
+    
+    # Upstream call budgets (token buckets per provider)
+    # background_reserve: share of the bucket kept for interactive requests
+    # max_wait: how long an interactive call may wait for a token (seconds)
+    "QUOTAS": {
+        "openweather": {"per_minute": 60, "background_reserve": 0.3, "max_wait": 0.5},
+        "agromonitoring": {"per_minute": 60, "background_reserve": 0.3, "max_wait": 0.5}
+    },
+    
+    # Background prefetch of farm weather, air quality and climate
+    # lead: refresh entries this many seconds before they expire (+ random jitter)
+    # max_views: most recently viewed cells remembered to order refreshes (LRU)
+    "PREFETCH": {
+        "enabled": True,
+        "interval": 60,
+        "lead": 120,
+        "jitter": 60,
+        "max_per_cycle": 50,
+        "max_views": 10000
+    },
+    
+    # In-memory caches of upstream data, keyed by geohash cell
+    # (precision 6 = cells of about 1.2 km x 0.6 km)
+    # ttl: fresh lifetime, stale_ttl: extra time served stale while refreshing
+    "CACHE": {
+        "weather": {"ttl": 600, "stale_ttl": 1200, "precision": 6, "max_entries": 5000, "max_bytes": 8000000},
+        "airquality": {"ttl": 1800, "stale_ttl": 1800, "precision": 6, "max_entries": 5000, "max_bytes": 8000000},
+        "climate": {"ttl": 3600, "stale_ttl": 3600, "precision": 6, "max_entries": 5000, "max_bytes": 8000000},
+        "soil": {"ttl": 1800, "stale_ttl": 1800, "precision": 6, "max_entries": 5000, "max_bytes": 8000000},
+        "forecast": {"ttl": 1800, "stale_ttl": 1800, "precision": 6, "max_entries": 2000, "max_bytes": 32000000},
+        "field_climate": {"ttl": 3600, "stale_ttl": 3600, "max_entries": 5000, "max_bytes": 8000000},
+        "field_geometry": {"ttl": 86400, "max_entries": 2000, "max_bytes": 8000000},
+        "ndvi": {"ttl": 604800, "max_entries": 10000, "max_bytes": 32000000},
+        "soil_grid": {"ttl": 1800, "stale_ttl": 1800, "max_entries": 500, "max_bytes": 64000000},
+        "yield": {"ttl": 86400, "max_entries": 20000, "max_bytes": 16000000}
+    },
+    
+    # Persistent second cache tier (SQLite, WAL mode) that survives restarts
+    # retention: how long snapshots stay on disk (served when the quota is exhausted)
+    "SNAPSHOT_STORE": {
+        "enabled": True,
+        "path": "var/snapshots.db",
+        "retention": 86400,
+        "compaction_interval": 600
+    },
+    
+    # Field polygons (/api/climate)
+    # hash_precision: decimals kept when canonicalizing a polygon before hashing
+    # simplify_tolerance: Douglas-Peucker tolerance (meters) for very detailed rings
+    # max_vertices: vertices accepted per polygon, before simplification
+    "GEOMETRY": {
+        "hash_precision": 6,
+        "simplify_tolerance": 0.5,
+        "max_vertices": 20000
+    },
+    
+    # NDVI from local red/NIR raster scenes (one sub-directory with a scene.json per scene)
+    # chunk_rows: raster rows read and masked at a time
+    "NDVI": {
+        "directory": "var/ndvi",
+        "catalog_refresh": 60,
+        "chunk_rows": 256,
+        "histogram_bins": 20,
+        "max_scenes": 50
+    },
+    
+    # Gridded soil map of a field (/api/soil-analysis/grid), cell sizes in meters
+    # max_mask_work: grid rows x polygon edges allowed for the inside/outside mask
+    "SOIL_GRID": {
+        "default_cell_size": 20,
+        "min_cell_size": 2,
+        "max_cells": 100000,
+        "max_mask_work": 50000000
+    },
+    
+    # Irrigation planning (/api/optimize-irrigation), FAO-56 water balance
+    # default_et0: reference ET0 (mm/day) used when a field has no location or forecast
+    # initial_depletion: root-zone depletion at the start, as a fraction of TAW
+    "IRRIGATION": {
+        "horizon_days": 5,
+        "default_et0": 5.0,
+        "irrigation_efficiency": 0.75,
+        "initial_depletion": 0.3,
+        "max_simulations": 1000
+    },
+    
+    # Crop yield model (/api/crop-prediction), coefficients loaded once on first use
+    # history_days: weather history window averaged into the model features
+    # feature_decimals: rounding of features before hashing (cache key) and prediction
+    "YIELD_MODEL": {
+        "coefficients": "yield_coefficients.json",
+        "history_days": 30,
+        "feature_decimals": 2,
+        "max_fields": 500
+    },
+    
+    # Local AgriBot knowledge base (offline answers, BM25 ranking)
+    # index: prebuilt inverted index, rebuilt when the corpus changes
+    # min_score: below this BM25 score the default reply is returned
+    "KNOWLEDGE_BASE": {
+        "corpus": "knowledge_base.json",
+        "index": "var/knowledge_index.npz",
+        "min_score": 1.0
+    },
+    
+    # AgriBot conversations, kept server-side (the session only holds their id)
+    # token_budget: max estimated tokens per prompt (system, summary, recent turns, question)
+    # summarize: fold turns leaving the budget into a rolling summary of summary_tokens
+    # ttl: conversations expire after this many idle seconds; persist adds a SQLite tier
+    "CONVERSATIONS": {
+        "token_budget": 1500,
+        "summary_tokens": 200,
+        "summarize": True,
+        "ttl": 86400,
+        "max_entries": 10000,
+        "max_bytes": 32000000,
+        "persist": True,
+        "path": "var/conversations.db"
+    },
+    
+    # Shared cache of OpenRouter answers to first-turn (context-free) AgriBot questions
+    # Keyed by the normalized question; near_duplicates also reuses answers whose
+    # character-trigram similarity (Dice) is at least similarity_threshold
+    # cost_per_million_tokens: model prices (USD) used to estimate the upstream cost saved
+    "ANSWER_CACHE": {
+        "enabled": True,
+        "ttl": 604800,
+        "max_entries": 5000,
+        "max_bytes": 16000000,
+        "near_duplicates": True,
+        "similarity_threshold": 0.85,
+        "ngram_size": 3,
+        "cost_per_million_tokens": {"input": 0.25, "output": 1.25}
+    },
+    
+    # User accounts (SQLite), looked up by id or email through a small connection pool
+    # cache_ttl: lifetime of the in-process read-through cache of active users (seconds)
+    "USER_STORE": {
+        "path": "var/users.db",
+        "pool_size": 4,
+        "cache_ttl": 300,
+        "cache_max_entries": 10000
+    },
+    
+    # Authentication fast path: LRU of verified tokens and logout revocation list
+    # revocation_capacity / revocation_error_rate size the Bloom filter in front of the exact set
+    # purge_interval: seconds between purges of expired revocations
+    "AUTH": {
+        "verified_cache_size": 10000,
+        "revocation_capacity": 100000,
+        "revocation_error_rate": 0.001,
+        "purge_interval": 600
+    },
+    
+    # Farm registry (SQLite) with an in-memory uniform grid index per owner
+    # cell_size: grid cell in degrees; default_limit / max_limit: page size of /api/farms queries
+    # max_span: largest farm bbox side accepted (degrees); farms covering more than
+    # max_indexed_cells grid cells are kept out of the grid and checked linearly
+    "FARM_REGISTRY": {
+        "path": "var/farms.db",
+        "cell_size": 0.05,
+        "max_span": 1.0,
+        "max_indexed_cells": 256,
+        "pool_size": 2,
+        "default_limit": 100,
+        "max_limit": 1000
+    },
+    
+    # Password hashing (scrypt or pbkdf2) in a process pool, off the request threads
+    # max_concurrent: hash jobs running or queued at once; queue_timeout: seconds before 503
+    # Legacy SHA-256 hashes and hashes with older parameters are rehashed on successful login
+    # start_method: multiprocessing start method of the pool ("forkserver", or "spawn" where unavailable)
+    "PASSWORDS": {
+        "algorithm": "scrypt",
+        "scrypt_n": 16384,
+        "scrypt_r": 8,
+        "scrypt_p": 1,
+        "pbkdf2_iterations": 600000,
+        "workers": 2,
+        "max_concurrent": 4,
+        "queue_timeout": 5,
+        "start_method": "forkserver"
+    },
+    
+    # Weather history recorded from every fetched observation (/api/weather/history)
+    # retention: seconds kept per level (raw observations, hourly/daily/weekly rollups)
+    # max_series: cells tracked at most, least recently recorded dropped first
+    "WEATHER_HISTORY": {
+        "precision": 6,
+        "retention": {"raw": 172800, "hourly": 2592000, "daily": 63072000, "weekly": 157680000},
+        "compaction_interval": 3600,
+        "max_series": 10000
+    }
 } 
\ No newline at end of file
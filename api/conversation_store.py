@@ -0,0 +1,129 @@
+"""
+Conversations d'AgriBot conservées côté serveur.
+
+La session (cookie) ne contient plus qu'un identifiant court ; les messages
+sont dans un cache en mémoire (LRU, expiration après inactivité) doublé
+d'un niveau SQLite optionnel qui survit aux redémarrages.
+
+L'historique est borné par un budget de tokens plutôt que par un nombre de
+messages : le prompt envoyé au modèle (message système, résumé, échanges
+récents et nouvelle question) tient toujours dans le budget, avant l'appel
+amont. Les échanges les plus anciens sortent de la fenêtre par tours
+entiers et sont condensés dans un résumé glissant, lui aussi borné.
+"""
+
+import secrets
+import threading
+
+from cache import TTLCache
+
+# Estimation sans tokenizer : environ 4 caractères par token, plus un
+# surcoût fixe par message (rôle, séparateurs)
+CHARS_PER_TOKEN = 4
+MESSAGE_OVERHEAD = 4
+
+SUMMARY_PREFIX = "Sujets abordés plus tôt dans la conversation : "
+
+
+def estimate_tokens(message):
+    return MESSAGE_OVERHEAD + -(-len(message.get("content", "")) // CHARS_PER_TOKEN)
+
+
+def extractive_summary(previous, messages, max_tokens):
+    """
+    Résumé glissant local (sans appel au modèle) : questions de l'utilisateur
+    sorties de la fenêtre, les plus récentes conservées quand le budget est atteint.
+    """
+    topics = ([previous] if previous else []) + [
+        " ".join(message["content"].split()) for message in messages if message.get("role") == "user"
+    ]
+    summary = " ; ".join(topics)
+    limit = max(0, max_tokens - MESSAGE_OVERHEAD) * CHARS_PER_TOKEN - len(SUMMARY_PREFIX)
+    if len(summary) > limit:
+        summary = summary[len(summary) - limit:]
+        # Couper sur une frontière de sujet
+        boundary = summary.find(" ; ")
+        summary = summary[boundary + 3:] if boundary >= 0 else summary
+    return summary
+
+
+class ConversationStore:
+    def __init__(self, system_prompt, token_budget=1500, summary_tokens=200, ttl=86400,
+                 max_entries=10000, max_bytes=None, store=None, summarizer=extractive_summary):
+        self.system_message = {"role": "system", "content": system_prompt}
+        self.token_budget = token_budget
+        self.summary_tokens = summary_tokens
+        self.summarizer = summarizer
+        # ttl glissant : chaque échange réenregistre la conversation
+        self._cache = TTLCache(
+            "conversations", ttl=ttl, max_entries=max_entries, max_bytes=max_bytes,
+            store=store, retention=ttl,
+        )
+        self._cache.warm()
+        self._lock = threading.Lock()
+        self._stats = {"turns": 0, "summarized": 0, "truncated_prompts": 0}
+
+    def create(self):
+        return secrets.token_urlsafe(12)
+
+    def get(self, conversation_id):
+        value, state = self._cache.lookup(conversation_id) if conversation_id else (None, "miss")
+        if state != "fresh":
+            return {"messages": [], "summary": ""}
+        return value
+
+    def _window_start(self, messages, budget):
+        """Indice du premier message gardé : les plus récents qui tiennent dans le budget, par tours entiers"""
+        used = 0
+        start = len(messages)
+        while start > 0 and used + estimate_tokens(messages[start - 1]) <= budget:
+            start -= 1
+            used += estimate_tokens(messages[start])
+        # Toujours garder le dernier message, même s'il dépasse le budget seul
+        start = min(start, len(messages) - 1) if messages else 0
+        # La fenêtre commence par une question de l'utilisateur
+        while 0 < start < len(messages) - 1 and messages[start].get("role") != "user":
+            start += 1
+        return start
+
+    def _history_budget(self, summary):
+        reserved = estimate_tokens(self.system_message)
+        if summary or self.summarizer is not None:
+            reserved += self.summary_tokens
+        return max(0, self.token_budget - reserved)
+
+    def prompt(self, conversation_id, user_message):
+        """Messages envoyés au modèle pour la question user_message, dans le budget de tokens"""
+        conversation = self.get(conversation_id)
+        messages = conversation["messages"] + [{"role": "user", "content": user_message}]
+        start = self._window_start(messages, self._history_budget(conversation["summary"]))
+        if start:
+            with self._lock:
+                self._stats["truncated_prompts"] += 1
+
+        prompt = [self.system_message]
+        if conversation["summary"]:
+            prompt.append({"role": "system", "content": SUMMARY_PREFIX + conversation["summary"]})
+        return prompt + messages[start:]
+
+    def append(self, conversation_id, *messages):
+        """Ajoute un échange ; les tours sortis du budget rejoignent le résumé"""
+        with self._lock:
+            conversation = self.get(conversation_id)
+            history = conversation["messages"] + list(messages)
+            summary = conversation["summary"]
+            start = self._window_start(history, self._history_budget(summary))
+            if start and self.summarizer is not None:
+                summary = self.summarizer(summary, history[:start], self.summary_tokens)
+                self._stats["summarized"] += 1
+            self._cache.put(conversation_id, {"messages": history[start:], "summary": summary})
+            self._stats["turns"] += 1
+
+    def delete(self, conversation_id):
+        self._cache.invalidate(conversation_id)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats.update(self._cache.get_stats())
+        return stats
@@ -0,0 +1,364 @@
+"""
+Registre des fermes (SQLite en mode WAL) avec index spatial en mémoire.
+
+Chaque ferme porte son polygone ([[lon, lat], ...] ou GeoJSON, voir
+geometry), son centroïde, sa surface, son emprise et ses cultures. L'index
+est une grille uniforme : chaque ferme est rangée dans les mailles que
+couvre son emprise, par propriétaire. Une requête par emprise, par rayon
+ou par point ne lit que les mailles concernées, puis affine les candidats :
+intersection des emprises, distance au centroïde, point dans le polygone.
+Une emprise couvrant une grande part des fermes du propriétaire est servie
+par un parcours par id arrêté dès la page pleine. L'emprise d'une ferme est
+bornée (max_span) ; une ferme couvrant plus de max_indexed_cells mailles
+(base antérieure, maille réduite) est rangée à part et testée linéairement.
+
+Les résultats sont paginés par curseur (clé de tri du dernier élément
+renvoyé) : une page ne dépend pas des fermes ajoutées avant le curseur.
+"""
+
+import base64
+import bisect
+import json
+import math
+import secrets
+import sqlite3
+import threading
+from datetime import datetime
+
+import numpy as np
+
+import geometry
+from user_store import ConnectionPool
+
+
+class FarmExists(Exception):
+    pass
+
+
+_COLUMNS = ("id", "owner_id", "name", "area", "crops", "polygon", "lat", "lon",
+            "min_lon", "min_lat", "max_lon", "max_lat", "created_at", "field_hash")
+
+
+def encode_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode().rstrip("=")
+
+
+# Clés de tri des curseurs : [id] pour search, [distance, id] pour near
+ID_KEY = (str,)
+DISTANCE_KEY = ((int, float), str)
+
+
+def decode_cursor(cursor, types):
+    """Clé de tri d'un curseur, de la forme attendue par la requête (types), sinon ValueError"""
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except ValueError:
+        key = None
+    if (not isinstance(key, list) or len(key) != len(types)
+            or not all(isinstance(value, kind) and not isinstance(value, bool) for value, kind in zip(key, types))):
+        raise ValueError("Curseur invalide")
+    return key
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin((phi2 - phi1) / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2)
+    return 2 * geometry.EARTH_RADIUS / 1000 * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _intersects(box, min_lon, min_lat, max_lon, max_lat):
+    return box[0] <= max_lon and box[2] >= min_lon and box[1] <= max_lat and box[3] >= min_lat
+
+
+class FarmRegistry:
+    def __init__(self, path, cell_size=0.05, pool_size=2, max_vertices=20000, simplify_tolerance=0.5,
+                 hash_precision=6, max_span=1.0, max_indexed_cells=256):
+        self.cell_size = cell_size
+        self.max_span = max_span
+        self.max_indexed_cells = max_indexed_cells
+        self.hash_precision = hash_precision
+        self.max_vertices = max_vertices
+        self.simplify_tolerance = simplify_tolerance
+        self.pool = ConnectionPool(path, size=pool_size)
+        with self.pool.connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS farms ("
+                " id TEXT PRIMARY KEY,"
+                " owner_id TEXT NOT NULL,"
+                " name TEXT NOT NULL,"
+                " area REAL,"
+                " crops TEXT NOT NULL DEFAULT '[]',"
+                " polygon TEXT,"
+                " lat REAL NOT NULL, lon REAL NOT NULL,"
+                " min_lon REAL NOT NULL, min_lat REAL NOT NULL, max_lon REAL NOT NULL, max_lat REAL NOT NULL,"
+                " created_at TEXT NOT NULL,"
+                " field_hash TEXT"
+                ") WITHOUT ROWID"
+            )
+            # Empreinte canonique du polygone (clé des caches par parcelle), absente des premières bases
+            if "field_hash" not in [column[1] for column in conn.execute("PRAGMA table_info(farms)")]:
+                conn.execute("ALTER TABLE farms ADD COLUMN field_hash TEXT")
+            rows = conn.execute(f"SELECT {', '.join(_COLUMNS)} FROM farms").fetchall()
+        self._farms = {}   # id -> ferme (le polygone reste en JSON : mémoire réduite)
+        self._owners = {}  # propriétaire -> ids triés (pagination sans tri)
+        self._cells = {}   # (propriétaire, colonne, ligne) -> ids
+        self._occupied = {}  # propriétaire -> mailles occupées (densité moyenne)
+        self._large = {}  # propriétaire -> ids des fermes trop étendues pour la grille
+        self._lock = threading.Lock()
+        self._stats = {"queries": 0, "candidates": 0, "scans": 0}
+        for row in rows:
+            record = dict(zip(_COLUMNS, row))
+            record["crops"] = json.loads(record["crops"])
+            if record["polygon"] and record["field_hash"] is None:
+                self._backfill_hash(record)
+            self._index(record)
+        if rows:
+            print(f"Registre des fermes chargé: {len(rows)} fermes")
+
+    def _shape(self, polygon):
+        """Géométrie validée (et simplifiée) : même forme, donc même empreinte, que providers.get_field"""
+        return geometry.validate(geometry.parse(polygon), self.max_vertices, self.simplify_tolerance)
+
+    def _field_hash(self, shape):
+        return geometry.canonical_hash(shape, self.hash_precision)
+
+    def _backfill_hash(self, record):
+        try:
+            record["field_hash"] = self._field_hash(self._shape(json.loads(record["polygon"])))
+        except ValueError as e:
+            # Polygone accepté sous d'anciennes limites : pas de préchargement par parcelle
+            print(f"Ferme {record['id']}: empreinte non calculée ({str(e)})")
+            return
+        with self.pool.connection() as conn:
+            conn.execute("UPDATE farms SET field_hash = ? WHERE id = ?", (record["field_hash"], record["id"]))
+
+    def _cell_range(self, min_lon, min_lat, max_lon, max_lat):
+        return (math.floor(min_lon / self.cell_size), math.floor(min_lat / self.cell_size),
+                math.floor(max_lon / self.cell_size), math.floor(max_lat / self.cell_size))
+
+    def _index(self, record):
+        self._farms[record["id"]] = record
+        bisect.insort(self._owners.setdefault(record["owner_id"], []), record["id"])
+        x0, y0, x1, y1 = self._cell_range(record["min_lon"], record["min_lat"], record["max_lon"], record["max_lat"])
+        if (x1 - x0 + 1) * (y1 - y0 + 1) > self.max_indexed_cells:
+            self._large.setdefault(record["owner_id"], set()).add(record["id"])
+            return
+        for x in range(x0, x1 + 1):
+            for y in range(y0, y1 + 1):
+                key = (record["owner_id"], x, y)
+                if key not in self._cells:
+                    self._cells[key] = set()
+                    self._occupied[record["owner_id"]] = self._occupied.get(record["owner_id"], 0) + 1
+                self._cells[key].add(record["id"])
+
+    def _cells_covered(self, min_lon, min_lat, max_lon, max_lat):
+        x0, y0, x1, y1 = self._cell_range(min_lon, min_lat, max_lon, max_lat)
+        return (x1 - x0 + 1) * (y1 - y0 + 1)
+
+    def _prefer_scan(self, owner_id, box, limit):
+        """
+        True si parcourir les fermes par id (arrêt à la page pleine) coûte moins que lire
+        les mailles de la zone : zones couvrant une grande part des fermes du propriétaire
+        """
+        owned = len(self._owners.get(owner_id, ()))
+        occupied = self._occupied.get(owner_id, 0)
+        if not owned:
+            return False
+        cells = self._cells_covered(*box)
+        # Candidats attendus de la grille, à densité moyenne des mailles occupées
+        expected = max(1.0, min(owned, cells * owned / occupied))
+        return limit * owned / expected < expected + cells
+
+    def _candidates(self, owner_id, min_lon, min_lat, max_lon, max_lat):
+        """Fermes du propriétaire dont l'emprise coupe la zone"""
+        with self._lock:
+            owned = self._owners.get(owner_id, ())
+            if self._cells_covered(min_lon, min_lat, max_lon, max_lat) > len(owned):
+                # Zone large : moins de fermes que de mailles à lire
+                ids = owned
+                self._stats["scans"] += 1
+            else:
+                x0, y0, x1, y1 = self._cell_range(min_lon, min_lat, max_lon, max_lat)
+                ids = set()
+                for x in range(x0, x1 + 1):
+                    for y in range(y0, y1 + 1):
+                        ids.update(self._cells.get((owner_id, x, y), ()))
+                ids.update(self._large.get(owner_id, ()))
+            records = [self._farms[farm_id] for farm_id in ids]
+            self._stats["queries"] += 1
+            self._stats["candidates"] += len(records)
+        return [record for record in records if _intersects(
+            (record["min_lon"], record["min_lat"], record["max_lon"], record["max_lat"]),
+            min_lon, min_lat, max_lon, max_lat,
+        )]
+
+    def _scan(self, owner_id, box, after, limit):
+        """
+        Parcours des fermes du propriétaire par id croissant à partir du curseur,
+        arrêté dès la page pleine : zone large ou sans filtre
+        """
+        records = []
+        with self._lock:
+            ordered = self._owners.get(owner_id, [])
+            self._stats["queries"] += 1
+            self._stats["scans"] += 1
+            start = bisect.bisect_right(ordered, after) if after is not None else 0
+            for index in range(start, len(ordered)):
+                record = self._farms[ordered[index]]
+                if box is None or _intersects(
+                    (record["min_lon"], record["min_lat"], record["max_lon"], record["max_lat"]), *box,
+                ):
+                    records.append(record)
+                    if len(records) > limit:
+                        break
+            self._stats["candidates"] += len(records)
+        next_cursor = encode_cursor([records[limit - 1]["id"]]) if len(records) > limit else None
+        return records[:limit], next_cursor
+
+    def _public(self, record):
+        return {
+            "id": record["id"],
+            "name": record["name"],
+            "area": record["area"],  # hectares
+            "location": {"lat": record["lat"], "lon": record["lon"]},
+            "bbox": [record["min_lon"], record["min_lat"], record["max_lon"], record["max_lat"]],
+            "crops": list(record["crops"]),
+            "polygon": json.loads(record["polygon"]) if record["polygon"] else None,
+            "created_at": record["created_at"],
+        }
+
+    def add(self, owner_id, name, crops=None, polygon=None, location=None, area=None, farm_id=None, created_at=None):
+        """Enregistre une ferme : polygone, ou à défaut localisation {lat, lon} ; lève ValueError si invalide"""
+        if polygon is not None:
+            shape = self._shape(polygon)
+            measures = geometry.measure(shape)
+            lon, lat = measures["centroid"]
+            box = measures["bbox"]
+            area = round(measures["area_ha"], 2)
+            field_hash = self._field_hash(shape)
+            if box[2] - box[0] > self.max_span or box[3] - box[1] > self.max_span:
+                raise ValueError(f"Emprise de la ferme trop étendue (maximum {self.max_span}°)")
+        elif isinstance(location, dict) and location.get("lat") is not None and location.get("lon") is not None:
+            lat, lon = float(location["lat"]), float(location["lon"])
+            if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+                raise ValueError("Coordonnées hors limites")
+            box = [lon, lat, lon, lat]
+            field_hash = None
+        else:
+            raise ValueError("Un polygone ou une localisation (lat, lon) est requis")
+
+        record = {
+            "id": farm_id or f"farm_{secrets.token_hex(6)}",
+            "owner_id": owner_id,
+            "name": name,
+            "area": float(area) if area is not None else None,
+            "crops": [str(crop) for crop in crops or []],
+            "polygon": json.dumps(polygon, separators=(",", ":")) if polygon is not None else None,
+            "lat": lat,
+            "lon": lon,
+            "min_lon": box[0], "min_lat": box[1], "max_lon": box[2], "max_lat": box[3],
+            "created_at": created_at or datetime.now().isoformat(),
+            "field_hash": field_hash,
+        }
+        values = dict(record, crops=json.dumps(record["crops"]))
+        try:
+            with self.pool.connection() as conn:
+                conn.execute(
+                    f"INSERT INTO farms ({', '.join(_COLUMNS)}) VALUES ({', '.join('?' * len(_COLUMNS))})",
+                    tuple(values[column] for column in _COLUMNS),
+                )
+        except sqlite3.IntegrityError:
+            raise FarmExists(record["id"])
+        with self._lock:
+            self._index(record)
+        return self._public(record)
+
+    def ensure(self, owner_id, farm):
+        """Enregistre la ferme si son id est inconnu (fermes de démonstration, migration)"""
+        if farm.get("id") in self._farms:
+            return
+        try:
+            self.add(
+                owner_id, farm.get("name") or farm["id"], crops=farm.get("crops"), polygon=farm.get("polygon"),
+                location=farm.get("location"), area=farm.get("area"), farm_id=farm.get("id"),
+                created_at=farm.get("created_at"),
+            )
+        except FarmExists:
+            pass
+
+    def get(self, owner_id, farm_id):
+        record = self._farms.get(farm_id)
+        if record is None or record["owner_id"] != owner_id:
+            return None
+        return self._public(record)
+
+    def _page(self, keyed, limit, cursor, types=ID_KEY):
+        """(enregistrements, curseur suivant) à partir de paires (clé de tri, enregistrement)"""
+        keyed.sort(key=lambda item: item[0])
+        if cursor:
+            after = decode_cursor(cursor, types)
+            keyed = [item for item in keyed if item[0] > after]
+        page = keyed[:limit]
+        next_cursor = encode_cursor(page[-1][0]) if len(keyed) > limit else None
+        return [farm for _, farm in page], next_cursor
+
+    def search(self, owner_id, bbox=None, point=None, limit=100, cursor=None):
+        """
+        Fermes du propriétaire, triées par id : toutes, celles dont l'emprise coupe
+        bbox [min_lon, min_lat, max_lon, max_lat], ou celles dont le polygone contient point (lat, lon)
+        """
+        if point is not None:
+            lat, lon = point
+            records = [record for record in self._candidates(owner_id, lon, lat, lon, lat)
+                       if record["polygon"] and self._contains(record, lat, lon)]
+            records, next_cursor = self._page([([record["id"]], record) for record in records], limit, cursor)
+        elif bbox is not None and not self._prefer_scan(owner_id, bbox, limit):
+            records = self._candidates(owner_id, *bbox)
+            records, next_cursor = self._page([([record["id"]], record) for record in records], limit, cursor)
+        else:
+            after = decode_cursor(cursor, ID_KEY)[0] if cursor else None
+            records, next_cursor = self._scan(owner_id, bbox, after, limit)
+        return [self._public(record) for record in records], next_cursor
+
+    def _contains(self, record, lat, lon):
+        shape = geometry.parse(json.loads(record["polygon"]))
+        return bool(geometry.grid_mask(geometry.ring_edges(shape), np.array([lon]), np.array([lat]))[0, 0])
+
+    def near(self, owner_id, lat, lon, radius_km, limit=100, cursor=None):
+        """Fermes dont le centroïde est à moins de radius_km, de la plus proche à la plus lointaine"""
+        lat_delta = radius_km * 1000 / geometry.METERS_PER_DEGREE
+        lon_delta = lat_delta / max(math.cos(math.radians(lat)), 1e-6)
+        candidates = self._candidates(
+            owner_id, lon - lon_delta, max(-90.0, lat - lat_delta), lon + lon_delta, min(90.0, lat + lat_delta),
+        )
+        keyed = []
+        for record in candidates:
+            distance = round(haversine_km(lat, lon, record["lat"], record["lon"]), 4)
+            if distance <= radius_km:
+                keyed.append(([distance, record["id"]], record))
+        distances = {key[1]: key[0] for key, _ in keyed}
+        records, next_cursor = self._page(keyed, limit, cursor, DISTANCE_KEY)
+        return [dict(self._public(record), distance_km=distances[record["id"]]) for record in records], next_cursor
+
+    def iter_locations(self):
+        """(lat, lon) des centroïdes de toutes les fermes"""
+        with self._lock:
+            locations = [(record["lat"], record["lon"]) for record in self._farms.values()]
+        yield from locations
+
+    def iter_fields(self):
+        """(lat, lon, empreinte canonique) des fermes décrites par un polygone"""
+        with self._lock:
+            fields = [(record["lat"], record["lon"], record["field_hash"])
+                      for record in self._farms.values() if record["field_hash"]]
+        yield from fields
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({
+                "farms": len(self._farms), "owners": len(self._owners), "cells": len(self._cells),
+                "large": sum(len(ids) for ids in self._large.values()),
+            })
+        return stats
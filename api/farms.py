@@ -0,0 +1,72 @@
+"""
+Fermes des utilisateurs, enregistrées dans le registre spatial (farm_registry).
+"""
+
+import os
+
+from auth import users
+from farm_registry import FarmRegistry
+
+try:
+    from config import CONFIG
+except ImportError:
+    CONFIG = {}
+
+_registry_settings = CONFIG.get("FARM_REGISTRY", {})
+_geometry_settings = CONFIG.get("GEOMETRY", {})
+_registry_path = _registry_settings.get("path", "var/farms.db")
+if not os.path.isabs(_registry_path):
+    _registry_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), _registry_path)
+farm_registry = FarmRegistry(
+    _registry_path,
+    cell_size=_registry_settings.get("cell_size", 0.05),
+    pool_size=_registry_settings.get("pool_size", 2),
+    max_vertices=_geometry_settings.get("max_vertices", 20000),
+    simplify_tolerance=_geometry_settings.get("simplify_tolerance", 0.5),
+    hash_precision=_geometry_settings.get("hash_precision", 6),
+    max_span=_registry_settings.get("max_span", 1.0),
+    max_indexed_cells=_registry_settings.get("max_indexed_cells", 256),
+)
+
+# Fermes de démonstration de l'utilisateur de test
+DEMO_FARMS = [
+    {
+        "id": "farm_1",
+        "name": "Green Valley",
+        "polygon": [[-73.459148, 45.120774], [-73.452852, 45.120774], [-73.452852, 45.125226], [-73.459148, 45.125226]],
+        "crops": ["wheat", "corn"],
+        "created_at": "2023-03-15T10:30:00Z"
+    },
+    {
+        "id": "farm_2",
+        "name": "Sunset Fields",
+        "polygon": [[-73.569724, 45.232082], [-73.564276, 45.232082], [-73.564276, 45.235918], [-73.569724, 45.235918]],
+        "crops": ["soybean"],
+        "created_at": "2023-05-02T14:45:00Z"
+    }
+]
+
+for _farm in DEMO_FARMS:
+    farm_registry.ensure("1", _farm)
+
+# Fermes stockées auparavant dans le compte utilisateur : reprises dans le registre
+for _owner_id, _farm in users.iter_farms():
+    if isinstance(_farm, dict) and _farm.get("id"):
+        try:
+            farm_registry.ensure(_owner_id, _farm)
+        except (KeyError, ValueError) as e:
+            print(f"Ferme {_farm['id']} non reprise dans le registre: {str(e)}")
+
+
+def get_user_farm(user, farm_id):
+    return farm_registry.get(user["id"], farm_id)
+
+
+def iter_farm_locations():
+    """(lat, lon) de toutes les fermes du registre"""
+    return farm_registry.iter_locations()
+
+
+def iter_farm_fields():
+    """(lat, lon, empreinte canonique) des fermes décrites par un polygone"""
+    return farm_registry.iter_fields()
@@ -0,0 +1,141 @@
+"""
+Rééchantillonnage des prévisions OpenWeather (5 jours, pas de 3 heures).
+
+La réponse /forecast est convertie une fois en colonnes NumPy, puis
+interpolée à l'heure ou agrégée par jour (heure locale de la ville). Le
+client ne reçoit que l'horizon et les champs qu'il affiche.
+"""
+
+import numpy as np
+
+# Champs continus : interpolés linéairement entre deux pas de 3 heures
+CONTINUOUS_FIELDS = ("temperature", "feels_like", "humidity", "pressure", "wind_speed", "clouds")
+
+# Champs par créneau de 3 heures : pluie cumulée et probabilité, non interpolés
+SLOT_FIELDS = ("precipitation", "pop")
+
+FIELDS = CONTINUOUS_FIELDS + SLOT_FIELDS
+
+RESOLUTIONS = ("3h", "hourly", "daily")
+
+# Horizon par défaut (heures) ; les autres résolutions couvrent toute la prévision
+DEFAULT_HOURS = {"hourly": 48}
+
+
+def to_arrays(forecast_data):
+    """Colonnes (timestamps, {champ: valeurs}) triées dans le temps"""
+    entries = sorted(forecast_data.get("list", []), key=lambda entry: entry.get("dt", 0))
+    timestamps = np.array([entry.get("dt", 0) for entry in entries], dtype=np.int64)
+    columns = {
+        "temperature": [entry.get("main", {}).get("temp") for entry in entries],
+        "feels_like": [entry.get("main", {}).get("feels_like") for entry in entries],
+        "humidity": [entry.get("main", {}).get("humidity") for entry in entries],
+        "pressure": [entry.get("main", {}).get("pressure") for entry in entries],
+        "wind_speed": [entry.get("wind", {}).get("speed") for entry in entries],
+        "clouds": [entry.get("clouds", {}).get("all") for entry in entries],
+        "precipitation": [entry.get("rain", {}).get("3h", 0) for entry in entries],
+        "pop": [entry.get("pop", 0) for entry in entries],
+    }
+    # Valeur manquante -> NaN (None n'est pas convertible en float64)
+    arrays = {
+        field: np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+        for field, values in columns.items()
+    }
+    return timestamps, arrays
+
+
+def _rounded(values, decimals=2):
+    return [None if np.isnan(value) else value for value in np.round(values, decimals).tolist()]
+
+
+def resample_3h(timestamps, arrays, fields, end):
+    keep = timestamps <= end
+    result = {"timestamps": timestamps[keep].tolist()}
+    for field in fields:
+        result[field] = _rounded(arrays[field][keep])
+    return result
+
+
+def resample_hourly(timestamps, arrays, fields, end):
+    # Heures pleines couvertes par la prévision
+    start = -(-int(timestamps[0]) // 3600) * 3600
+    hours = np.arange(start, min(end, int(timestamps[-1])) + 1, 3600, dtype=np.int64)
+    result = {"timestamps": hours.tolist()}
+    if not len(hours):
+        return result
+
+    # Créneau de 3 heures contenant chaque heure (pour les champs non interpolés)
+    slots = np.clip(np.searchsorted(timestamps, hours, side="right") - 1, 0, len(timestamps) - 1)
+    for field in fields:
+        values = arrays[field]
+        if field in CONTINUOUS_FIELDS:
+            valid = ~np.isnan(values)
+            if not valid.any():
+                result[field] = [None] * len(hours)
+                continue
+            result[field] = _rounded(np.interp(hours, timestamps[valid], values[valid]))
+        elif field == "precipitation":
+            # Cumul sur 3 heures réparti uniformément
+            result[field] = _rounded(values[slots] / 3)
+        else:
+            result[field] = _rounded(values[slots])
+    return result
+
+
+def resample_daily(timestamps, arrays, fields, end, timezone_offset=0):
+    keep = timestamps <= end
+    timestamps = timestamps[keep]
+    result = {"timestamps": []}
+    if not len(timestamps):
+        return result
+
+    # Jour local de chaque créneau ; les timestamps étant triés, chaque jour
+    # forme un segment contigu agrégé avec ufunc.reduceat
+    days = (timestamps + timezone_offset) // 86400
+    day_values, starts = np.unique(days, return_index=True)
+    counts = np.diff(np.append(starts, len(days)))
+    result["timestamps"] = (day_values * 86400 - timezone_offset).tolist()
+
+    for field in fields:
+        values = arrays[field][keep]
+        if field == "precipitation":
+            result[field] = {"sum": _rounded(np.add.reduceat(np.nan_to_num(values), starts))}
+        elif field == "pop":
+            result[field] = {"max": _rounded(np.fmax.reduceat(values, starts))}
+        else:
+            valid = ~np.isnan(values)
+            sums = np.add.reduceat(np.where(valid, values, 0), starts)
+            valid_counts = np.add.reduceat(valid.astype(np.int64), starts)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                means = np.where(valid_counts > 0, sums / valid_counts, np.nan)
+            result[field] = {
+                "min": _rounded(np.fmin.reduceat(values, starts)),
+                "max": _rounded(np.fmax.reduceat(values, starts)),
+                "mean": _rounded(means),
+            }
+    # Nombre de créneaux de 3 heures par jour (journées partielles en bord de prévision)
+    result["slots"] = counts.tolist()
+    return result
+
+
+def resample(forecast_data, resolution="hourly", hours=None, fields=None):
+    """Prévision rééchantillonnée sur les `hours` prochaines heures"""
+    timestamps, arrays = to_arrays(forecast_data)
+    fields = [field for field in (fields or FIELDS) if field in FIELDS]
+    city = forecast_data.get("city", {})
+    timezone_offset = int(city.get("timezone", 0) or 0)
+
+    result = {"resolution": resolution, "city": city.get("name"), "timezone": timezone_offset}
+    if not len(timestamps):
+        result["timestamps"] = []
+        return result
+
+    hours = hours or DEFAULT_HOURS.get(resolution)
+    end = int(timestamps[-1]) if hours is None else int(timestamps[0]) + int(hours) * 3600
+    if resolution == "3h":
+        result.update(resample_3h(timestamps, arrays, fields, end))
+    elif resolution == "daily":
+        result.update(resample_daily(timestamps, arrays, fields, end, timezone_offset))
+    else:
+        result.update(resample_hourly(timestamps, arrays, fields, end))
+    return result
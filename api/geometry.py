@@ -0,0 +1,370 @@
+"""
+Géométrie des parcelles (polygones [[lon, lat], ...]) vectorisée avec NumPy.
+
+Formats acceptés : un anneau [[lon, lat], ...], un polygone avec trous
+[anneau extérieur, trou, ...], un multipolygone [[anneau, ...], ...] ou une
+géométrie / Feature GeoJSON (Polygon, MultiPolygon). Les surfaces et
+centroïdes sont calculés dans une projection équirectangulaire locale,
+suffisante à l'échelle d'une parcelle.
+
+La forme canonique (sommet de fermeture retiré, coordonnées arrondies,
+orientation et premier sommet normalisés) donne la même empreinte pour un
+même champ, quel que soit le sens ou le point de départ du tracé.
+"""
+
+import hashlib
+import math
+
+import numpy as np
+
+EARTH_RADIUS = 6371008.8
+METERS_PER_DEGREE = EARTH_RADIUS * math.pi / 180
+
+# Au-delà, l'anneau est simplifié avant la recherche d'auto-intersections
+# (quadratique) ; il est refusé s'il reste trop détaillé
+MAX_SIMPLE_CHECK_VERTICES = 5000
+
+# Segments comparés par bloc lors de la recherche d'auto-intersections
+_INTERSECTION_CHUNK = 256
+
+# Éléments (lignes x arêtes) traités à la fois par grid_mask : environ 8 Mo par temporaire
+MASK_BUDGET = 1 << 20
+
+
+class InvalidGeometry(ValueError):
+    pass
+
+
+def _ring(points):
+    try:
+        ring = np.asarray(points, dtype=np.float64)
+    except (TypeError, ValueError):
+        raise InvalidGeometry("Coordonnées du polygone non numériques")
+    if ring.ndim != 2 or ring.shape[1] < 2:
+        raise InvalidGeometry("Chaque sommet doit être une paire [lon, lat]")
+    # Altitude éventuelle ignorée
+    ring = ring[:, :2]
+    # Sommets consécutifs identiques, puis sommet de fermeture
+    if len(ring) > 1:
+        keep = np.ones(len(ring), dtype=bool)
+        keep[1:] = np.any(ring[1:] != ring[:-1], axis=1)
+        ring = ring[keep]
+    if len(ring) > 1 and np.array_equal(ring[0], ring[-1]):
+        ring = ring[:-1]
+    return ring
+
+
+def _depth(value):
+    depth = 0
+    while isinstance(value, (list, tuple)) and value:
+        value = value[0]
+        depth += 1
+    return depth
+
+
+def parse(polygon):
+    """Liste de polygones, chacun liste d'anneaux (tableaux n x 2, le premier extérieur)"""
+    if isinstance(polygon, dict):
+        if polygon.get("type") == "Feature":
+            polygon = polygon.get("geometry") or {}
+        kind = polygon.get("type")
+        coordinates = polygon.get("coordinates") or []
+        if kind == "Polygon":
+            polygons = [coordinates]
+        elif kind == "MultiPolygon":
+            polygons = coordinates
+        else:
+            raise InvalidGeometry(f"Type de géométrie non supporté: {kind}")
+    else:
+        depth = _depth(polygon)
+        if depth == 2:
+            polygons = [[polygon]]
+        elif depth == 3:
+            polygons = [polygon]
+        elif depth == 4:
+            polygons = polygon
+        else:
+            raise InvalidGeometry("Format de polygone non reconnu")
+
+    shape = [[_ring(ring) for ring in rings] for rings in polygons if rings]
+    if not shape:
+        raise InvalidGeometry("Polygone vide")
+    return shape
+
+
+def _all_vertices(shape):
+    return np.concatenate([ring for rings in shape for ring in rings])
+
+
+def bbox(shape):
+    """[min_lon, min_lat, max_lon, max_lat]"""
+    vertices = _all_vertices(shape)
+    return [*vertices.min(axis=0).tolist(), *vertices.max(axis=0).tolist()]
+
+
+def _origin(shape):
+    min_lon, min_lat, max_lon, max_lat = bbox(shape)
+    return (min_lon + max_lon) / 2, (min_lat + max_lat) / 2
+
+
+def project(ring, origin):
+    """Coordonnées locales en mètres autour de origin (lon, lat)"""
+    lon0, lat0 = origin
+    x = (ring[:, 0] - lon0) * METERS_PER_DEGREE * math.cos(math.radians(lat0))
+    y = (ring[:, 1] - lat0) * METERS_PER_DEGREE
+    return x, y
+
+
+def unproject(x, y, origin):
+    lon0, lat0 = origin
+    lon = x / (METERS_PER_DEGREE * math.cos(math.radians(lat0))) + lon0
+    lat = y / METERS_PER_DEGREE + lat0
+    return lon, lat
+
+
+def _signed_area(x, y):
+    # Formule du lacet (shoelace)
+    return 0.5 * float(np.dot(x, np.roll(y, -1)) - np.dot(np.roll(x, -1), y))
+
+
+def _ring_moments(x, y):
+    """(aire signée, somme pondérée x, somme pondérée y) d'un anneau"""
+    x1, y1 = np.roll(x, -1), np.roll(y, -1)
+    cross = x * y1 - x1 * y
+    return 0.5 * float(cross.sum()), float(((x + x1) * cross).sum()) / 6, float(((y + y1) * cross).sum()) / 6
+
+
+def measure(shape):
+    """Surface, centroïde pondéré par l'aire et emprise d'une géométrie parsée"""
+    origin = _origin(shape)
+    total_area = 0.0
+    moment_x = 0.0
+    moment_y = 0.0
+    for rings in shape:
+        for index, ring in enumerate(rings):
+            area, mx, my = _ring_moments(*project(ring, origin))
+            # Anneau extérieur compté positivement, trous soustraits, quel que soit le sens
+            sign = (1 if area > 0 else -1) * (1 if index == 0 else -1)
+            total_area += sign * area
+            moment_x += sign * mx
+            moment_y += sign * my
+
+    if total_area <= 0:
+        raise InvalidGeometry("Surface du polygone nulle")
+
+    center_lon, center_lat = unproject(moment_x / total_area, moment_y / total_area, origin)
+    return {
+        "area_m2": round(total_area, 1),
+        "area_ha": round(total_area / 10000, 4),
+        "centroid": [round(center_lon, 6), round(center_lat, 6)],
+        "bbox": bbox(shape),
+        "vertices": int(sum(len(ring) for rings in shape for ring in rings)),
+    }
+
+
+def centroid(shape):
+    """(lat, lon) du centroïde pondéré par l'aire"""
+    center_lon, center_lat = measure(shape)["centroid"]
+    return center_lat, center_lon
+
+
+def ring_edges(shape):
+    """Arêtes (x0, y0, x1, y1) de tous les anneaux : la règle pair-impair gère trous et multipolygones"""
+    starts = np.concatenate([ring for rings in shape for ring in rings])
+    ends = np.concatenate([np.roll(ring, -1, axis=0) for rings in shape for ring in rings])
+    return starts[:, 0], starts[:, 1], ends[:, 0], ends[:, 1]
+
+
+def grid_mask(edges, lons, lats, budget=MASK_BUDGET):
+    """
+    Masque (lignes x colonnes) des points de la grille lons x lats à l'intérieur du polygone.
+
+    Les lignes de balayage sont traitées par blocs, chacun contre les seules
+    arêtes dont l'étendue en latitude coupe le bloc ; un bloc ne dépasse pas
+    budget éléments (lignes x arêtes), sauf une ligne seule.
+    """
+    x0, y0, x1, y1 = edges
+    # Arêtes horizontales jamais traversées ; index des arêtes trié par latitude basse
+    keep = y0 != y1
+    x0, y0, x1, y1 = x0[keep], y0[keep], x1[keep], y1[keep]
+    low = np.minimum(y0, y1)
+    order = np.argsort(low, kind="stable")
+    x0, y0, x1, y1, low = x0[order], y0[order], x1[order], y1[order], low[order]
+    high = np.maximum(y0, y1)
+
+    mask = np.zeros((len(lats), len(lons)), dtype=bool)
+    rows = np.argsort(lats, kind="stable")
+    start = 0
+    step = max(1, budget // max(1, len(x0)))
+    while start < len(rows):
+        block = rows[start:start + step]
+        block_low, block_high = lats[block[0]], lats[block[-1]]
+        active = np.flatnonzero(high[:np.searchsorted(low, block_high, side="right")] >= block_low)
+        if len(block) > 1 and len(block) * len(active) > budget:
+            step = max(1, budget // len(active))
+            continue
+
+        ys = lats[block][:, None]
+        ax0, ay0, ax1, ay1 = x0[active], y0[active], x1[active], y1[active]
+        # Arêtes traversées par chaque ligne de balayage et abscisse du croisement
+        crosses = (ay0 <= ys) != (ay1 <= ys)
+        x_cross = np.where(crosses, ax0 + (ys - ay0) * ((ax1 - ax0) / (ay1 - ay0)), np.inf)
+        x_cross.sort(axis=1)
+        for index, row in enumerate(block):
+            # Nombre de croisements à gauche de chaque point : impair = intérieur
+            mask[row] = np.searchsorted(x_cross[index], lons, side="right") % 2 == 1
+
+        start += len(block)
+        # Bloc suivant dimensionné sur le nombre d'arêtes actives de celui-ci
+        step = max(1, budget // max(1, len(active)))
+    return mask
+
+
+def _segments_intersect(ring):
+    """True si deux arêtes non adjacentes de l'anneau se croisent"""
+    n = len(ring)
+    if n < 4:
+        return False
+    start = ring
+    end = np.roll(ring, -1, axis=0)
+    indices = np.arange(n)
+
+    def orientation(a, b, c):
+        return (b[..., 0] - a[..., 0]) * (c[..., 1] - a[..., 1]) - (b[..., 1] - a[..., 1]) * (c[..., 0] - a[..., 0])
+
+    for lo in range(0, n, _INTERSECTION_CHUNK):
+        rows = indices[lo:lo + _INTERSECTION_CHUNK]
+        a, b = start[rows][:, None, :], end[rows][:, None, :]
+        c, d = start[None, :, :], end[None, :, :]
+        crosses = (
+            (orientation(a, b, c) * orientation(a, b, d) < 0)
+            & (orientation(c, d, a) * orientation(c, d, b) < 0)
+        )
+        # Arêtes identiques ou adjacentes (sommet partagé) exclues
+        gap = np.abs(rows[:, None] - indices[None, :])
+        crosses &= (gap > 1) & (gap != n - 1)
+        if crosses.any():
+            return True
+    return False
+
+
+def _douglas_peucker(x, y, tolerance):
+    """Masque des sommets conservés d'une polyligne ouverte"""
+    keep = np.zeros(len(x), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(x) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        dx, dy = x[last] - x[first], y[last] - y[first]
+        px, py = x[first + 1:last] - x[first], y[first + 1:last] - y[first]
+        length = math.hypot(dx, dy)
+        if length == 0:
+            distances = np.hypot(px, py)
+        else:
+            distances = np.abs(dx * py - dy * px) / length
+        index = int(np.argmax(distances))
+        if distances[index] > tolerance:
+            split = first + 1 + index
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+    return keep
+
+
+def simplify_ring(ring, tolerance, origin):
+    """Douglas-Peucker sur un anneau fermé, tolérance en mètres"""
+    if len(ring) <= 4:
+        return ring
+    x, y = project(ring, origin)
+    # L'anneau est coupé au sommet le plus éloigné du premier : deux polylignes ouvertes
+    far = int(np.argmax(np.hypot(x - x[0], y - y[0])))
+    keep = np.zeros(len(ring), dtype=bool)
+    keep[:far + 1] = _douglas_peucker(x[:far + 1], y[:far + 1], tolerance)
+    closed_x = np.append(x[far:], x[0])
+    closed_y = np.append(y[far:], y[0])
+    keep[far:] |= _douglas_peucker(closed_x, closed_y, tolerance)[:-1]
+    if keep.sum() < 3:
+        return ring
+    return ring[keep]
+
+
+def simplify(shape, tolerance):
+    if not tolerance:
+        return shape
+    origin = _origin(shape)
+    return [[simplify_ring(ring, tolerance, origin) for ring in rings] for rings in shape]
+
+
+def validate(shape, max_vertices=20000, tolerance=0.5):
+    """
+    Vérifie la géométrie et la retourne, les anneaux très détaillés simplifiés
+    (tolérance en mètres) : mesures, empreinte et masques portent sur cette
+    forme. Un anneau encore trop détaillé après simplification est refusé.
+    """
+    vertices = sum(len(ring) for rings in shape for ring in rings)
+    if vertices > max_vertices:
+        raise InvalidGeometry(f"Polygone trop détaillé ({vertices} sommets, maximum {max_vertices})")
+
+    origin = None
+    checked = []
+    for rings in shape:
+        checked.append([])
+        for index, ring in enumerate(rings):
+            name = "L'anneau extérieur" if index == 0 else "Un trou"
+            if len(ring) < 3:
+                raise InvalidGeometry(f"{name} doit compter au moins 3 sommets distincts")
+            if not np.isfinite(ring).all():
+                raise InvalidGeometry("Coordonnées non finies")
+            if (np.abs(ring[:, 0]) > 180).any() or (np.abs(ring[:, 1]) > 90).any():
+                raise InvalidGeometry("Coordonnées hors limites (attendu [lon, lat])")
+
+            if len(ring) > MAX_SIMPLE_CHECK_VERTICES:
+                origin = origin or _origin(shape)
+                ring = simplify_ring(ring, tolerance, origin)
+                if len(ring) > MAX_SIMPLE_CHECK_VERTICES:
+                    raise InvalidGeometry(
+                        f"{name} reste trop détaillé après simplification "
+                        f"({len(ring)} sommets, maximum {MAX_SIMPLE_CHECK_VERTICES})"
+                    )
+            if _segments_intersect(ring):
+                raise InvalidGeometry(f"{name} se recoupe")
+            checked[-1].append(ring)
+    return checked
+
+
+def _canonical_ring(ring, exterior, precision):
+    scaled = np.round(ring * 10 ** precision).astype(np.int64)
+    # L'arrondi peut rendre des sommets consécutifs identiques
+    keep = np.ones(len(scaled), dtype=bool)
+    keep[1:] = np.any(scaled[1:] != scaled[:-1], axis=1)
+    scaled = scaled[keep]
+    if len(scaled) > 1 and np.array_equal(scaled[0], scaled[-1]):
+        scaled = scaled[:-1]
+
+    # Extérieur dans le sens trigonométrique, trous dans le sens horaire
+    relative = (scaled - scaled[0]).astype(np.float64)
+    x, y = relative[:, 0], relative[:, 1]
+    if (_signed_area(x, y) > 0) != exterior:
+        scaled = scaled[::-1]
+
+    # Premier sommet : le plus petit (lon, puis lat)
+    first = int(np.lexsort((scaled[:, 1], scaled[:, 0]))[0])
+    return np.roll(scaled, -first, axis=0)
+
+
+def _ring_bytes(scaled):
+    # Préfixe de longueur : concaténation sans ambiguïté
+    return len(scaled).to_bytes(4, "little") + scaled.tobytes()
+
+
+def canonical_hash(shape, precision=6):
+    """Empreinte stable de la géométrie (même champ -> même clé de cache)"""
+    polygons = []
+    for rings in shape:
+        exterior = _ring_bytes(_canonical_ring(rings[0], True, precision))
+        holes = sorted(_ring_bytes(_canonical_ring(ring, False, precision)) for ring in rings[1:])
+        polygons.append(len(rings).to_bytes(4, "little") + exterior + b"".join(holes))
+    digest = hashlib.sha256(str(precision).encode() + b"".join(sorted(polygons)))
+    return digest.hexdigest()[:32]
@@ -0,0 +1,197 @@
+"""
+Moteur d'irrigation : évapotranspiration FAO-56 et bilan hydrique journalier.
+
+- ET0 de référence par Penman-Monteith (FAO-56, éq. 6) à partir des
+  agrégats journaliers de la prévision (températures min/max, humidité,
+  vent, nébulosité pour le rayonnement). La pression utilisée est celle de
+  la prévision (niveau de la mer) : approximation acceptable en plaine.
+- Coefficient cultural Kc par stade (courbe FAO-56 en 4 phases).
+- Bilan de la zone racinaire (FAO-56, ch. 8) : épuisement Dr, stress Ks,
+  déclenchement de l'irrigation quand Dr dépasse la réserve facilement
+  utilisable (RAW), remise à la capacité au champ.
+
+Tous les calculs portent sur des tableaux (simulations x jours) : une
+requête peut simuler des centaines de parcelles et de scénarios à la fois ;
+seule la boucle sur les jours (5 au plus) est séquentielle.
+"""
+
+import numpy as np
+
+# Kc (initial, mi-saison, fin), durée des stades en jours (initial,
+# développement, mi-saison, arrière-saison), profondeur racinaire (m) et
+# fraction d'épuisement p (FAO-56, tableaux 11, 12 et 22)
+CROPS = {
+    "wheat": {"kc": (0.7, 1.15, 0.25), "stages": (20, 25, 60, 30), "root_depth": 1.25, "p": 0.55},
+    "corn": {"kc": (0.3, 1.2, 0.35), "stages": (20, 35, 40, 30), "root_depth": 1.35, "p": 0.55},
+    "soybean": {"kc": (0.4, 1.15, 0.5), "stages": (15, 15, 40, 15), "root_depth": 0.85, "p": 0.5},
+    "tomato": {"kc": (0.6, 1.15, 0.8), "stages": (30, 40, 40, 25), "root_depth": 1.0, "p": 0.4},
+    "potato": {"kc": (0.5, 1.15, 0.75), "stages": (25, 30, 45, 30), "root_depth": 0.5, "p": 0.35},
+}
+DEFAULT_CROP = {"kc": (0.5, 1.0, 0.6), "stages": (25, 30, 40, 25), "root_depth": 1.0, "p": 0.5}
+
+# Humidité volumique à la capacité au champ et au point de flétrissement (FAO-56, tableau 19)
+SOILS = {
+    "sand": (0.12, 0.045),
+    "loam": (0.25, 0.12),
+    "clay": (0.36, 0.22),
+}
+
+GROWTH_STAGES = ("initial", "development", "mid", "late")
+
+# Constante de Stefan-Boltzmann (MJ K-4 m-2 jour-1) et constante solaire (MJ m-2 min-1)
+SIGMA = 4.903e-9
+GSC = 0.0820
+
+# Part de la pluie réellement stockée dans la zone racinaire
+EFFECTIVE_RAIN = 0.8
+
+
+def crop_parameters(crop_type):
+    return CROPS.get(crop_type, DEFAULT_CROP)
+
+
+def days_after_planting(crop_type, growth_stage=None, days=None):
+    """Jour de culture : donné directement, sinon milieu du stade indiqué (mi-saison par défaut)"""
+    if days is not None:
+        return max(0, int(days))
+    stages = crop_parameters(crop_type)["stages"]
+    index = GROWTH_STAGES.index(growth_stage) if growth_stage in GROWTH_STAGES else 2
+    return int(sum(stages[:index]) + stages[index] / 2)
+
+
+def stage_name(crop_type, day):
+    bounds = np.cumsum(crop_parameters(crop_type)["stages"])
+    index = int(np.searchsorted(bounds, day, side="right"))
+    return GROWTH_STAGES[min(index, len(GROWTH_STAGES) - 1)]
+
+
+def crop_coefficient(day, kc, stages):
+    """
+    Kc par jour de culture (FAO-56, fig. 25), vectorisé.
+    day : (simulations, jours) ; kc, stages : (simulations, 3) et (simulations, 4)
+    """
+    kc_ini, kc_mid, kc_end = (kc[:, i:i + 1] for i in range(3))
+    end_ini = stages[:, 0:1]
+    end_dev = end_ini + stages[:, 1:2]
+    end_mid = end_dev + stages[:, 2:3]
+    end_late = end_mid + stages[:, 3:4]
+
+    development = kc_ini + (day - end_ini) / np.maximum(end_dev - end_ini, 1) * (kc_mid - kc_ini)
+    late = kc_mid + (day - end_mid) / np.maximum(end_late - end_mid, 1) * (kc_end - kc_mid)
+    return np.select(
+        [day < end_ini, day < end_dev, day < end_mid, day < end_late],
+        [kc_ini + 0 * day, development, kc_mid + 0 * day, late],
+        default=kc_end + 0 * day,
+    )
+
+
+def saturation_vapour_pressure(temp):
+    return 0.6108 * np.exp(17.27 * temp / (temp + 237.3))
+
+
+def extraterrestrial_radiation(lat, day_of_year):
+    """Ra (MJ m-2 jour-1), FAO-56 éq. 21 ; lat en degrés"""
+    phi = np.radians(lat)
+    dr = 1 + 0.033 * np.cos(2 * np.pi / 365 * day_of_year)
+    delta = 0.409 * np.sin(2 * np.pi / 365 * day_of_year - 1.39)
+    ws = np.arccos(np.clip(-np.tan(phi) * np.tan(delta), -1, 1))
+    return 24 * 60 / np.pi * GSC * dr * (
+        ws * np.sin(phi) * np.sin(delta) + np.cos(phi) * np.cos(delta) * np.sin(ws)
+    )
+
+
+def penman_monteith(t_min, t_max, humidity, wind_10m, clouds, pressure_hpa, lat, day_of_year):
+    """ET0 (mm/jour), FAO-56 éq. 6 ; toutes les entrées sont des tableaux de même forme"""
+    t_mean = (t_min + t_max) / 2
+    # Vent mesuré à 10 m ramené à 2 m (éq. 47)
+    u2 = wind_10m * 4.87 / np.log(67.8 * 10 - 5.42)
+    pressure = pressure_hpa / 10
+    gamma = 0.000665 * pressure
+    delta = 4098 * saturation_vapour_pressure(t_mean) / (t_mean + 237.3) ** 2
+
+    es = (saturation_vapour_pressure(t_max) + saturation_vapour_pressure(t_min)) / 2
+    ea = es * humidity / 100
+
+    # Rayonnement : fraction d'ensoleillement estimée par la nébulosité (éq. 35)
+    ra = extraterrestrial_radiation(lat, day_of_year)
+    rs = (0.25 + 0.5 * (1 - clouds / 100)) * ra
+    rso = 0.75 * ra
+    rns = 0.77 * rs
+    rnl = (
+        SIGMA * ((t_max + 273.16) ** 4 + (t_min + 273.16) ** 4) / 2
+        * (0.34 - 0.14 * np.sqrt(ea))
+        * (1.35 * np.clip(rs / np.maximum(rso, 1e-6), 0.3, 1.0) - 0.35)
+    )
+    rn = rns - rnl
+
+    et0 = (0.408 * delta * rn + gamma * 900 / (t_mean + 273) * u2 * (es - ea)) / (delta + gamma * (1 + 0.34 * u2))
+    return np.maximum(et0, 0)
+
+
+def simulate(et0, rain, kc, taw, p, initial_depletion, efficiency):
+    """
+    Bilan hydrique journalier de la zone racinaire.
+    et0, rain, kc : (simulations, jours) ; taw, p, initial_depletion, efficiency : (simulations,)
+    """
+    simulations, days = et0.shape
+    raw = p * taw
+    depletion = initial_depletion * taw
+    etc = np.zeros((simulations, days))
+    net = np.zeros((simulations, days))
+    end_depletion = np.zeros((simulations, days))
+    percolation = np.zeros(simulations)
+
+    effective_rain = EFFECTIVE_RAIN * rain
+    for day in range(days):
+        # Stress hydrique quand l'épuisement dépasse la réserve facilement utilisable
+        ks = np.where(depletion > raw, (taw - depletion) / np.maximum((1 - p) * taw, 1e-6), 1.0)
+        etc[:, day] = kc[:, day] * np.clip(ks, 0, 1) * et0[:, day]
+        depletion = depletion - effective_rain[:, day] + etc[:, day]
+
+        # Pluie au-delà de la capacité au champ : percolation profonde
+        percolation += np.maximum(-depletion, 0)
+        depletion = np.clip(depletion, 0, taw)
+
+        # Irrigation : retour à la capacité au champ
+        irrigate = depletion > raw
+        net[:, day] = np.where(irrigate, depletion, 0)
+        depletion = np.where(irrigate, 0, depletion)
+        end_depletion[:, day] = depletion
+
+    return {
+        "etc": etc,
+        "net": net,
+        "gross": net / efficiency[:, None],
+        "depletion": end_depletion,
+        "percolation": percolation,
+        "raw": raw,
+    }
+
+
+def run(simulations, weather, efficiency_default=0.75, initial_depletion_default=0.3):
+    """
+    simulations : liste de dict (crop_type, soil_type, field_size, days_after_planting, ...)
+    weather : dict de tableaux (simulations, jours) : et0, rain
+    """
+    crops = [crop_parameters(sim.get("crop_type", "wheat")) for sim in simulations]
+    kc = np.array([crop["kc"] for crop in crops], dtype=np.float64)
+    stages = np.array([crop["stages"] for crop in crops], dtype=np.float64)
+    soil = np.array([SOILS.get(sim.get("soil_type", "loam"), SOILS["loam"]) for sim in simulations])
+    root_depth = np.array([crop["root_depth"] for crop in crops])
+    p = np.array([crop["p"] for crop in crops])
+
+    # Réserve utile de la zone racinaire (mm)
+    taw = 1000 * (soil[:, 0] - soil[:, 1]) * root_depth
+    start_day = np.array([sim["days_after_planting"] for sim in simulations], dtype=np.float64)
+    days = start_day[:, None] + np.arange(weather["et0"].shape[1])[None, :]
+    kc_daily = crop_coefficient(days, kc, stages)
+
+    efficiency = np.array([sim.get("irrigation_efficiency") or efficiency_default for sim in simulations])
+    initial = np.array([
+        sim["initial_depletion"] if sim.get("initial_depletion") is not None else initial_depletion_default
+        for sim in simulations
+    ])
+
+    result = simulate(weather["et0"], weather["rain"], kc_daily, taw, p, np.clip(initial, 0, 1), efficiency)
+    result.update({"kc": kc_daily, "taw": taw, "efficiency": efficiency})
+    return result
@@ -0,0 +1,191 @@
+"""
+Base de connaissances locale d'AgriBot : recherche BM25 sur un corpus de
+réponses agronomiques (knowledge_base.json).
+
+Chaque entrée du corpus porte des questions types, des mots-clés et une
+réponse. Le texte est normalisé (minuscules, accents retirés, élisions et
+mots vides supprimés, pluriels ramenés au singulier) puis indexé dans un
+index inversé au format CSR : pour chaque terme, la liste des entrées qui le
+contiennent et leur poids BM25 précalculé. Une question ne parcourt que les
+listes de ses propres termes ; le coût ne dépend pas de la taille du corpus
+mais du nombre d'entrées partageant un terme avec la question.
+
+L'index est construit au démarrage, ou relu depuis le disque (.npz) si le
+corpus n'a pas changé depuis la dernière construction.
+"""
+
+import hashlib
+import json
+import os
+import re
+import unicodedata
+
+import numpy as np
+
+# Paramètres BM25
+K1 = 1.2
+B = 0.75
+
+# Les questions types et mots-clés pèsent plus que le texte de la réponse
+QUESTION_WEIGHT = 3
+KEYWORD_WEIGHT = 3
+
+# « mais » n'y figure pas : sans accents, il se confond avec maïs
+STOPWORDS = frozenset("""
+a ai au aux avec c ce ces cet cette comme comment dans de des du elle en est et etre eux il ils je
+la le les leur leurs lui ma me mes moi mon ne nos notre nous on ou par pas pour qu que quel
+quelle quelles quels qui sa se ses son sont sur ta te tes toi ton tu un une vos votre vous y faut
+faire peut peux dois doit quand quoi plus tres trop beaucoup bien bon bonne avoir fait
+""".split())
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def fold(text):
+    """Minuscules sans accents (é -> e, ç -> c, œ -> oe)"""
+    text = text.lower().replace("œ", "oe").replace("æ", "ae")
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def _stem(token):
+    # Pluriels réguliers (-s, -eaux) ; engrais et maïs restent inchangés (terminaison en -is)
+    if len(token) > 3 and token.endswith("s") and not token.endswith(("is", "us", "ss")):
+        return token[:-1]
+    if token.endswith("eaux"):
+        return token[:-1]
+    return token
+
+
+def tokenize(text, stopwords=STOPWORDS):
+    """Termes normalisés d'un texte ; les élisions (l', d', qu') tombent avec les mots d'une lettre"""
+    return [
+        _stem(token) for token in _TOKEN_PATTERN.findall(fold(text))
+        if len(token) > 1 and token not in stopwords
+    ]
+
+
+def _corpus_hash(entries):
+    payload = json.dumps([entries, K1, B, QUESTION_WEIGHT, KEYWORD_WEIGHT], sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+
+class KnowledgeBase:
+    def __init__(self, entries, index_path=None):
+        self.entries = entries
+        self.index_path = index_path
+        self.version = _corpus_hash(entries)
+        if not self._load_index():
+            self._build_index()
+            self._save_index()
+        self._term_ids = {term: position for position, term in enumerate(self.terms.tolist())}
+
+    @classmethod
+    def from_file(cls, corpus_path, index_path=None):
+        with open(corpus_path, encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data.get("entries", []), index_path)
+
+    def _document_terms(self, entry):
+        """Fréquences pondérées des termes d'une entrée"""
+        frequencies = {}
+        fields = [(question, QUESTION_WEIGHT) for question in entry.get("questions", [])]
+        fields += [(keyword, KEYWORD_WEIGHT) for keyword in entry.get("keywords", [])]
+        fields.append((entry.get("answer", ""), 1))
+        for text, weight in fields:
+            for term in tokenize(text):
+                frequencies[term] = frequencies.get(term, 0) + weight
+        return frequencies
+
+    def _build_index(self):
+        documents = [self._document_terms(entry) for entry in self.entries]
+        lengths = np.array([sum(frequencies.values()) for frequencies in documents], dtype=np.float64)
+        average = lengths.mean() if len(lengths) else 1.0
+
+        postings = {}
+        for document, frequencies in enumerate(documents):
+            for term, frequency in frequencies.items():
+                postings.setdefault(term, []).append((document, frequency))
+
+        terms = sorted(postings)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        documents_column = []
+        weights = []
+        count = max(len(documents), 1)
+        for position, term in enumerate(terms):
+            matches = postings[term]
+            idf = np.log(1 + (count - len(matches) + 0.5) / (len(matches) + 0.5))
+            for document, frequency in matches:
+                norm = K1 * (1 - B + B * lengths[document] / average)
+                documents_column.append(document)
+                weights.append(idf * frequency * (K1 + 1) / (frequency + norm))
+            offsets[position + 1] = len(documents_column)
+
+        self.terms = np.array(terms, dtype=str)
+        self.offsets = offsets
+        self.documents = np.array(documents_column, dtype=np.int32)
+        self.weights = np.array(weights, dtype=np.float32)
+        print(f"Index de la base de connaissances construit: {len(self.entries)} entrées, {len(terms)} termes")
+
+    def _load_index(self):
+        if not self.index_path or not os.path.exists(self.index_path):
+            return False
+        try:
+            with np.load(self.index_path, allow_pickle=False) as data:
+                if str(data["version"]) != self.version:
+                    return False
+                self.terms = data["terms"]
+                self.offsets = data["offsets"]
+                self.documents = data["documents"]
+                self.weights = data["weights"]
+            return True
+        except (OSError, KeyError, ValueError) as e:
+            print(f"Index de la base de connaissances illisible, reconstruction: {str(e)}")
+            return False
+
+    def _save_index(self):
+        if not self.index_path:
+            return
+        try:
+            directory = os.path.dirname(self.index_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # Écriture dans un fichier temporaire puis renommage (jamais d'index partiel)
+            temporary = f"{self.index_path}.tmp.npz"
+            np.savez(
+                temporary, version=np.array(self.version), terms=self.terms,
+                offsets=self.offsets, documents=self.documents, weights=self.weights,
+            )
+            os.replace(temporary, self.index_path)
+        except OSError as e:
+            print(f"Erreur sauvegarde de l'index de la base de connaissances: {str(e)}")
+
+    def search(self, question, limit=1):
+        """Entrées les plus pertinentes : liste de (score, entrée), score décroissant"""
+        scores = None
+        for term in set(tokenize(question)):
+            position = self._term_ids.get(term)
+            if position is None:
+                continue
+            if scores is None:
+                scores = np.zeros(len(self.entries), dtype=np.float32)
+            start, stop = self.offsets[position], self.offsets[position + 1]
+            scores[self.documents[start:stop]] += self.weights[start:stop]
+        if scores is None:
+            return []
+
+        if limit == 1:
+            best = [int(scores.argmax())]
+        else:
+            best = np.argsort(-scores, kind="stable")[:limit].tolist()
+        return [(float(scores[index]), self.entries[index]) for index in best if scores[index] > 0]
+
+    def answer(self, question, min_score=0.0):
+        """Meilleure réponse, ou None si aucune entrée n'atteint min_score"""
+        results = self.search(question)
+        if not results or results[0][0] < min_score:
+            return None
+        return results[0][1]["answer"]
+
+    def get_stats(self):
+        return {"entries": len(self.entries), "terms": len(self.terms), "postings": len(self.documents)}
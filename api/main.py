@@ -1,34 +1,37 @@
 # Importation des modules nécessaires
-from flask import Flask, request, jsonify, session
+from flask import Flask, Response, request, jsonify, session, stream_with_context
 from flask_cors import CORS
 import os
 import requests
-import json
-from datetime import datetime, timedelta
-import random
-import jwt  # Pour la gestion des JWT
+import math
+import time
+from datetime import datetime
+
+import upstream
+from quota import QuotaExceeded, manager as quota_manager
+
+import chatbot
+from chatbot import handle_local_chat
 
 # Importer le blueprint d'authentification
-from auth import auth_bp, token_required
-
-# Importer la configuration des clés API
-try:
-    from config import CONFIG
-    print("Configuration chargée depuis config.py")
-    # Utiliser les clés de config.py
-    OPENWEATHER_API_KEY = CONFIG.get("OPENWEATHER_API_KEY", "")
-    OPENWEATHER_BASE_URL = CONFIG.get("OPENWEATHER_BASE_URL", "https://api.openweathermap.org/data/2.5")
-    AGROMONITORING_BASE_URL = CONFIG.get("AGROMONITORING_BASE_URL", "https://api.agromonitoring.com/agro/1.0")
-    OPEN_ROUTER_KEY = CONFIG.get("OPEN_ROUTER_KEY", "")
-    USE_REAL_DATA = CONFIG.get("USE_REAL_DATA", True)
-except ImportError:
-    print("Fichier config.py non trouvé, utilisation des variables d'environnement")
-    # Clés API depuis variables d'environnement (supporte VITE_ et sans VITE_)
-    OPENWEATHER_API_KEY = os.environ.get('OPENWEATHER_API_KEY') or os.environ.get('VITE_OPENWEATHER_API_KEY')
-    OPENWEATHER_BASE_URL = "https://api.openweathermap.org/data/2.5"
-    AGROMONITORING_BASE_URL = "https://api.agromonitoring.com/agro/1.0"
-    OPEN_ROUTER_KEY = os.environ.get('OPEN_ROUTER_KEY') or os.environ.get('VITE_OPEN_ROUTER_KEY')
-    USE_REAL_DATA = True
+from auth import auth_bp, get_auth_stats, token_required, users
+from farms import farm_registry, get_user_farm
+import prefetch
+import timeseries
+import forecast
+from geometry import InvalidGeometry
+import ndvi
+import soil
+import irrigation
+import yield_model
+
+# Importer la configuration des clés API et l'accès aux fournisseurs
+import providers
+from providers import (
+    CONFIG,
+    OPENWEATHER_API_KEY,
+    OPEN_ROUTER_KEY,
+)
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'dev_key_for_agritech')
@@ -37,13 +40,24 @@ CORS(app, supports_credentials=True)
 # Enregistrer le blueprint d'authentification
 app.register_blueprint(auth_bp, url_prefix='/api/auth')
 
-# Gestion de la mémoire des conversations du chatbot
-def get_chat_memory():
-    if "agribot_memory" not in session:
-        session["agribot_memory"] = [
-            {"role": "system", "content": "Tu es AgriBot, un assistant agricole francophone expert en IA, en climat et en agriculture durable. Réponds de manière naturelle, polie et utile."}
-        ]
-    return session["agribot_memory"]
+# Démarrer le préchargement à la première requête (une seule fois, et pas dans
+# le processus parent du reloader Flask)
+@app.before_request
+def start_prefetch():
+    prefetch.start_if_enabled()
+
+def quota_exceeded_response(error):
+    # Budget d'appels du fournisseur épuisé et aucune donnée en cache
+    headers = {"Retry-After": str(math.ceil(error.retry_after))} if error.retry_after else {}
+    return jsonify({"error": f"Quota {error.provider} épuisé, réessayez plus tard"}), 429, headers
+
+# Conversation du chatbot : stockée côté serveur, la session n'en garde que l'identifiant
+def get_conversation_id():
+    # Anciennes sessions : la conversation entière était dans le cookie
+    session.pop("agribot_memory", None)
+    if "agribot_id" not in session:
+        session["agribot_id"] = chatbot.conversations.create()
+    return session["agribot_id"]
 
 @app.route('/api/agribot', methods=['POST'])
 def agribot():
@@ -68,64 +82,101 @@ def agribot():
         return jsonify({"error": str(e)}), 500
 
 def handle_openrouter_chat(user_input):
-    # Obtenir la mémoire des conversations
-    messages = get_chat_memory()
+    conversation_id = get_conversation_id()
+    
+    # Historique récent (et résumé des échanges plus anciens) dans le budget de tokens
+    messages = chatbot.conversations.prompt(conversation_id, user_input)
     
-    # Ajouter le message de l'utilisateur
-    messages.append({"role": "user", "content": user_input})
+    # Première question déjà posée (même forme normalisée) : pas d'appel amont
+    assistant_message = chatbot.cached_answer(messages, user_input)
     
     try:
-        # Appel à l'API OpenRouter
-        response = requests.post(
-            "https://openrouter.ai/api/v1/chat/completions",
-            headers={
-                "Authorization": f"Bearer {OPEN_ROUTER_KEY}",
-                "Content-Type": "application/json"
-            },
-            json={
-                "model": "anthropic/claude-3-haiku",  # Modèle économique et rapide
-                "messages": messages
-            }
+        if assistant_message is None:
+            # Appel à l'API OpenRouter
+            response = upstream.post("openrouter", **chatbot.openrouter_request(messages, OPEN_ROUTER_KEY))
+            assistant_message = chatbot.extract_reply(response.json())
+            chatbot.remember_answer(messages, user_input, assistant_message)
+        
+        # Enregistrer l'échange dans la conversation
+        chatbot.conversations.append(
+            conversation_id,
+            {"role": "user", "content": user_input},
+            {"role": "assistant", "content": assistant_message},
         )
         
-        response_data = response.json()
-        assistant_message = response_data["choices"][0]["message"]["content"]
-        
-        # Ajouter la réponse de l'assistant à la mémoire
-        messages.append({"role": "assistant", "content": assistant_message})
-        
-        # Limiter la taille de la mémoire (garder le système + 10 derniers messages)
-        if len(messages) > 11:
-            messages = [messages[0]] + messages[-10:]
-            
-        # Mettre à jour la session
-        session["agribot_memory"] = messages
-        
         return assistant_message
     except Exception as e:
         print(f"Erreur OpenRouter: {str(e)}")
         # Fallback sur le système local
         return handle_local_chat(user_input)
 
-def handle_local_chat(user_input):
-    # Système de réponse local basé sur des mots-clés
-    user_input = user_input.lower()
-    
-    responses = {
-        "bonjour": "Bonjour ! Comment puis-je vous aider avec vos cultures aujourd'hui ?",
-        "irrigation": "Pour une irrigation optimale, tenez compte de l'humidité du sol, des prévisions météo et des besoins spécifiques de vos cultures. Il est généralement préférable d'arroser moins souvent mais plus abondamment.",
-        "engrais": "Les engrais organiques comme le compost sont excellents pour améliorer la structure du sol. Pour les engrais chimiques, assurez-vous de respecter les dosages recommandés et d'analyser régulièrement votre sol.",
-        "rotation": "La rotation des cultures est essentielle pour maintenir la santé du sol et réduire les problèmes de ravageurs. Alternez les familles de plantes et incluez des légumineuses qui fixent l'azote.",
-        "bio": "L'agriculture biologique favorise la biodiversité et la santé des sols. Elle évite les pesticides et engrais de synthèse, privilégiant des méthodes naturelles de lutte contre les ravageurs et d'amélioration de la fertilité.",
-    }
-    
-    # Chercher des correspondances
-    for keyword, response in responses.items():
-        if keyword in user_input:
-            return response
-    
-    # Réponse par défaut
-    return "Je ne suis pas sûr de comprendre votre question. Pourriez-vous me demander quelque chose sur l'irrigation, les engrais, la rotation des cultures ou l'agriculture biologique ?"
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    # Pas de mise en tampon par un proxy nginx : chaque fragment part immédiatement
+    "X-Accel-Buffering": "no",
+}
+
+@app.route('/api/agribot/stream', methods=['POST'])
+def agribot_stream():
+    # Réponse diffusée fragment par fragment (Server-Sent Events)
+    data = request.json or {}
+    user_input = (data.get("question") or "").strip()
+    if not user_input:
+        return jsonify({"response": "Je n'ai pas compris votre question. Pouvez-vous reformuler?"}), 400
+
+    if not OPEN_ROUTER_KEY:
+        events = [chatbot.sse_event({"delta": handle_local_chat(user_input)}), chatbot.sse_event({"source": "local"}, "done")]
+        return Response(events, mimetype="text/event-stream", headers=SSE_HEADERS)
+
+    conversation_id = get_conversation_id()
+    messages = chatbot.conversations.prompt(conversation_id, user_input)
+    cached = chatbot.cached_answer(messages, user_input)
+    if cached is not None:
+        chatbot.conversations.append(
+            conversation_id, {"role": "user", "content": user_input}, {"role": "assistant", "content": cached}
+        )
+        events = [chatbot.sse_event({"delta": cached}), chatbot.sse_event({"source": "cache"}, "done")]
+        return Response(events, mimetype="text/event-stream", headers=SSE_HEADERS)
+    openrouter_args = chatbot.openrouter_request(messages, OPEN_ROUTER_KEY, stream=True)
+
+    def generate():
+        reply = []
+        response = None
+        try:
+            try:
+                response = upstream.post("openrouter", stream=True, **openrouter_args)
+                response.raise_for_status()
+                for delta in chatbot.stream_deltas(response.iter_lines(decode_unicode=True)):
+                    reply.append(delta)
+                    yield chatbot.sse_event({"delta": delta})
+            except Exception as e:
+                print(f"Erreur OpenRouter (streaming): {str(e)}")
+                if reply:
+                    yield chatbot.sse_event({"error": "Réponse interrompue"}, "error")
+                    return
+                # Rien n'a encore été envoyé : repli sur le système local
+                reply.append(handle_local_chat(user_input))
+                yield chatbot.sse_event({"delta": reply[0]})
+                yield chatbot.sse_event({"source": "local"}, "done")
+                return
+            chatbot.remember_answer(messages, user_input, "".join(reply))
+            yield chatbot.sse_event({"source": "openrouter"}, "done")
+        except GeneratorExit:
+            # Client déconnecté : fermer le flux amont arrête la génération
+            print("Client AgriBot déconnecté pendant le streaming")
+            raise
+        finally:
+            if response is not None:
+                response.close()
+            # Échange (réponse partielle si interrompue) enregistré côté serveur
+            if reply:
+                chatbot.conversations.append(
+                    conversation_id,
+                    {"role": "user", "content": user_input},
+                    {"role": "assistant", "content": "".join(reply)},
+                )
+
+    return Response(stream_with_context(generate()), mimetype="text/event-stream", headers=SSE_HEADERS)
 
 @app.route('/api/weather', methods=['GET'])
 def get_weather():
@@ -137,38 +188,15 @@ def get_weather():
         
     try:
         lat, lon = float(lat), float(lon)
-        url = f"{OPENWEATHER_BASE_URL}/weather?lat={lat}&lon={lon}&units=metric&appid={OPENWEATHER_API_KEY}"
-        
-        response = requests.get(url)
-        if not response.ok:
-            # Si l'API renvoie une erreur, renvoyer l'erreur avec le code HTTP approprié
-            return jsonify({"error": f"Erreur OpenWeather: {response.status_code}"}), response.status_code
-        
-        weather_data = response.json()
-        
-        # Extraire les données pertinentes
-        main = weather_data.get("main", {})
-        weather = weather_data.get("weather", [{}])[0]
-        wind = weather_data.get("wind", {})
-        
-        # Formater la réponse
-        formatted_data = {
-            "temperature": main.get("temp"),
-            "feels_like": main.get("feels_like"),
-            "humidity": main.get("humidity"),
-            "pressure": main.get("pressure"),
-            "description": weather.get("description"),
-            "icon": weather.get("icon"),
-            "windSpeed": wind.get("speed"),
-            "windDirection": wind.get("deg"),
-            "city": weather_data.get("name"),
-            "visibility": weather_data.get("visibility"),
-            "clouds": weather_data.get("clouds", {}).get("all"),
-            "timestamp": weather_data.get("dt"),
-            "timezone": weather_data.get("timezone")
-        }
-        
-        return jsonify(formatted_data)
+        prefetch.scheduler.record_view(lat, lon)
+        weather_data = providers.get_current_weather(lat, lon)
+        return jsonify(providers.format_weather(weather_data))
+    except requests.HTTPError as e:
+        # Si l'API renvoie une erreur, renvoyer l'erreur avec le code HTTP approprié
+        status_code = e.response.status_code
+        return jsonify({"error": f"Erreur OpenWeather: {status_code}"}), status_code
+    except QuotaExceeded as e:
+        return quota_exceeded_response(e)
     except Exception as e:
         return jsonify({"error": f"Erreur: {str(e)}"}), 500
 
@@ -182,70 +210,172 @@ def get_air_quality():
         
     try:
         lat, lon = float(lat), float(lon)
-        url = f"{OPENWEATHER_BASE_URL}/air_pollution?lat={lat}&lon={lon}&appid={OPENWEATHER_API_KEY}"
-        
-        response = requests.get(url)
-        if not response.ok:
-            return jsonify({"error": f"Erreur OpenWeather: {response.status_code}"}), response.status_code
-        
-        air_data = response.json()
+        prefetch.scheduler.record_view(lat, lon)
+        air_data = providers.get_air_pollution(lat, lon)
         
         # Vérifier que les données sont présentes
-        if not air_data.get("list") or len(air_data["list"]) == 0:
+        formatted_data = providers.format_air_quality(air_data)
+        if formatted_data is None:
             return jsonify({"error": "Données de qualité d'air non disponibles"}), 404
         
-        # Extraire les données pertinentes
-        pollution = air_data["list"][0]
-        aqi = pollution.get("main", {}).get("aqi")
-        components = pollution.get("components", {})
-        
-        # Formater la réponse
-        formatted_data = {
-            "aqi": aqi,
-            "category": get_aqi_category(aqi),
-            "components": {
-                "co": components.get("co"),
-                "no": components.get("no"),
-                "no2": components.get("no2"),
-                "o3": components.get("o3"),
-                "so2": components.get("so2"),
-                "pm2_5": components.get("pm2_5"),
-                "pm10": components.get("pm10"),
-                "nh3": components.get("nh3")
-            },
-            "timestamp": pollution.get("dt")
-        }
-        
-        # Ajouter des descriptions et recommandations
-        if aqi == 1:
-            formatted_data["description"] = "Qualité de l'air bonne"
-            formatted_data["recommendation"] = "Excellentes conditions pour les activités extérieures."
-        elif aqi == 2:
-            formatted_data["description"] = "Qualité de l'air correcte"
-            formatted_data["recommendation"] = "Conditions favorables pour la plupart des activités extérieures."
-        elif aqi == 3:
-            formatted_data["description"] = "Qualité de l'air moyenne"
-            formatted_data["recommendation"] = "Limitez l'effort prolongé pour les personnes sensibles."
-        elif aqi == 4:
-            formatted_data["description"] = "Qualité de l'air mauvaise"
-            formatted_data["recommendation"] = "Évitez les activités prolongées en extérieur."
-        elif aqi == 5:
-            formatted_data["description"] = "Qualité de l'air très mauvaise"
-            formatted_data["recommendation"] = "Évitez les activités extérieures, particulièrement nocif pour la santé."
-        
         return jsonify(formatted_data)
+    except requests.HTTPError as e:
+        status_code = e.response.status_code
+        return jsonify({"error": f"Erreur OpenWeather: {status_code}"}), status_code
+    except QuotaExceeded as e:
+        return quota_exceeded_response(e)
     except Exception as e:
         return jsonify({"error": f"Erreur: {str(e)}"}), 500
 
-def get_aqi_category(aqi):
-    categories = {
-        1: "Good",
-        2: "Fair",
-        3: "Moderate",
-        4: "Poor",
-        5: "Very Poor"
-    }
-    return categories.get(aqi, "Unknown")
+def run_coordinates_batch(cache, loader, formatter, not_found_message):
+    """
+    Traite un lot {"coordinates": [{"lat": .., "lon": ..}, ...]} : les
+    coordonnées d'une même cellule de cache ne donnent lieu qu'à un seul
+    chargement, et chaque élément reçoit son résultat ou son erreur.
+    """
+    data = request.json
+    coordinates = data.get("coordinates") if isinstance(data, dict) else None
+    if not isinstance(coordinates, list) or not coordinates:
+        return jsonify({"error": "Liste de coordonnées requise"}), 400
+    
+    max_items = CONFIG.get("BATCH_MAX_ITEMS", 100)
+    if len(coordinates) > max_items:
+        return jsonify({"error": f"Maximum {max_items} coordonnées par requête"}), 400
+    
+    # Regrouper les coordonnées par cellule de cache
+    items = []
+    cells = {}
+    for point in coordinates:
+        try:
+            lat, lon = float(point["lat"]), float(point["lon"])
+        except (TypeError, KeyError, ValueError):
+            items.append({"coordinates": point, "cell": None})
+            continue
+        cell = cache.cell(lat, lon)
+        cells.setdefault(cell, (lat, lon))
+        items.append({"lat": lat, "lon": lon, "cell": cell})
+    
+    cell_keys = list(cells)
+    fetched = upstream.map_concurrent(lambda point: loader(*point), [cells[cell] for cell in cell_keys])
+    fetched = dict(zip(cell_keys, fetched))
+    
+    results = []
+    for item in items:
+        cell = item.pop("cell")
+        if cell is None:
+            item.update({"error": "Latitude et longitude requises", "status": 400})
+        elif isinstance(fetched[cell], QuotaExceeded):
+            item.update({"error": f"Quota {fetched[cell].provider} épuisé, réessayez plus tard", "status": 429})
+        elif isinstance(fetched[cell], requests.HTTPError):
+            status_code = fetched[cell].response.status_code
+            item.update({"error": f"Erreur OpenWeather: {status_code}", "status": status_code})
+        elif isinstance(fetched[cell], Exception):
+            item.update({"error": f"Erreur: {str(fetched[cell])}", "status": 500})
+        else:
+            formatted_data = formatter(fetched[cell])
+            if formatted_data is None:
+                item.update({"error": not_found_message, "status": 404})
+            else:
+                item["data"] = formatted_data
+        results.append(item)
+    
+    return jsonify({"results": results})
+
+@app.route('/api/weather/batch', methods=['POST'])
+def get_weather_batch():
+    try:
+        return run_coordinates_batch(
+            providers.weather_cache,
+            providers.get_current_weather,
+            providers.format_weather,
+            "Données météo non disponibles"
+        )
+    except Exception as e:
+        return jsonify({"error": f"Erreur: {str(e)}"}), 500
+
+def parse_forecast_args(args):
+    """Retourne (lat, lon, resolution, hours, fields) ou lève ValueError avec le message d'erreur"""
+    lat = args.get('lat')
+    lon = args.get('lon')
+    resolution = args.get('resolution', 'hourly')
+    fields = args.get('fields')
+
+    if not lat or not lon:
+        raise ValueError("Latitude et longitude requises")
+    if resolution not in forecast.RESOLUTIONS:
+        raise ValueError(f"Résolution invalide, valeurs possibles: {', '.join(forecast.RESOLUTIONS)}")
+
+    if fields:
+        fields = [field.strip() for field in fields.split(',') if field.strip()]
+        unknown = [field for field in fields if field not in forecast.FIELDS]
+        if unknown:
+            raise ValueError(f"Champs inconnus: {', '.join(unknown)}")
+
+    try:
+        lat, lon = float(lat), float(lon)
+        # Horizon en heures (la prévision OpenWeather couvre 5 jours)
+        hours = args.get('hours')
+        hours = max(1, min(120, int(hours))) if hours else None
+    except ValueError:
+        raise ValueError("Paramètres lat, lon et hours numériques requis")
+
+    return lat, lon, resolution, hours, fields
+
+@app.route('/api/forecast', methods=['GET'])
+def get_forecast():
+    try:
+        lat, lon, resolution, hours, fields = parse_forecast_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        forecast_data = providers.get_forecast(lat, lon)
+        return jsonify(forecast.resample(forecast_data, resolution, hours, fields))
+    except requests.HTTPError as e:
+        status_code = e.response.status_code
+        return jsonify({"error": f"Erreur OpenWeather: {status_code}"}), status_code
+    except QuotaExceeded as e:
+        return quota_exceeded_response(e)
+    except Exception as e:
+        return jsonify({"error": f"Erreur: {str(e)}"}), 500
+
+@app.route('/api/weather/history', methods=['GET'])
+def get_weather_history():
+    lat = request.args.get('lat')
+    lon = request.args.get('lon')
+    resolution = request.args.get('resolution', 'hourly')
+
+    if not lat or not lon:
+        return jsonify({"error": "Latitude et longitude requises"}), 400
+    if resolution not in timeseries.RESOLUTIONS:
+        return jsonify({"error": f"Résolution invalide, valeurs possibles: {', '.join(timeseries.RESOLUTIONS)}"}), 400
+
+    try:
+        lat, lon = float(lat), float(lon)
+        # Bornes en timestamps Unix (secondes)
+        end = float(request.args.get('to', time.time()))
+        start = float(request.args.get('from', end - timeseries.DEFAULT_SPANS[resolution]))
+    except ValueError:
+        return jsonify({"error": "Paramètres lat, lon, from et to numériques requis"}), 400
+
+    if start > end:
+        return jsonify({"error": "La date de début doit précéder la date de fin"}), 400
+
+    history = providers.weather_history.query(lat, lon, resolution, start, end)
+    history.update({"resolution": resolution, "from": int(start), "to": int(end)})
+    return jsonify(history)
+
+@app.route('/api/airquality/batch', methods=['POST'])
+def get_air_quality_batch():
+    try:
+        return run_coordinates_batch(
+            providers.air_cache,
+            providers.get_air_pollution,
+            providers.format_air_quality,
+            "Données de qualité d'air non disponibles"
+        )
+    except Exception as e:
+        return jsonify({"error": f"Erreur: {str(e)}"}), 500
 
 @app.route('/api/climate', methods=['POST'])
 def get_climate():
@@ -256,80 +386,84 @@ def get_climate():
             
         polygon = data.get('polygon')
         
-        # Extraire le centre du polygone pour les données météo
-        # En calculant la moyenne des coordonnées
-        center_lat = sum(point[1] for point in polygon) / len(polygon)
-        center_lon = sum(point[0] for point in polygon) / len(polygon)
+        # Centroïde de la parcelle pour les données météo
+        try:
+            field = providers.get_field(polygon)
+        except InvalidGeometry as e:
+            return jsonify({"error": f"Polygone invalide: {str(e)}"}), 400
+        center_lon, center_lat = field["centroid"]
+        prefetch.scheduler.record_view(center_lat, center_lon)
         
-        # Utiliser l'API Agromonitoring avec la clé OpenWeather
-        url = f"{AGROMONITORING_BASE_URL}/soil?lat={center_lat}&lon={center_lon}&appid={OPENWEATHER_API_KEY}"
+        # NDVI mesuré sur la scène satellite la plus récente, si disponible
+        ndvi_value = providers.latest_field_ndvi(polygon, field)
         
         try:
-            response = requests.get(url)
-            response.raise_for_status()
-            data = response.json()
+            # Utiliser l'API Agromonitoring avec la clé OpenWeather (en cache par parcelle)
+            data = providers.get_field_climate(field)
             
             # Si l'API ne renvoie pas les données au format attendu
             if not isinstance(data, dict):
                 # Tenter avec l'API météo comme fallback pour générer des données cohérentes
-                return get_climate_from_weather(center_lat, center_lon)
-            
-            climate_data = {
-                "soilMoisture": data.get("moisture", 0),
-                "ndvi": data.get("ndvi", 0),
-                "precipitation": data.get("precipitation", 0)
-            }
+                return get_climate_from_weather(center_lat, center_lon, ndvi_value)
             
+            climate_data = providers.format_climate(data)
+            if ndvi_value is not None:
+                climate_data["ndvi"] = ndvi_value
             return jsonify(climate_data)
-        except requests.RequestException as e:
+        except (requests.RequestException, QuotaExceeded) as e:
             # Si l'API Agromonitoring échoue, utiliser les données météo
             print(f"Fallback vers données météo: {str(e)}")
-            return get_climate_from_weather(center_lat, center_lon)
+            return get_climate_from_weather(center_lat, center_lon, ndvi_value)
             
     except Exception as e:
         print(f"Erreur générale: {str(e)}")
         return jsonify({"error": f"Erreur: {str(e)}"}), 500
 
-def get_climate_from_weather(lat, lon):
+def get_climate_from_weather(lat, lon, ndvi_value=None):
     """Fallback pour obtenir des données climatiques à partir des données météo"""
     try:
-        url = f"{OPENWEATHER_BASE_URL}/weather?lat={lat}&lon={lon}&units=metric&appid={OPENWEATHER_API_KEY}"
-        response = requests.get(url)
-        response.raise_for_status()
-        weather_data = response.json()
-        
-        # Extraire les données pertinentes
-        main = weather_data.get("main", {})
-        humidity = main.get("humidity", 50)  # Humidité atmosphérique
-        clouds = weather_data.get("clouds", {}).get("all", 0)  # Couverture nuageuse
-        
-        # Estimer l'humidité du sol basée sur l'humidité atmosphérique
-        # et la pression (indicateur approximatif de conditions météo)
-        pressure = main.get("pressure", 1013) 
-        soil_moisture = max(20, min(70, humidity - 10 + (pressure - 1013) / 10))
-        
-        # NDVI approximatif basé sur la couverture nuageuse et la saison
-        # (très approximatif, juste pour avoir des données)
-        current_month = datetime.now().month
-        season_factor = 0.8 if 4 <= current_month <= 9 else 0.5  # Été vs hiver
-        ndvi = (1 - clouds / 200) * season_factor  # Entre 0 et ~0.8
-        
-        # Precipitation des dernières 24h (approximation)
-        rain_1h = weather_data.get("rain", {}).get("1h", 0)
-        rain_3h = weather_data.get("rain", {}).get("3h", 0)
-        precipitation = rain_3h if rain_3h > 0 else rain_1h * 3
-        
-        climate_data = {
-            "soilMoisture": round(soil_moisture, 1),
-            "ndvi": round(ndvi, 2),
-            "precipitation": round(precipitation, 1)
-        }
-        
+        weather_data = providers.get_current_weather(lat, lon)
+        climate_data = providers.climate_from_weather(weather_data)
+        if ndvi_value is not None:
+            climate_data["ndvi"] = ndvi_value
         return jsonify(climate_data)
+    except QuotaExceeded as e:
+        return quota_exceeded_response(e)
     except Exception as e:
         print(f"Erreur génération données climat: {str(e)}")
         return jsonify({"error": f"Erreur génération données climat: {str(e)}"}), 503
 
+@app.route('/api/ndvi', methods=['POST'])
+def get_ndvi():
+    data = request.json
+    if not data or not data.get('polygon'):
+        return jsonify({"error": "Coordonnées du polygone requises"}), 400
+
+    polygon = data.get('polygon')
+    try:
+        field = providers.get_field(polygon)
+        # Période optionnelle (dates ISO ou timestamps) ; sinon la scène la plus récente
+        start = ndvi.parse_date(data['from']) if data.get('from') else None
+        end = ndvi.parse_date(data['to']) if data.get('to') else None
+    except InvalidGeometry as e:
+        return jsonify({"error": f"Polygone invalide: {str(e)}"}), 400
+    except (TypeError, ValueError):
+        return jsonify({"error": "Dates from et to invalides"}), 400
+
+    try:
+        scenes = providers.get_field_ndvi(polygon, field, start, end, latest=start is None and end is None)
+    except (ndvi.SceneError, OSError) as e:
+        print(f"Erreur lecture scène NDVI: {str(e)}")
+        return jsonify({"error": f"Erreur lecture scène NDVI: {str(e)}"}), 503
+
+    if not scenes:
+        return jsonify({"error": "Aucune scène NDVI disponible pour cette parcelle"}), 404
+
+    return jsonify({
+        "field": {"area_ha": field["area_ha"], "centroid": field["centroid"], "bbox": field["bbox"]},
+        "scenes": scenes
+    })
+
 @app.route('/api/soil-analysis', methods=['GET'])
 def get_soil_analysis():
     lat = request.args.get('lat')
@@ -340,230 +474,346 @@ def get_soil_analysis():
         
     # Essayer de récupérer les données complètes
     try:
-        # Utiliser l'API OpenWeather pour les données météo
-        url = f"{OPENWEATHER_BASE_URL}/weather?lat={lat}&lon={lon}&units=metric&appid={OPENWEATHER_API_KEY}"
-        response = requests.get(url)
-        response.raise_for_status()
-        weather_data = response.json()
-        
-        # Récupérer les données additionnelles: forecast et air pollution
-        forecast_url = f"{OPENWEATHER_BASE_URL}/forecast?lat={lat}&lon={lon}&units=metric&appid={OPENWEATHER_API_KEY}"
-        forecast_response = requests.get(forecast_url)
-        forecast_data = forecast_response.json() if forecast_response.ok else {}
-        
-        air_url = f"{OPENWEATHER_BASE_URL}/air_pollution?lat={lat}&lon={lon}&appid={OPENWEATHER_API_KEY}"
-        air_response = requests.get(air_url)
-        air_data = air_response.json() if air_response.ok else {}
-        
-        # Créer des données de sol basées sur une combinaison de facteurs
-        # météo, prévisions et qualité de l'air
-        main = weather_data.get("main", {})
-        temp = main.get("temp", 15)
-        pressure = main.get("pressure", 1013)
-        humidity = main.get("humidity", 50)
-        
-        # Extraire des facteurs supplémentaires
-        wind = weather_data.get("wind", {}).get("speed", 3)
-        rain_mm = weather_data.get("rain", {}).get("1h", 0)
-        clouds = weather_data.get("clouds", {}).get("all", 0)
-        
-        # Facteurs de pollution
-        pollution = {}
-        if "list" in air_data and len(air_data["list"]) > 0:
-            pollution = air_data["list"][0].get("components", {})
-        
-        # Génération de données de sol cohérentes avec les conditions météo
-        # Le pH est influencé par les pluies (acidification) et pollution
-        ph_base = 6.8
-        ph_rain_factor = -0.02 * rain_mm if rain_mm > 0 else 0
-        ph_pollution_factor = -0.01 * (pollution.get("so2", 0) / 10)  # SO2 acidifie
-        ph_level = round(max(5.5, min(7.5, ph_base + ph_rain_factor + ph_pollution_factor)), 1)
-        
-        # Azote: influencé par l'humidité, la température
-        nitrogen_base = 0.25
-        nitrogen_humidity_factor = 0.1 * (humidity / 100)
-        nitrogen_temp_factor = 0.05 * ((temp - 10) / 20)  # Activité microbienne
-        nitrogen = round(max(0.1, min(0.6, nitrogen_base + nitrogen_humidity_factor + nitrogen_temp_factor)), 2)
-        
-        # Phosphore: plus stable, mais influencé par pH
-        phosphorus_base = 25
-        phosphorus_ph_factor = 5 * (1 - abs(ph_level - 6.5) / 2)  # Optimal à pH 6.5
-        phosphorus = round(max(10, min(50, phosphorus_base + phosphorus_ph_factor)), 1)
-        
-        # Potassium: influencé par l'humidité et érosion (vent)
-        potassium_base = 150
-        potassium_humidity_factor = 20 * (humidity / 100)
-        potassium_wind_factor = -5 * (wind / 5)  # Le vent peut causer l'érosion
-        potassium = round(max(100, min(300, potassium_base + potassium_humidity_factor + potassium_wind_factor)), 1)
-        
-        # Matière organique: fonction du climat, de la saison
-        month = datetime.now().month
-        is_growing_season = 3 <= month <= 10  # Printemps-Été-Automne
-        organic_base = 3.0
-        organic_season_factor = 0.5 if is_growing_season else -0.5
-        organic_matter = round(max(1.5, min(6.0, organic_base + organic_season_factor)), 1)
-        
-        # Générer des recommandations basées sur ces valeurs
-        recommendations = []
-        
-        if ph_level < 6.0:
-            recommendations.append("Le sol est acide, envisager un chaulage pour augmenter le pH")
-        elif ph_level > 7.2:
-            recommendations.append("Le sol est alcalin, privilégier des cultures adaptées ou des amendements acidifiants")
+        lat, lon = float(lat), float(lon)
+        prefetch.scheduler.record_view(lat, lon)
         
-        if nitrogen < 0.2:
-            recommendations.append("Niveau d'azote faible, envisager un apport d'engrais azotés ou de légumineuses")
-        elif nitrogen > 0.4:
-            recommendations.append("Bon niveau d'azote, limiter les apports supplémentaires")
-            
-        if humidity > 70:
-            recommendations.append("Humidité élevée, surveiller les risques de maladies fongiques")
-        elif humidity < 40:
-            recommendations.append("Conditions sèches, optimiser l'irrigation")
-            
-        # Limiter à 3 recommandations maximum
-        if len(recommendations) > 3:
-            recommendations = recommendations[:3]
-        elif len(recommendations) < 2:
-            recommendations.append("Surveiller les conditions météo et ajuster les pratiques culturales en conséquence")
-            
-        soil_data = {
-            "ph_level": ph_level,
-            "nitrogen": nitrogen,
-            "phosphorus": phosphorus,
-            "potassium": potassium,
-            "organic_matter": organic_matter,
-            "recommendations": recommendations
-        }
-            
-        return jsonify(soil_data)
+        return jsonify(providers.get_soil_analysis(lat, lon))
+    except QuotaExceeded as e:
+        return quota_exceeded_response(e)
     except Exception as e:
         print(f"Erreur analyse de sol: {str(e)}")
         return jsonify({"error": f"Erreur analyse de sol: {str(e)}"}), 503
 
-def generate_soil_recommendations():
-    recommendations = [
-        "Ajouter de l'engrais azoté pour soutenir la croissance des plantes",
-        "Maintenir les niveaux actuels de phosphore",
-        "Envisager d'ajouter de la matière organique pour améliorer la structure du sol",
-        "Surveiller le pH du sol pour assurer une disponibilité optimale des nutriments",
-        "Planter des légumineuses pour améliorer naturellement la teneur en azote"
-    ]
-    
-    # Sélectionner 3 recommandations aléatoires
-    return random.sample(recommendations, 3)
+@app.route('/api/soil-analysis/grid', methods=['POST'])
+def get_soil_analysis_grid():
+    data = request.json
+    if not data or not data.get('polygon'):
+        return jsonify({"error": "Coordonnées du polygone requises"}), 400
+
+    settings = providers.SOIL_GRID_SETTINGS
+    polygon = data.get('polygon')
+    try:
+        cell_size = float(data.get('cell_size', settings.get("default_cell_size", 20)))
+    except (TypeError, ValueError):
+        return jsonify({"error": "cell_size doit être un nombre (mètres)"}), 400
+    if cell_size < settings.get("min_cell_size", 2):
+        return jsonify({"error": f"cell_size minimale: {settings.get('min_cell_size', 2)} m"}), 400
+
+    try:
+        field = providers.get_field(polygon)
+        cells = soil.grid_cell_count(field["bbox"], cell_size)
+        if cells > settings.get("max_cells", 100000):
+            return jsonify({"error": f"Grille trop fine ({cells} mailles), augmenter cell_size"}), 400
+        # Coût du masque : lignes de la grille x arêtes du polygone
+        if soil.mask_work(field["bbox"], cell_size, field["vertices"]) > settings.get("max_mask_work", 50000000):
+            return jsonify({"error": "Polygone trop détaillé pour cette grille, augmenter cell_size"}), 400
+
+        center_lon, center_lat = field["centroid"]
+        prefetch.scheduler.record_view(center_lat, center_lon)
+        return jsonify(providers.get_soil_grid(polygon, field, cell_size))
+    except InvalidGeometry as e:
+        return jsonify({"error": f"Polygone invalide: {str(e)}"}), 400
+    except QuotaExceeded as e:
+        return quota_exceeded_response(e)
+    except Exception as e:
+        print(f"Erreur carte de sol: {str(e)}")
+        return jsonify({"error": f"Erreur carte de sol: {str(e)}"}), 503
+
+def parse_yield_field(item):
+    """Parcelle d'une prédiction de rendement ; lève ValueError si invalide"""
+    if not isinstance(item, dict):
+        raise ValueError("Paramètres de parcelle invalides")
+    known = providers.crop_yield_model.crops
+    crop_types = item.get('crop_types') or ([item['crop_type']] if item.get('crop_type') else known)
+    if not isinstance(crop_types, list) or any(crop not in known for crop in crop_types):
+        raise ValueError(f"Cultures disponibles: {', '.join(known)}")
+    field = {"crop_types": crop_types}
+    if item.get('id') is not None:
+        field["id"] = str(item['id'])
+    if item.get('lat') is not None and item.get('lon') is not None:
+        field["lat"], field["lon"] = float(item['lat']), float(item['lon'])
+    # Analyse de sol mesurée (remplace l'estimation)
+    soil_values = item.get('soil') or {}
+    if not isinstance(soil_values, dict):
+        raise ValueError("soil doit être un objet")
+    field["soil"] = {
+        name: float(soil_values[name]) for name in yield_model.SOIL_FEATURES if soil_values.get(name) is not None
+    }
+    return field
 
 @app.route('/api/crop-prediction', methods=['GET'])
 def get_crop_prediction():
-    # Simulation de prédiction de rendement de culture
-    crops = {
-        "wheat": {
-            "yield": random.uniform(4.5, 7.2),  # tonnes/hectare
-            "confidence": random.uniform(0.65, 0.95),
-            "factors": ["temperature", "rainfall", "soil quality"]
-        },
-        "corn": {
-            "yield": random.uniform(6.5, 12.0),  # tonnes/hectare
-            "confidence": random.uniform(0.7, 0.92),
-            "factors": ["temperature", "rainfall", "nitrogen"]
-        },
-        "soybean": {
-            "yield": random.uniform(2.5, 4.8),  # tonnes/hectare
-            "confidence": random.uniform(0.6, 0.9),
-            "factors": ["temperature", "soil pH", "phosphorus"]
-        }
+    # Rendement par culture ; localisation optionnelle (sinon conditions de référence)
+    try:
+        field = parse_yield_field({
+            "lat": request.args.get('lat'),
+            "lon": request.args.get('lon'),
+            "crop_type": request.args.get('crop_type'),
+        })
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"Paramètres invalides: {str(e)}"}), 400
+
+    if "lat" in field:
+        prefetch.scheduler.record_view(field["lat"], field["lon"])
+    prediction = providers.predict_yields([field])[0]
+    if isinstance(prediction, QuotaExceeded):
+        return quota_exceeded_response(prediction)
+    if isinstance(prediction, Exception):
+        print(f"Erreur prédiction de rendement: {str(prediction)}")
+        return jsonify({"error": f"Erreur prédiction de rendement: {str(prediction)}"}), 503
+    return jsonify(prediction)
+
+@app.route('/api/crop-prediction/batch', methods=['POST'])
+def get_crop_prediction_batch():
+    # Lot {"fields": [{"id", "lat", "lon", "crop_types", "soil"}, ...]} : une seule inférence vectorisée
+    data = request.json
+    fields = data.get("fields") if isinstance(data, dict) else None
+    if not isinstance(fields, list) or not fields:
+        return jsonify({"error": "Liste de parcelles requise"}), 400
+
+    max_fields = providers.YIELD_SETTINGS.get("max_fields", 500)
+    if len(fields) > max_fields:
+        return jsonify({"error": f"Maximum {max_fields} parcelles par requête"}), 400
+
+    parsed = []
+    errors = {}
+    for index, item in enumerate(fields):
+        try:
+            parsed.append((index, parse_yield_field(item)))
+        except (TypeError, ValueError) as e:
+            errors[index] = str(e) or "Paramètres invalides"
+
+    predictions = dict(zip(
+        (index for index, _ in parsed), providers.predict_yields([field for _, field in parsed])
+    )) if parsed else {}
+
+    results = []
+    for index in range(len(fields)):
+        item = {"field": index}
+        if isinstance(fields[index], dict) and fields[index].get('id') is not None:
+            item["id"] = fields[index]['id']
+        prediction = predictions.get(index)
+        if index in errors:
+            item.update({"error": errors[index], "status": 400})
+        elif isinstance(prediction, QuotaExceeded):
+            item.update({"error": f"Quota {prediction.provider} épuisé, réessayez plus tard", "status": 429})
+        elif isinstance(prediction, Exception):
+            item.update({"error": f"Erreur: {str(prediction)}", "status": 503})
+        else:
+            item["predictions"] = prediction
+        results.append(item)
+
+    return jsonify({"model_version": providers.crop_yield_model.version, "results": results})
+
+def parse_irrigation_field(item):
+    """Paramètres d'une simulation d'irrigation ; lève ValueError si invalides"""
+    if not isinstance(item, dict):
+        raise ValueError("Paramètres de parcelle invalides")
+    crop_type = item.get('crop_type', 'wheat')
+    simulation = {
+        "field_size": float(item.get('field_size', 1)),  # Taille en hectares
+        "crop_type": crop_type,
+        "soil_type": item.get('soil_type', 'loam'),
+        "days_after_planting": irrigation.days_after_planting(
+            crop_type, item.get('growth_stage'), item.get('days_after_planting')
+        ),
     }
+    # Localisation optionnelle : ET0 calculée sur la prévision de la parcelle
+    if item.get('lat') is not None and item.get('lon') is not None:
+        simulation["lat"], simulation["lon"] = float(item['lat']), float(item['lon'])
+    if item.get('irrigation_efficiency') is not None:
+        simulation["irrigation_efficiency"] = min(1.0, max(0.1, float(item['irrigation_efficiency'])))
+    if item.get('initial_depletion') is not None:
+        simulation["initial_depletion"] = float(item['initial_depletion'])
+    return simulation
+
+def irrigation_recommendations(simulation, plan):
+    field_size = simulation["field_size"]
+    recommendations = [
+        f"Besoin quotidien: {plan['daily_water_needs']} mm/jour",
+        f"Volume total: {plan['volume_per_day']} m³/jour pour {field_size} hectares",
+        "Irriguer tôt le matin pour minimiser l'évaporation"
+    ]
+    
+    if plan["schedule"]:
+        first = plan["schedule"][0]
+        recommendations.append(f"Prochaine irrigation le {first['date']}: {first['gross_mm']} mm ({first['volume_m3']} m³)")
+    else:
+        recommendations.append(f"Aucune irrigation nécessaire sur les {len(plan['daily']['dates'])} prochains jours")
     
-    return jsonify(crops)
+    if simulation["soil_type"] == "sand":
+        recommendations.append("Irrigations plus fréquentes mais moins abondantes recommandées")
+    elif simulation["soil_type"] == "clay":
+        recommendations.append("Irrigations moins fréquentes mais plus abondantes recommandées")
+    return recommendations
 
 @app.route('/api/optimize-irrigation', methods=['POST'])
 def optimize_irrigation():
-    # Traitement de la demande d'optimisation de l'irrigation
+    # Programme d'irrigation : ET0 FAO-56 sur la prévision et bilan hydrique journalier
     try:
         data = request.json
         if not data:
             return jsonify({"error": "Données d'entrée requises"}), 400
-            
-        field_size = data.get('field_size', 1)  # Taille en hectares
-        crop_type = data.get('crop_type', 'wheat')
-        soil_type = data.get('soil_type', 'loam')
-        
-        # Simuler un calcul d'optimisation d'irrigation
-        base_water_needs = {
-            "wheat": 5.0,  # mm/jour
-            "corn": 7.5,
-            "soybean": 6.0,
-            "tomato": 8.0,
-            "potato": 6.5
-        }.get(crop_type, 6.0)
-        
-        soil_factor = {
-            "sand": 1.3,  # Drainage rapide
-            "loam": 1.0,  # Équilibré
-            "clay": 0.8   # Rétention d'eau
-        }.get(soil_type, 1.0)
-        
-        # Calculer les besoins en eau ajustés
-        adjusted_water_needs = base_water_needs * soil_factor
-        
-        # Calculer le volume total
-        volume_per_day = adjusted_water_needs * field_size * 10  # en m³/jour
         
-        recommendations = [
-            f"Besoin quotidien: {round(adjusted_water_needs, 1)} mm/jour",
-            f"Volume total: {round(volume_per_day, 1)} m³/jour pour {field_size} hectares",
-            "Irriguer tôt le matin pour minimiser l'évaporation"
-        ]
-        
-        if soil_type == "sand":
-            recommendations.append("Irrigations plus fréquentes mais moins abondantes recommandées")
-        elif soil_type == "clay":
-            recommendations.append("Irrigations moins fréquentes mais plus abondantes recommandées")
-        
-        result = {
-            "daily_water_needs": round(adjusted_water_needs, 2),
-            "volume_per_day": round(volume_per_day, 2),
-            "recommendations": recommendations,
-            "efficiency_score": random.randint(65, 95)
-        }
-        
-        return jsonify(result)
+        # Lot : {"fields": [...], "scenarios": [...]} -> une simulation par parcelle et par scénario
+        fields = data.get('fields')
+        batch = fields is not None
+        if not batch:
+            fields = [data]
+        scenarios = data.get('scenarios') or [{}]
+        if not isinstance(fields, list) or not fields or not isinstance(scenarios, list):
+            return jsonify({"error": "Liste de parcelles requise"}), 400
+        
+        max_simulations = providers.IRRIGATION_SETTINGS.get("max_simulations", 1000)
+        if len(fields) * len(scenarios) > max_simulations:
+            return jsonify({"error": f"Maximum {max_simulations} simulations par requête"}), 400
+        
+        simulations = []
+        errors = {}
+        for field_index, field in enumerate(fields):
+            for scenario_index, scenario in enumerate(scenarios):
+                key = (field_index, scenario_index)
+                try:
+                    merged = dict(field, **scenario) if isinstance(field, dict) and isinstance(scenario, dict) else None
+                    simulation = parse_irrigation_field(merged)
+                except (TypeError, ValueError) as e:
+                    errors[key] = str(e) or "Paramètres invalides"
+                    continue
+                simulation["key"] = key
+                simulations.append(simulation)
+        
+        if not batch and errors:
+            return jsonify({"error": f"Paramètres invalides: {errors[(0, 0)]}"}), 400
+        
+        plans = dict(zip((sim["key"] for sim in simulations), providers.plan_irrigation(simulations))) if simulations else {}
+        simulations = {sim["key"]: sim for sim in simulations}
+        
+        results = []
+        for key in sorted(set(plans) | set(errors)):
+            if key in errors:
+                results.append({"field": key[0], "scenario": key[1], "error": errors[key], "status": 400})
+                continue
+            plan = plans[key]
+            plan["recommendations"] = irrigation_recommendations(simulations[key], plan)
+            if not batch:
+                return jsonify(plan)
+            results.append(dict(plan, field=key[0], scenario=key[1]))
+        
+        return jsonify({"results": results})
     except Exception as e:
         return jsonify({"error": f"Erreur: {str(e)}"}), 500
 
+def parse_farm_page(args):
+    """(limit, cursor) d'une requête paginée sur les fermes ; lève ValueError si invalide"""
+    settings = CONFIG.get("FARM_REGISTRY", {})
+    limit = int(args.get('limit', settings.get("default_limit", 100)))
+    if not 1 <= limit <= settings.get("max_limit", 1000):
+        raise ValueError(f"limit doit être entre 1 et {settings.get('max_limit', 1000)}")
+    return limit, args.get('cursor')
+
 @app.route('/api/farms', methods=['GET'])
 @token_required
 def get_user_farms(current_user):
     # Route protégée qui nécessite une authentification
-    # Cette fonction reçoit l'utilisateur courant en argument
+    # Fermes de l'utilisateur : toutes, dans une emprise (bbox=min_lon,min_lat,max_lon,max_lat)
+    # ou contenant un point (lat, lon)
+    try:
+        limit, cursor = parse_farm_page(request.args)
+        bbox = point = None
+        if request.args.get('bbox'):
+            bbox = [float(value) for value in request.args['bbox'].split(',')]
+            if len(bbox) != 4 or bbox[0] > bbox[2] or bbox[1] > bbox[3]:
+                raise ValueError("bbox attendu: min_lon,min_lat,max_lon,max_lat")
+        elif request.args.get('lat') is not None and request.args.get('lon') is not None:
+            point = (float(request.args['lat']), float(request.args['lon']))
+        farms, next_cursor = farm_registry.search(current_user["id"], bbox=bbox, point=point, limit=limit, cursor=cursor)
+    except ValueError as e:
+        return jsonify({"error": f"Paramètres invalides: {str(e)}"}), 400
     
-    # Simuler des données de fermes pour l'utilisateur connecté
-    farms = [
-        {
-            "id": "farm_1",
-            "name": "Green Valley",
-            "area": 24.5,  # hectares
-            "location": {
-                "lat": 45.123,
-                "lon": -73.456
-            },
-            "crops": ["wheat", "corn"],
-            "created_at": "2023-03-15T10:30:00Z"
-        },
-        {
-            "id": "farm_2",
-            "name": "Sunset Fields",
-            "area": 18.2,
-            "location": {
-                "lat": 45.234,
-                "lon": -73.567
-            },
-            "crops": ["soybean"],
-            "created_at": "2023-05-02T14:45:00Z"
-        }
-    ]
+    return jsonify({"farms": farms, "next_cursor": next_cursor})
+
+@app.route('/api/farms/near', methods=['GET'])
+@token_required
+def get_nearby_farms(current_user):
+    # Fermes de l'utilisateur dans un rayon (km) autour d'un point, les plus proches d'abord
+    try:
+        limit, cursor = parse_farm_page(request.args)
+        lat, lon = float(request.args['lat']), float(request.args['lon'])
+        radius_km = float(request.args.get('radius_km', 10))
+        if radius_km <= 0:
+            raise ValueError("radius_km doit être positif")
+        farms, next_cursor = farm_registry.near(current_user["id"], lat, lon, radius_km, limit=limit, cursor=cursor)
+    except KeyError:
+        return jsonify({"error": "Paramètres lat et lon requis"}), 400
+    except ValueError as e:
+        return jsonify({"error": f"Paramètres invalides: {str(e)}"}), 400
+    
+    return jsonify({"farms": farms, "next_cursor": next_cursor})
+
+@app.route('/api/farms', methods=['POST'])
+@token_required
+def create_farm(current_user):
+    # Nouvelle ferme : nom, cultures et polygone ([[lon, lat], ...] ou GeoJSON) ou localisation
+    data = request.json
+    if not isinstance(data, dict) or not data.get('name'):
+        return jsonify({"error": "Le champ name est requis"}), 400
+    crops = data.get('crops') or []
+    if not isinstance(crops, list):
+        return jsonify({"error": "crops doit être une liste"}), 400
+    try:
+        farm = farm_registry.add(
+            current_user["id"], str(data['name']), crops=crops, polygon=data.get('polygon'),
+            location=data.get('location'), area=data.get('area'),
+        )
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"Ferme invalide: {str(e)}"}), 400
     
-    return jsonify({"farms": farms})
+    return jsonify({"farm": farm}), 201
+
+@app.route('/api/farms/<farm_id>/dashboard', methods=['GET'])
+@token_required
+def get_farm_dashboard(current_user, farm_id):
+    # Toutes les sections du tableau de bord d'une ferme en un seul aller-retour,
+    # construites à partir d'un seul jeu d'appels aux fournisseurs
+    farm = get_user_farm(current_user, farm_id)
+    if farm is None:
+        return jsonify({"error": "Ferme non trouvée"}), 404
+    
+    sections = request.args.get('sections')
+    sections = [name.strip() for name in sections.split(',') if name.strip()] if sections else list(providers.DASHBOARD_SECTIONS)
+    unknown = [name for name in sections if name not in providers.DASHBOARD_SECTIONS]
+    if unknown:
+        return jsonify({"error": f"Sections inconnues: {', '.join(unknown)}"}), 400
+    
+    try:
+        location = farm["location"]
+        prefetch.scheduler.record_view(location["lat"], location["lon"])
+        dashboard = providers.build_dashboard(location["lat"], location["lon"], sections)
+        dashboard["farm"] = farm
+        return jsonify(dashboard)
+    except Exception as e:
+        print(f"Erreur tableau de bord: {str(e)}")
+        return jsonify({"error": f"Erreur tableau de bord: {str(e)}"}), 503
+
+@app.route('/api/metrics', methods=['GET'])
+@token_required
+def get_metrics(current_user):
+    # Compteurs internes (caches, comptes, jetons, fermes) : réservés aux administrateurs
+    if current_user.get("role") != "admin":
+        return jsonify({"message": "Accès réservé aux administrateurs"}), 403
+    return jsonify({
+        "cache": providers.get_cache_stats(),
+        "singleflight": upstream.get_singleflight_stats(),
+        "prefetch": prefetch.scheduler.get_stats(),
+        "quota": quota_manager.get_stats(),
+        "history": providers.weather_history.get_stats(),
+        "knowledge_base": chatbot.knowledge.get_stats(),
+        "conversations": chatbot.conversations.get_stats(),
+        "users": users.get_stats(),
+        "auth": get_auth_stats(),
+        "farms": farm_registry.get_stats(),
+        "answers": chatbot.answers.get_stats() if chatbot.answers is not None else None
+    })
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
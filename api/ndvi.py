@@ -0,0 +1,335 @@
+"""
+Pipeline NDVI à partir de scènes raster locales (bandes rouge et proche infrarouge).
+
+Chaque scène est un sous-dossier du répertoire configuré, décrit par un
+fichier scene.json :
+
+    {
+        "id": "S2_20240612",
+        "date": "2024-06-12",
+        "bounds": [min_lon, min_lat, max_lon, max_lat],
+        "width": 10980, "height": 10980,
+        "red": "red.npy", "nir": "nir.npy",
+        "dtype": "uint16", "scale": 0.0001, "nodata": 0
+    }
+
+Les bandes sont des tableaux .npy (ouverts avec mmap_mode='r'), des
+fichiers bruts (.raw/.bin, lus via np.memmap avec dtype, width et height)
+ou des GeoTIFF (lecture par fenêtre avec rasterio, optionnel ; bounds lu
+dans le fichier s'il est absent du JSON). Les rasters sont supposés en
+WGS84 (lon/lat), ligne 0 au nord.
+
+Seule la fenêtre couvrant la parcelle est lue, par blocs de lignes : le
+masque du polygone (règle pair-impair, par ligne de balayage) et les
+statistiques sont calculés bloc par bloc, avec un histogramme fin pour les
+percentiles. Les blocs sont bornés par le nombre d'arêtes du polygone : la
+mémoire utilisée ne dépend ni de la taille du raster ni du détail du tracé.
+L'échantillonnage d'une grille (sample_grid) ne lit que les lignes du
+raster qui portent un point de la grille.
+"""
+
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+import geometry
+
+try:
+    import rasterio
+    from rasterio.windows import Window
+except ImportError:
+    rasterio = None
+
+# Histogramme fin utilisé pour les percentiles (pas de 0.001 sur [-1, 1])
+FINE_BINS = 2000
+
+PERCENTILES = (10, 25, 50, 75, 90)
+
+
+class SceneError(Exception):
+    pass
+
+
+def parse_date(value):
+    """Date ISO (YYYY-MM-DD...) ou timestamp Unix -> timestamp"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    date = datetime.fromisoformat(value)
+    # UTC seulement si la date ne précise pas son décalage
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+    return date.timestamp()
+
+
+class Band:
+    """Lecture par fenêtre d'une bande, sans charger le raster entier"""
+
+    def __init__(self, path, meta):
+        self.path = path
+        self._dataset = None
+        extension = os.path.splitext(path)[1].lower()
+        if extension == ".npy":
+            self._array = np.load(path, mmap_mode="r")
+        elif extension in (".tif", ".tiff"):
+            if rasterio is None:
+                raise SceneError(f"rasterio requis pour lire {path}")
+            self._dataset = rasterio.open(path)
+            self._array = None
+        else:
+            self._array = np.memmap(
+                path, dtype=meta.get("dtype", "uint16"), mode="r", shape=(meta["height"], meta["width"])
+            )
+
+    @property
+    def shape(self):
+        if self._dataset is not None:
+            return self._dataset.height, self._dataset.width
+        return self._array.shape[-2:]
+
+    def bounds(self):
+        if self._dataset is None:
+            return None
+        return list(self._dataset.bounds)
+
+    def read(self, row_start, row_stop, col_start, col_stop):
+        if self._dataset is not None:
+            window = Window(col_start, row_start, col_stop - col_start, row_stop - row_start)
+            return self._dataset.read(1, window=window)
+        return np.asarray(self._array[row_start:row_stop, col_start:col_stop])
+
+    def read_rows(self, rows, col_start, col_stop):
+        """Seules les lignes demandées (indices croissants, sans doublon) d'une plage de colonnes"""
+        if self._dataset is not None:
+            return np.concatenate([self.read(row, row + 1, col_start, col_stop) for row in rows])
+        return np.asarray(self._array[rows, col_start:col_stop])
+
+    def close(self):
+        if self._dataset is not None:
+            self._dataset.close()
+        self._array = None
+
+
+class Scene:
+    def __init__(self, directory, meta):
+        self.directory = directory
+        self.meta = meta
+        self.id = meta.get("id") or os.path.basename(directory)
+        self.date = parse_date(meta["date"])
+        self.scale = meta.get("scale", 1.0)
+        self.nodata = meta.get("nodata")
+        self.bounds = meta.get("bounds")
+
+    @property
+    def version(self):
+        """Change si les fichiers de la scène sont remplacés (clé de cache)"""
+        return int(os.path.getmtime(os.path.join(self.directory, "scene.json")))
+
+    def open_bands(self):
+        red = Band(os.path.join(self.directory, self.meta["red"]), self.meta)
+        nir = Band(os.path.join(self.directory, self.meta["nir"]), self.meta)
+        if red.shape != nir.shape:
+            red.close()
+            nir.close()
+            raise SceneError(f"Bandes de tailles différentes dans la scène {self.id}")
+        if self.bounds is None:
+            self.bounds = red.bounds()
+        if self.bounds is None:
+            red.close()
+            nir.close()
+            raise SceneError(f"Emprise (bounds) manquante pour la scène {self.id}")
+        return red, nir
+
+    def intersects(self, bbox):
+        if self.bounds is None:
+            return True
+        min_lon, min_lat, max_lon, max_lat = self.bounds
+        return not (bbox[0] > max_lon or bbox[2] < min_lon or bbox[1] > max_lat or bbox[3] < min_lat)
+
+    def describe(self):
+        return {"id": self.id, "date": datetime.fromtimestamp(self.date, timezone.utc).date().isoformat()}
+
+
+class SceneCatalog:
+    """Scènes disponibles dans le répertoire, relu au plus toutes les `refresh` secondes"""
+
+    def __init__(self, directory, refresh=60):
+        self.directory = directory
+        self.refresh = refresh
+        self._scenes = []
+        self._loaded_at = 0
+        self._lock = threading.Lock()
+
+    def _scan(self):
+        scenes = []
+        if not os.path.isdir(self.directory):
+            return scenes
+        for entry in os.scandir(self.directory):
+            meta_path = os.path.join(entry.path, "scene.json")
+            if not entry.is_dir() or not os.path.exists(meta_path):
+                continue
+            try:
+                with open(meta_path) as f:
+                    scenes.append(Scene(entry.path, json.load(f)))
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Scène NDVI ignorée ({entry.path}): {str(e)}")
+        scenes.sort(key=lambda scene: scene.date)
+        return scenes
+
+    def scenes(self, bbox=None, start=None, end=None):
+        with self._lock:
+            if time.time() - self._loaded_at > self.refresh:
+                self._scenes = self._scan()
+                self._loaded_at = time.time()
+            scenes = list(self._scenes)
+        return [
+            scene for scene in scenes
+            if (bbox is None or scene.intersects(bbox))
+            and (start is None or scene.date >= start)
+            and (end is None or scene.date <= end)
+        ]
+
+    def latest(self, bbox):
+        scenes = self.scenes(bbox)
+        return scenes[-1] if scenes else None
+
+
+def _window(scene, bbox, height, width):
+    """Lignes et colonnes de la scène couvrant l'emprise de la parcelle"""
+    min_lon, min_lat, max_lon, max_lat = scene.bounds
+    pixel_width = (max_lon - min_lon) / width
+    pixel_height = (max_lat - min_lat) / height
+    col_start = max(0, int(np.floor((bbox[0] - min_lon) / pixel_width)))
+    col_stop = min(width, int(np.ceil((bbox[2] - min_lon) / pixel_width)))
+    row_start = max(0, int(np.floor((max_lat - bbox[3]) / pixel_height)))
+    row_stop = min(height, int(np.ceil((max_lat - bbox[1]) / pixel_height)))
+    return row_start, row_stop, col_start, col_stop, pixel_width, pixel_height
+
+
+def zonal_stats(scene, shape, bbox, chunk_rows=256, bins=20):
+    """Statistiques NDVI des pixels de la scène dont le centre est dans le polygone"""
+    red, nir = scene.open_bands()
+    try:
+        height, width = red.shape
+        row_start, row_stop, col_start, col_stop, pixel_width, pixel_height = _window(scene, bbox, height, width)
+        min_lon, _, _, max_lat = scene.bounds
+        lons = min_lon + (np.arange(col_start, col_stop) + 0.5) * pixel_width
+        edges = geometry.ring_edges(shape)
+        # Lignes par bloc bornées aussi par le nombre d'arêtes (temporaires du masque)
+        chunk_rows = max(1, min(chunk_rows, geometry.MASK_BUDGET // max(1, len(edges[0]))))
+
+        fine = np.zeros(FINE_BINS, dtype=np.int64)
+        inside = 0
+        count = 0
+        total = 0.0
+        total_sq = 0.0
+        low, high = np.inf, -np.inf
+
+        for chunk_start in range(row_start, row_stop, chunk_rows):
+            chunk_stop = min(row_stop, chunk_start + chunk_rows)
+            lats = max_lat - (np.arange(chunk_start, chunk_stop) + 0.5) * pixel_height
+            mask = geometry.grid_mask(edges, lons, lats)
+            if not mask.any():
+                continue
+            inside += int(mask.sum())
+
+            red_values = red.read(chunk_start, chunk_stop, col_start, col_stop)
+            nir_values = nir.read(chunk_start, chunk_stop, col_start, col_stop)
+            if scene.nodata is not None:
+                mask &= (red_values != scene.nodata) & (nir_values != scene.nodata)
+            red_values = red_values[mask].astype(np.float32) * scene.scale
+            nir_values = nir_values[mask].astype(np.float32) * scene.scale
+
+            denominator = nir_values + red_values
+            valid = denominator != 0
+            values = (nir_values[valid] - red_values[valid]) / denominator[valid]
+            values = np.clip(values, -1, 1)
+            if not len(values):
+                continue
+
+            count += len(values)
+            total += float(values.sum(dtype=np.float64))
+            total_sq += float(np.square(values, dtype=np.float64).sum())
+            low = min(low, float(values.min()))
+            high = max(high, float(values.max()))
+            fine += np.bincount(
+                np.minimum(((values + 1) / 2 * FINE_BINS).astype(np.int64), FINE_BINS - 1), minlength=FINE_BINS
+            )
+    finally:
+        red.close()
+        nir.close()
+
+    result = scene.describe()
+    result.update({"pixels": count, "coverage": round(count / inside, 3) if inside else 0.0})
+    if not count:
+        result.update({"mean": None, "std": None, "min": None, "max": None, "percentiles": {}, "histogram": None})
+        return result
+
+    mean = total / count
+    # Percentiles lus sur l'histogramme cumulé (précision 0.001)
+    cumulative = np.cumsum(fine)
+    fine_edges = np.linspace(-1, 1, FINE_BINS + 1)
+    percentiles = {
+        f"p{p}": round(float(fine_edges[np.searchsorted(cumulative, count * p / 100) + 1]), 3)
+        for p in PERCENTILES
+    }
+    # Histogramme renvoyé : regroupement des classes fines
+    counts = fine.reshape(bins, -1).sum(axis=1) if FINE_BINS % bins == 0 else np.histogram(
+        fine_edges[:-1], bins=bins, range=(-1, 1), weights=fine)[0]
+    result.update({
+        "mean": round(mean, 4),
+        "std": round(max(0.0, total_sq / count - mean * mean) ** 0.5, 4),
+        "min": round(low, 4),
+        "max": round(high, 4),
+        "percentiles": percentiles,
+        "histogram": {
+            "edges": np.round(np.linspace(-1, 1, bins + 1), 3).tolist(),
+            "counts": counts.astype(int).tolist(),
+        },
+    })
+    return result
+
+
+def sample_grid(scene, lons, lats, chunk_rows=256):
+    """NDVI du pixel le plus proche de chaque point de la grille lons x lats (NaN hors scène ou sans donnée)"""
+    red, nir = scene.open_bands()
+    try:
+        height, width = red.shape
+        min_lon, min_lat, max_lon, max_lat = scene.bounds
+        cols = np.floor((lons - min_lon) / (max_lon - min_lon) * width).astype(np.int64)
+        rows = np.floor((max_lat - lats) / (max_lat - min_lat) * height).astype(np.int64)
+        valid_cols = (cols >= 0) & (cols < width)
+        valid_rows = (rows >= 0) & (rows < height)
+
+        values = np.full((len(lats), len(lons)), np.nan, dtype=np.float32)
+        if not valid_cols.any() or not valid_rows.any():
+            return values
+        col_start, col_stop = int(cols[valid_cols].min()), int(cols[valid_cols].max()) + 1
+        local_cols = cols[valid_cols] - col_start
+
+        # Blocs de lignes de la grille : seules les lignes échantillonnées du raster sont lues
+        grid_rows = np.flatnonzero(valid_rows)
+        for block in range(0, len(grid_rows), chunk_rows):
+            indices = grid_rows[block:block + chunk_rows]
+            raster_rows, picked_rows = np.unique(rows[indices], return_inverse=True)
+            picked = np.ix_(picked_rows, local_cols)
+            red_raw = red.read_rows(raster_rows, col_start, col_stop)[picked]
+            nir_raw = nir.read_rows(raster_rows, col_start, col_stop)[picked]
+            red_values = red_raw.astype(np.float32) * scene.scale
+            nir_values = nir_raw.astype(np.float32) * scene.scale
+
+            denominator = nir_values + red_values
+            invalid = denominator == 0
+            if scene.nodata is not None:
+                invalid |= (red_raw == scene.nodata) | (nir_raw == scene.nodata)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                block_values = np.clip((nir_values - red_values) / denominator, -1, 1)
+            block_values[invalid] = np.nan
+            values[np.ix_(indices, np.flatnonzero(valid_cols))] = block_values
+        return values
+    finally:
+        red.close()
+        nir.close()
@@ -0,0 +1,166 @@
+"""
+Hachage des mots de passe (scrypt ou PBKDF2 de la bibliothèque standard).
+
+Une dérivation adaptative coûte des dizaines de millisecondes de CPU : elle
+tourne dans un pool de processus pour ne pas garder le GIL des threads qui
+servent la météo. Un sémaphore borne le nombre de hachages en cours ; au-delà,
+une rafale de connexions attend (puis échoue avec HashingBusy) au lieu
+d'empiler du travail.
+
+Format stocké : « scrypt$n$r$p$sel$empreinte » ou
+« pbkdf2_sha256$itérations$sel$empreinte » (sel et empreinte en base64).
+Les anciennes empreintes SHA-256 (64 caractères hexadécimaux) restent
+acceptées et signalées à réhacher.
+
+Un échec coûte toujours une dérivation (empreinte factice pour un compte
+inconnu ou une ancienne empreinte erronée) : le temps de réponse ne révèle
+pas si un email est inscrit.
+"""
+
+import base64
+import hashlib
+import hmac
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+
+class HashingBusy(Exception):
+    pass
+
+
+def _b64(data):
+    return base64.b64encode(data).decode().rstrip("=")
+
+
+def _unb64(text):
+    return base64.b64decode(text + "=" * (-len(text) % 4))
+
+
+def derive(algorithm, password, salt, params):
+    """Dérivation elle-même (exécutée dans un processus du pool)"""
+    if algorithm == "scrypt":
+        n, r, p = params
+        return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r + 1024 * 1024, dklen=32)
+    return hashlib.pbkdf2_hmac("sha256", password.encode(), salt, params[0], dklen=32)
+
+
+# Nom de l'algorithme dans CONFIG -> préfixe de l'empreinte stockée
+PREFIXES = {"scrypt": "scrypt", "pbkdf2": "pbkdf2_sha256"}
+_ALGORITHMS = {prefix: algorithm for algorithm, prefix in PREFIXES.items()}
+
+
+def _is_legacy(encoded):
+    return "$" not in encoded and len(encoded) == 64
+
+
+class PasswordHasher:
+    def __init__(self, algorithm="scrypt", scrypt_n=2 ** 14, scrypt_r=8, scrypt_p=1,
+                 pbkdf2_iterations=600000, workers=2, max_concurrent=4, queue_timeout=5,
+                 start_method="forkserver"):
+        self.algorithm = algorithm
+        self.params = (scrypt_n, scrypt_r, scrypt_p) if algorithm == "scrypt" else (pbkdf2_iterations,)
+        self.workers = workers
+        self.start_method = start_method
+        self.queue_timeout = queue_timeout
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._executor = None
+        self._dummy = None
+        self._lock = threading.Lock()
+        self._stats = {"hashed": 0, "verified": 0, "rehash_needed": 0, "busy": 0}
+
+    def _pool(self):
+        # Créé au premier hachage (après le fork éventuel du serveur). Pas de fork direct :
+        # le serveur est multithread (préchargement, pools SQLite) et un processus copié
+        # pourrait hériter d'un verrou détenu par un autre thread
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers, mp_context=multiprocessing.get_context(self.start_method),
+                    )
+        return self._executor
+
+    def _derive(self, algorithm, password, salt, params):
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            with self._lock:
+                self._stats["busy"] += 1
+            raise HashingBusy()
+        try:
+            # Processus du pool tué : pool recréé et un seul nouvel essai, jamais de calcul
+            # sur le thread de la requête (une boucle de plantages reste un 503)
+            for _ in range(2):
+                executor = self._pool()
+                try:
+                    return executor.submit(derive, algorithm, password, salt, params).result()
+                except BrokenProcessPool:
+                    print("Pool de hachage des mots de passe interrompu, recréation")
+                    self._discard(executor)
+            with self._lock:
+                self._stats["busy"] += 1
+            raise HashingBusy()
+        finally:
+            self._slots.release()
+
+    def _discard(self, executor):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False)
+
+    def hash(self, password):
+        salt = os.urandom(16)
+        digest = self._derive(self.algorithm, password, salt, self.params)
+        with self._lock:
+            self._stats["hashed"] += 1
+        fields = [PREFIXES[self.algorithm], *map(str, self.params)]
+        return "$".join(fields + [_b64(salt), _b64(digest)])
+
+    def verify(self, password, encoded):
+        """(mot de passe correct, empreinte à réhacher avec les paramètres actuels)"""
+        with self._lock:
+            self._stats["verified"] += 1
+        if _is_legacy(encoded):
+            valid = needs_rehash = hmac.compare_digest(hashlib.sha256(password.encode()).hexdigest(), encoded)
+            if not valid:
+                self.verify_dummy(password)
+        else:
+            valid, needs_rehash = self._verify_encoded(password, encoded)
+        if needs_rehash:
+            with self._lock:
+                self._stats["rehash_needed"] += 1
+        return valid, needs_rehash
+
+    def verify_dummy(self, password):
+        """Vérification au coût réel pour un compte inconnu ; toujours False"""
+        if self._dummy is None:
+            # Paramètres actuels, sel et résultat aléatoires : aucune dérivation pour la créer
+            fields = [PREFIXES[self.algorithm], *map(str, self.params)]
+            self._dummy = "$".join(fields + [_b64(os.urandom(16)), _b64(os.urandom(32))])
+        self._verify_encoded(password, self._dummy)
+        return False
+
+    def _verify_encoded(self, password, encoded):
+        try:
+            prefix, *params, salt, digest = encoded.split("$")
+            algorithm = _ALGORITHMS[prefix]
+            params = tuple(int(value) for value in params)
+            salt, digest = _unb64(salt), _unb64(digest)
+        except (KeyError, ValueError):
+            return False, False
+        valid = hmac.compare_digest(self._derive(algorithm, password, salt, params), digest)
+        return valid, valid and (algorithm != self.algorithm or params != self.params)
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats.update({"algorithm": self.algorithm, "params": list(self.params), "workers": self.workers})
+        return stats
@@ -0,0 +1,177 @@
+"""
+Préchargement en arrière-plan des données des fermes.
+
+Un thread parcourt périodiquement les emplacements de toutes les fermes et
+rafraîchit les caches météo, qualité de l'air et climat avant leur
+expiration (par cellule, et par empreinte de polygone pour le climat des
+parcelles servi par /api/climate), pour que les requêtes interactives tombent presque toujours sur
+une entrée chaude. Les fermes consultées le plus récemment passent en
+premier et les rafraîchissements sont étalés dans le cycle (jitter) pour ne
+pas envoyer une rafale d'appels aux fournisseurs.
+"""
+
+import random
+import threading
+import time
+from collections import OrderedDict
+
+import providers
+import quota
+from cache import geohash_encode
+from farms import iter_farm_fields, iter_farm_locations
+from providers import CONFIG
+
+
+class PrefetchScheduler:
+    def __init__(self, targets, field_targets=(), interval=60, lead=120, jitter=60, max_per_cycle=50,
+                 precision=6, max_views=10000):
+        # targets : [(cache, loader(lat, lon)), ...] par cellule de la ferme
+        # field_targets : [(cache, loader(lat, lon)), ...] par empreinte du polygone de la ferme
+        self.targets = targets
+        self.field_targets = field_targets
+        self.interval = interval
+        self.lead = lead
+        self.jitter = jitter
+        self.max_per_cycle = max_per_cycle
+        self.precision = precision
+        self.max_views = max_views
+        # cellule -> dernière consultation ; LRU borné (toute coordonnée interrogée y passe)
+        self._views = OrderedDict()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self._stats = {"cycles": 0, "refreshes": 0, "errors": 0, "skipped": 0, "shed": 0, "in_progress": 0}
+
+    def record_view(self, lat, lon):
+        cell = geohash_encode(lat, lon, self.precision)
+        with self._lock:
+            self._views[cell] = time.time()
+            self._views.move_to_end(cell)
+            while len(self._views) > self.max_views:
+                self._views.popitem(last=False)
+
+    def last_view(self, lat, lon):
+        with self._lock:
+            return self._views.get(geohash_encode(lat, lon, self.precision), 0)
+
+    @staticmethod
+    def _cell_refresh(cache, cell, loader):
+        return lambda: cache.refresh_cell(cell, loader)
+
+    @staticmethod
+    def _field_refresh(cache, field_hash, loader, lat, lon):
+        return lambda: cache.refresh(field_hash, lambda: loader(lat, lon))
+
+    def due_refreshes(self):
+        """Entrées à rafraîchir, des fermes consultées le plus récemment aux autres"""
+        due = {}
+
+        def consider(priority, cache, key, refresh):
+            remaining = cache.time_to_expiry(key)
+            # Chaque entrée a sa propre avance pour étaler les expirations
+            if remaining is None or remaining < self.lead + random.uniform(0, self.jitter):
+                if (cache.name, key) not in due or due[(cache.name, key)][0] < priority:
+                    due[(cache.name, key)] = (priority, cache, key, refresh)
+
+        for lat, lon in iter_farm_locations():
+            priority = self.last_view(lat, lon)
+            for cache, loader in self.targets:
+                cell = cache.cell(lat, lon)
+                consider(priority, cache, cell, self._cell_refresh(cache, cell, loader))
+        if self.field_targets:
+            for lat, lon, field_hash in iter_farm_fields():
+                priority = self.last_view(lat, lon)
+                for cache, loader in self.field_targets:
+                    consider(priority, cache, field_hash, self._field_refresh(cache, field_hash, loader, lat, lon))
+        return sorted(due.values(), key=lambda item: item[0], reverse=True)
+
+    def run_once(self):
+        due = self.due_refreshes()
+        selected = due[:self.max_per_cycle]
+        with self._lock:
+            self._stats["cycles"] += 1
+            self._stats["skipped"] += len(due) - len(selected)
+
+        # Étaler les rafraîchissements sur la première moitié du cycle
+        spacing = (self.interval / 2) / len(selected) if selected else 0
+        for _, cache, key, refresh in selected:
+            if self._stop.is_set():
+                return
+            # Même réservation que le stale-while-revalidate : un seul rafraîchissement par clé
+            if not cache.begin_refresh(key):
+                with self._lock:
+                    self._stats["in_progress"] += 1
+                continue
+            try:
+                # Priorité basse : le quota restant est réservé aux requêtes interactives
+                with quota.priority(quota.BACKGROUND):
+                    refresh()
+                with self._lock:
+                    self._stats["refreshes"] += 1
+            except quota.QuotaExceeded:
+                # Budget réservé aux requêtes interactives : reprendre au prochain cycle
+                with self._lock:
+                    self._stats["shed"] += 1
+                return
+            except Exception as e:
+                with self._lock:
+                    self._stats["errors"] += 1
+                print(f"Erreur préchargement {cache.name} ({key}): {str(e)}")
+            finally:
+                cache.end_refresh(key)
+            self._stop.wait(random.uniform(0, 2 * spacing))
+
+    def _run(self):
+        # Premier cycle décalé pour ne pas coïncider avec le démarrage
+        self._stop.wait(random.uniform(0, self.jitter))
+        while not self._stop.is_set():
+            started = time.time()
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Erreur cycle de préchargement: {str(e)}")
+            self._stop.wait(max(0, self.interval - (time.time() - started)))
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="prefetch", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["running"] = self._thread is not None and self._thread.is_alive()
+            stats["tracked_views"] = len(self._views)
+        return stats
+
+
+_settings = CONFIG.get("PREFETCH", {})
+
+scheduler = PrefetchScheduler(
+    targets=[
+        (providers.weather_cache, providers.fetch_current_weather),
+        (providers.air_cache, providers.fetch_air_pollution),
+        (providers.climate_cache, providers.fetch_agro_soil),
+    ],
+    # Climat des parcelles (/api/climate) : même chargement que providers.get_field_climate,
+    # au centroïde, sous l'empreinte canonique du polygone
+    field_targets=[
+        (providers.field_climate_cache, providers.fetch_agro_soil),
+    ],
+    interval=_settings.get("interval", 60),
+    lead=_settings.get("lead", 120),
+    jitter=_settings.get("jitter", 60),
+    max_per_cycle=_settings.get("max_per_cycle", 50),
+    precision=providers.weather_cache.precision,
+    max_views=_settings.get("max_views", 10000),
+)
+
+
+def start_if_enabled():
+    if _settings.get("enabled", False):
+        scheduler.start()
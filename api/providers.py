@@ -0,0 +1,728 @@
+"""
+Accès aux données des fournisseurs externes (OpenWeather, Agromonitoring)
+et mise en forme des réponses renvoyées par l'API.
+"""
+
+import hashlib
+import json
+import os
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+import forecast
+import geometry
+import irrigation
+import ndvi
+import soil
+import upstream
+import yield_model
+from cache import GeoCache, TTLCache
+from quota import QuotaExceeded
+from snapshot_store import SnapshotStore
+from timeseries import WeatherHistory
+
+# Importer la configuration des clés API
+try:
+    from config import CONFIG
+    print("Configuration chargée depuis config.py")
+    # Utiliser les clés de config.py
+    OPENWEATHER_API_KEY = CONFIG.get("OPENWEATHER_API_KEY", "")
+    OPENWEATHER_BASE_URL = CONFIG.get("OPENWEATHER_BASE_URL", "https://api.openweathermap.org/data/2.5")
+    AGROMONITORING_BASE_URL = CONFIG.get("AGROMONITORING_BASE_URL", "https://api.agromonitoring.com/agro/1.0")
+    OPEN_ROUTER_KEY = CONFIG.get("OPEN_ROUTER_KEY", "")
+    USE_REAL_DATA = CONFIG.get("USE_REAL_DATA", True)
+except ImportError:
+    print("Fichier config.py non trouvé, utilisation des variables d'environnement")
+    CONFIG = {}
+    # Clés API depuis variables d'environnement (supporte VITE_ et sans VITE_)
+    OPENWEATHER_API_KEY = os.environ.get('OPENWEATHER_API_KEY') or os.environ.get('VITE_OPENWEATHER_API_KEY')
+    OPENWEATHER_BASE_URL = "https://api.openweathermap.org/data/2.5"
+    AGROMONITORING_BASE_URL = "https://api.agromonitoring.com/agro/1.0"
+    OPEN_ROUTER_KEY = os.environ.get('OPEN_ROUTER_KEY') or os.environ.get('VITE_OPEN_ROUTER_KEY')
+    USE_REAL_DATA = True
+
+
+def _data_path(path):
+    """Chemin relatif au dossier api/"""
+    if os.path.isabs(path):
+        return path
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), path)
+
+
+def _open_snapshot_store():
+    settings = CONFIG.get("SNAPSHOT_STORE", {})
+    if not settings.get("enabled", False):
+        return None
+    store = SnapshotStore(_data_path(settings.get("path", "var/snapshots.db")))
+    store.start_compaction(settings.get("compaction_interval", 600))
+    return store
+
+
+snapshot_store = _open_snapshot_store()
+
+
+def _make_geo_cache(name, default_ttl):
+    settings = CONFIG.get("CACHE", {}).get(name, {})
+    cache = GeoCache(
+        name,
+        ttl=settings.get("ttl", default_ttl),
+        stale_ttl=settings.get("stale_ttl", default_ttl),
+        precision=settings.get("precision", 6),
+        max_entries=settings.get("max_entries", 5000),
+        max_bytes=settings.get("max_bytes"),
+        # Quota épuisé : servir la dernière valeur connue plutôt qu'une erreur
+        serve_expired_on=(QuotaExceeded,),
+        store=snapshot_store,
+        retention=CONFIG.get("SNAPSHOT_STORE", {}).get("retention", 86400),
+    )
+    # Démarrage à chaud depuis le cache disque
+    cache.warm()
+    return cache
+
+
+weather_cache = _make_geo_cache("weather", 600)
+air_cache = _make_geo_cache("airquality", 1800)
+climate_cache = _make_geo_cache("climate", 3600)
+soil_cache = _make_geo_cache("soil", 1800)
+forecast_cache = _make_geo_cache("forecast", 1800)
+
+
+def _make_field_cache(name, default_ttl):
+    settings = CONFIG.get("CACHE", {}).get(name, {})
+    cache = TTLCache(
+        name,
+        ttl=settings.get("ttl", default_ttl),
+        stale_ttl=settings.get("stale_ttl", 0),
+        max_entries=settings.get("max_entries", 2000),
+        max_bytes=settings.get("max_bytes"),
+        serve_expired_on=(QuotaExceeded,),
+        store=snapshot_store,
+        retention=CONFIG.get("SNAPSHOT_STORE", {}).get("retention", 86400),
+    )
+    cache.warm()
+    return cache
+
+
+# Parcelles : mesures par polygone reçu, données Agromonitoring par empreinte canonique
+field_geometry_cache = _make_field_cache("field_geometry", 86400)
+field_climate_cache = _make_field_cache("field_climate", 3600)
+GEOMETRY_SETTINGS = CONFIG.get("GEOMETRY", {})
+
+# Scènes NDVI locales ; statistiques par scène et par parcelle (les scènes ne changent pas)
+NDVI_SETTINGS = CONFIG.get("NDVI", {})
+ndvi_catalog = ndvi.SceneCatalog(
+    _data_path(NDVI_SETTINGS.get("directory", "var/ndvi")),
+    refresh=NDVI_SETTINGS.get("catalog_refresh", 60),
+)
+ndvi_cache = _make_field_cache("ndvi", 7 * 86400)
+soil_grid_cache = _make_field_cache("soil_grid", 1800)
+SOIL_GRID_SETTINGS = CONFIG.get("SOIL_GRID", {})
+IRRIGATION_SETTINGS = CONFIG.get("IRRIGATION", {})
+
+# Modèle de rendement (coefficients chargés au premier appel) ; prédictions
+# en cache par parcelle et empreinte des entrées
+YIELD_SETTINGS = CONFIG.get("YIELD_MODEL", {})
+crop_yield_model = yield_model.YieldModel(_data_path(YIELD_SETTINGS.get("coefficients", "yield_coefficients.json")))
+yield_cache = _make_field_cache("yield", 86400)
+
+_history_settings = CONFIG.get("WEATHER_HISTORY", {})
+weather_history = WeatherHistory(
+    precision=_history_settings.get("precision", 6),
+    retention=_history_settings.get("retention"),
+    compaction_interval=_history_settings.get("compaction_interval", 3600),
+    max_series=_history_settings.get("max_series", 10000),
+)
+
+# Sections disponibles pour le tableau de bord d'une ferme
+DASHBOARD_SECTIONS = ("weather", "airquality", "climate", "soil")
+
+
+def get_cache_stats():
+    stats = {cache.name: cache.get_stats() for cache in (
+        weather_cache, air_cache, climate_cache, soil_cache, forecast_cache,
+        field_geometry_cache, field_climate_cache, ndvi_cache, soil_grid_cache, yield_cache
+    )}
+    if snapshot_store is not None:
+        stats["disk"] = snapshot_store.get_stats()
+    return stats
+
+
+def current_weather_url(lat, lon):
+    return f"{OPENWEATHER_BASE_URL}/weather?lat={lat}&lon={lon}&units=metric&appid={OPENWEATHER_API_KEY}"
+
+
+def forecast_url(lat, lon):
+    return f"{OPENWEATHER_BASE_URL}/forecast?lat={lat}&lon={lon}&units=metric&appid={OPENWEATHER_API_KEY}"
+
+
+def air_pollution_url(lat, lon):
+    return f"{OPENWEATHER_BASE_URL}/air_pollution?lat={lat}&lon={lon}&appid={OPENWEATHER_API_KEY}"
+
+
+def agro_soil_url(lat, lon):
+    return f"{AGROMONITORING_BASE_URL}/soil?lat={lat}&lon={lon}&appid={OPENWEATHER_API_KEY}"
+
+
+def fetch_current_weather(lat, lon):
+    weather_data = upstream.fetch_json("openweather", current_weather_url(lat, lon))
+    weather_history.record(lat, lon, weather_data)
+    return weather_data
+
+
+def fetch_forecast(lat, lon):
+    return upstream.fetch_json("openweather", forecast_url(lat, lon))
+
+
+def fetch_air_pollution(lat, lon):
+    return upstream.fetch_json("openweather", air_pollution_url(lat, lon))
+
+
+def fetch_agro_soil(lat, lon):
+    return upstream.fetch_json("agromonitoring", agro_soil_url(lat, lon))
+
+
+def get_current_weather(lat, lon):
+    """Données brutes /weather, servies depuis le cache de la cellule"""
+    return weather_cache.get_or_load_at(lat, lon, fetch_current_weather)
+
+
+def get_forecast(lat, lon):
+    """Données brutes /forecast (5 jours, pas de 3 heures), servies depuis le cache de la cellule"""
+    return forecast_cache.get_or_load_at(lat, lon, fetch_forecast)
+
+
+def get_air_pollution(lat, lon):
+    """Données brutes /air_pollution, servies depuis le cache de la cellule"""
+    return air_cache.get_or_load_at(lat, lon, fetch_air_pollution)
+
+
+def get_agro_soil(lat, lon):
+    """Données brutes Agromonitoring /soil, servies depuis le cache de la cellule"""
+    return climate_cache.get_or_load_at(lat, lon, fetch_agro_soil)
+
+
+def compute_soil_analysis(lat, lon):
+    # Météo (obligatoire) et pollution (optionnelle) en parallèle : seules entrées de l'analyse
+    sources = upstream.fan_out({
+        "weather": lambda: get_current_weather(lat, lon),
+        "air": lambda: get_air_pollution(lat, lon),
+    }, required=("weather",))
+    return analyze_soil(sources["weather"], sources["air"] or {})
+
+
+def get_soil_analysis(lat, lon):
+    """Analyse de sol de la cellule, servie depuis le cache"""
+    return soil_cache.get_or_load_at(lat, lon, compute_soil_analysis)
+
+
+def compute_soil_grid(polygon, field, cell_size):
+    center_lon, center_lat = field["centroid"]
+    # Entrées communes à toute la parcelle, récupérées une seule fois
+    sources = upstream.fan_out({
+        "weather": lambda: get_current_weather(center_lat, center_lon),
+        "air": lambda: get_air_pollution(center_lat, center_lon),
+    }, required=("weather",))
+
+    scene = ndvi_catalog.latest(field["bbox"])
+
+    def ndvi_values(lons, lats):
+        try:
+            return ndvi.sample_grid(scene, lons, lats, chunk_rows=NDVI_SETTINGS.get("chunk_rows", 256))
+        except (ndvi.SceneError, OSError, ValueError) as e:
+            print(f"Erreur lecture scène NDVI: {str(e)}")
+            return None
+
+    grid = soil.analyze_grid(
+        field_shape(polygon),
+        cell_size,
+        sources["weather"],
+        sources["air"] or {},
+        datetime.now().month,
+        ndvi_values if scene is not None else None,
+    )
+    grid["ndvi_scene"] = scene.describe() if scene is not None and grid["ndvi_driven"] else None
+    grid["field"] = {"area_ha": field["area_ha"], "centroid": field["centroid"]}
+    return grid
+
+
+def get_soil_grid(polygon, field, cell_size):
+    """Carte de sol de la parcelle, en cache par empreinte et taille de maille"""
+    key = f"{field['hash']}:{cell_size}"
+    return soil_grid_cache.get_or_load(key, lambda: compute_soil_grid(polygon, field, cell_size))
+
+
+def daily_reference_weather(forecast_data, lat):
+    """Jours complets de la prévision : dates, ET0 Penman-Monteith (mm) et pluie (mm)"""
+    daily = forecast.resample(
+        forecast_data, "daily", fields=["temperature", "humidity", "wind_speed", "clouds", "pressure", "precipitation"]
+    )
+    # Jours couverts par au moins 4 créneaux de 3 heures (bords de prévision exclus)
+    keep = np.array(daily.get("slots", []), dtype=np.int64) >= 4
+    if not keep.any():
+        return None
+
+    def column(field, stat):
+        values = np.array(daily[field][stat], dtype=np.float64)[keep]
+        return np.nan_to_num(values, nan=np.nanmean(values) if np.isfinite(values).any() else 0)
+
+    timestamps = np.array(daily["timestamps"], dtype=np.int64)[keep]
+    dates = [datetime.fromtimestamp(int(ts) + daily["timezone"], timezone.utc).date() for ts in timestamps]
+    et0 = irrigation.penman_monteith(
+        t_min=column("temperature", "min"),
+        t_max=column("temperature", "max"),
+        humidity=column("humidity", "mean"),
+        wind_10m=column("wind_speed", "mean"),
+        clouds=column("clouds", "mean"),
+        pressure_hpa=column("pressure", "mean"),
+        lat=lat,
+        day_of_year=np.array([date.timetuple().tm_yday for date in dates]),
+    )
+    return {"dates": [date.isoformat() for date in dates], "et0": et0, "rain": column("precipitation", "sum")}
+
+
+def plan_irrigation(simulations):
+    """
+    Programme d'irrigation de chaque simulation (parcelle x scénario) sur
+    l'horizon de prévision. Une prévision par cellule de cache ; sans
+    localisation (ou prévision indisponible), ET0 de référence constante.
+    """
+    horizon = IRRIGATION_SETTINGS.get("horizon_days", 5)
+
+    cells = {}
+    for sim in simulations:
+        if sim.get("lat") is not None and sim.get("lon") is not None:
+            sim["cell"] = forecast_cache.cell(sim["lat"], sim["lon"])
+            cells.setdefault(sim["cell"], (sim["lat"], sim["lon"]))
+
+    cell_keys = list(cells)
+    fetched = upstream.map_concurrent(lambda point: get_forecast(*point), [cells[cell] for cell in cell_keys])
+    weather_by_cell = {}
+    failures = [data for data in fetched if isinstance(data, Exception)]
+    if failures:
+        print(f"Prévision indisponible pour {len(failures)} cellule(s), ET0 de référence utilisée: {str(failures[0])}")
+    for cell, data in zip(cell_keys, fetched):
+        if isinstance(data, Exception):
+            continue
+        weather = daily_reference_weather(data, cells[cell][0])
+        if weather is not None:
+            weather_by_cell[cell] = weather
+
+    # Horizon commun à toutes les simulations
+    days = min([horizon] + [len(weather["dates"]) for weather in weather_by_cell.values()])
+    today = datetime.now(timezone.utc).date()
+    default_dates = [(today + timedelta(days=day)).isoformat() for day in range(days)]
+    default_et0 = IRRIGATION_SETTINGS.get("default_et0", 5.0)
+
+    et0 = np.full((len(simulations), days), float(default_et0))
+    rain = np.zeros((len(simulations), days))
+    dates = []
+    sources = []
+    for index, sim in enumerate(simulations):
+        weather = weather_by_cell.get(sim.get("cell"))
+        if weather is None:
+            dates.append(default_dates)
+            sources.append("default")
+            continue
+        et0[index] = weather["et0"][:days]
+        rain[index] = weather["rain"][:days]
+        dates.append(weather["dates"][:days])
+        sources.append("forecast")
+
+    result = irrigation.run(
+        simulations,
+        {"et0": et0, "rain": rain},
+        efficiency_default=IRRIGATION_SETTINGS.get("irrigation_efficiency", 0.75),
+        initial_depletion_default=IRRIGATION_SETTINGS.get("initial_depletion", 0.3),
+    )
+
+    plans = []
+    for index, sim in enumerate(simulations):
+        field_size = sim.get("field_size", 1)
+        etc = result["etc"][index]
+        gross = result["gross"][index]
+        daily_water_needs = float(etc.mean()) if days else 0.0
+        # Pertes : application (efficience du système) et percolation profonde
+        supplied = float(gross.sum() + irrigation.EFFECTIVE_RAIN * rain[index].sum())
+        losses = float((gross - result["net"][index]).sum() + result["percolation"][index])
+        schedule = [
+            {
+                "date": dates[index][day],
+                "net_mm": round(float(result["net"][index, day]), 1),
+                "gross_mm": round(float(gross[day]), 1),
+                # 1 mm sur 1 ha = 10 m³
+                "volume_m3": round(float(gross[day]) * field_size * 10, 1),
+            }
+            for day in range(days) if result["net"][index, day] > 0
+        ]
+        plans.append({
+            "daily_water_needs": round(daily_water_needs, 2),
+            "volume_per_day": round(daily_water_needs * field_size * 10, 2),
+            # Part de l'eau apportée (irrigation et pluie) qui reste dans la zone racinaire
+            "efficiency_score": int(round(100 * (1 - losses / supplied))) if supplied > 0 else 100,
+            "schedule": schedule,
+            "growth_stage": irrigation.stage_name(sim.get("crop_type", "wheat"), sim["days_after_planting"]),
+            "weather_source": sources[index],
+            "daily": {
+                "dates": dates[index],
+                "et0": np.round(et0[index], 2).tolist(),
+                "kc": np.round(result["kc"][index], 2).tolist(),
+                "etc": np.round(etc, 2).tolist(),
+                "rain": np.round(rain[index], 1).tolist(),
+                "depletion": np.round(result["depletion"][index], 1).tolist(),
+            },
+            "soil_water": {
+                "taw_mm": round(float(result["taw"][index]), 1),
+                "raw_mm": round(float(result["raw"][index]), 1),
+                "percolation_mm": round(float(result["percolation"][index]), 1),
+            },
+        })
+    return plans
+
+
+def yield_inputs(lat, lon):
+    """Variables du modèle de rendement pour un emplacement : historique, météo actuelle, sol"""
+    # Un seul niveau de fan_out : compute_soil_analysis lance le sien sur le même pool, où ses
+    # appels attendraient des workers occupés par les tâches parentes. Les sources du sol sont
+    # donc chargées ici, et l'analyse calculée sur place si le cache n'en a pas de fraîche
+    soil_cell = soil_cache.cell(lat, lon)
+    remaining = soil_cache.time_to_expiry(soil_cell)
+    soil_fresh = remaining is not None and remaining > 0
+    calls = {"weather": lambda: get_current_weather(lat, lon)}
+    if not soil_fresh:
+        calls["air"] = lambda: get_air_pollution(lat, lon)
+    sources = upstream.fan_out(calls, required=("weather",))
+    try:
+        soil_data = soil_cache.get_or_load(
+            soil_cell, lambda: analyze_soil(sources["weather"], sources.get("air") or {}),
+        )
+    except Exception as e:
+        print(f"Analyse de sol indisponible pour le rendement: {str(e)}")
+        soil_data = None
+    window_days = YIELD_SETTINGS.get("history_days", 30)
+    now = datetime.now(timezone.utc).timestamp()
+    history = weather_history.query(lat, lon, "daily", now - window_days * 86400, now)
+    return yield_model.build_features(history, sources["weather"], soil_data, window_days)
+
+
+def predict_yields(fields):
+    """
+    Prédictions de rendement d'un lot de parcelles
+    {id, lat, lon, crop_types, soil} -> liste de {culture: prédiction} ou
+    d'exceptions. Les entrées sont chargées une fois par cellule ; seules les
+    prédictions dont l'empreinte des entrées a changé sont recalculées, en un
+    seul appel au modèle.
+    """
+    cells = {}
+    for field in fields:
+        if field.get("lat") is not None and field.get("lon") is not None:
+            field["cell"] = weather_cache.cell(field["lat"], field["lon"])
+            cells.setdefault(field["cell"], (field["lat"], field["lon"]))
+
+    cell_keys = list(cells)
+    fetched = dict(zip(cell_keys, upstream.map_concurrent(
+        lambda point: yield_inputs(*point), [cells[cell] for cell in cell_keys]
+    )))
+
+    version = crop_yield_model.version
+    decimals = YIELD_SETTINGS.get("feature_decimals", 2)
+    results = []
+    pending = []
+    for field in fields:
+        inputs = fetched.get(field.get("cell"), (dict.fromkeys(yield_model.FEATURES), 0.0))
+        if isinstance(inputs, Exception):
+            results.append(inputs)
+            continue
+        features, coverage = inputs
+        # Valeurs de sol mesurées fournies par l'utilisateur
+        features = dict(features, **field.get("soil", {}))
+        features = {
+            name: None if value is None else round(float(value), decimals) for name, value in features.items()
+        }
+        field_key = field.get("id") or field.get("cell") or "reference"
+        predictions = {}
+        for crop_type in field["crop_types"]:
+            key = f"{field_key}:{yield_model.input_hash(version, crop_type, features, coverage, decimals)}"
+            value, state = yield_cache.lookup(key)
+            if state == "fresh":
+                predictions[crop_type] = value
+            else:
+                pending.append((predictions, crop_type, key, features, coverage))
+        results.append(predictions)
+
+    computed = crop_yield_model.predict(
+        [item[1] for item in pending], [item[3] for item in pending], [item[4] for item in pending]
+    )
+    for (predictions, crop_type, key, _, _), prediction in zip(pending, computed):
+        yield_cache.put(key, prediction)
+        predictions[crop_type] = prediction
+
+    # Ordre des cultures demandé
+    return [
+        result if isinstance(result, Exception) else {crop: result[crop] for crop in field["crop_types"]}
+        for field, result in zip(fields, results)
+    ]
+
+
+def format_weather(weather_data):
+    # Extraire les données pertinentes
+    main = weather_data.get("main", {})
+    weather = weather_data.get("weather", [{}])[0]
+    wind = weather_data.get("wind", {})
+
+    # Formater la réponse
+    return {
+        "temperature": main.get("temp"),
+        "feels_like": main.get("feels_like"),
+        "humidity": main.get("humidity"),
+        "pressure": main.get("pressure"),
+        "description": weather.get("description"),
+        "icon": weather.get("icon"),
+        "windSpeed": wind.get("speed"),
+        "windDirection": wind.get("deg"),
+        "city": weather_data.get("name"),
+        "visibility": weather_data.get("visibility"),
+        "clouds": weather_data.get("clouds", {}).get("all"),
+        "timestamp": weather_data.get("dt"),
+        "timezone": weather_data.get("timezone")
+    }
+
+
+def get_aqi_category(aqi):
+    categories = {
+        1: "Good",
+        2: "Fair",
+        3: "Moderate",
+        4: "Poor",
+        5: "Very Poor"
+    }
+    return categories.get(aqi, "Unknown")
+
+
+def format_air_quality(air_data):
+    """Retourne None si OpenWeather ne fournit aucune mesure"""
+    if not air_data.get("list") or len(air_data["list"]) == 0:
+        return None
+
+    # Extraire les données pertinentes
+    pollution = air_data["list"][0]
+    aqi = pollution.get("main", {}).get("aqi")
+    components = pollution.get("components", {})
+
+    # Formater la réponse
+    formatted_data = {
+        "aqi": aqi,
+        "category": get_aqi_category(aqi),
+        "components": {
+            "co": components.get("co"),
+            "no": components.get("no"),
+            "no2": components.get("no2"),
+            "o3": components.get("o3"),
+            "so2": components.get("so2"),
+            "pm2_5": components.get("pm2_5"),
+            "pm10": components.get("pm10"),
+            "nh3": components.get("nh3")
+        },
+        "timestamp": pollution.get("dt")
+    }
+
+    # Ajouter des descriptions et recommandations
+    if aqi == 1:
+        formatted_data["description"] = "Qualité de l'air bonne"
+        formatted_data["recommendation"] = "Excellentes conditions pour les activités extérieures."
+    elif aqi == 2:
+        formatted_data["description"] = "Qualité de l'air correcte"
+        formatted_data["recommendation"] = "Conditions favorables pour la plupart des activités extérieures."
+    elif aqi == 3:
+        formatted_data["description"] = "Qualité de l'air moyenne"
+        formatted_data["recommendation"] = "Limitez l'effort prolongé pour les personnes sensibles."
+    elif aqi == 4:
+        formatted_data["description"] = "Qualité de l'air mauvaise"
+        formatted_data["recommendation"] = "Évitez les activités prolongées en extérieur."
+    elif aqi == 5:
+        formatted_data["description"] = "Qualité de l'air très mauvaise"
+        formatted_data["recommendation"] = "Évitez les activités extérieures, particulièrement nocif pour la santé."
+
+    return formatted_data
+
+
+def field_shape(polygon):
+    """Géométrie validée de la parcelle (anneaux très détaillés simplifiés)"""
+    return geometry.validate(
+        geometry.parse(polygon),
+        max_vertices=GEOMETRY_SETTINGS.get("max_vertices", 20000),
+        tolerance=GEOMETRY_SETTINGS.get("simplify_tolerance", 0.5),
+    )
+
+
+def measure_field(polygon):
+    """Valide la parcelle et retourne son empreinte canonique, centroïde, surface et emprise"""
+    shape = field_shape(polygon)
+    field = geometry.measure(shape)
+    field["hash"] = geometry.canonical_hash(shape, GEOMETRY_SETTINGS.get("hash_precision", 6))
+    return field
+
+
+def get_field(polygon):
+    """Mesures de la parcelle, en cache par contenu brut du polygone reçu"""
+    raw_key = hashlib.sha256(json.dumps(polygon, separators=(",", ":")).encode()).hexdigest()[:32]
+    return field_geometry_cache.get_or_load(raw_key, lambda: measure_field(polygon))
+
+
+def get_field_climate(field):
+    """Données brutes Agromonitoring au centroïde de la parcelle, en cache par empreinte"""
+    center_lon, center_lat = field["centroid"]
+    return field_climate_cache.get_or_load(field["hash"], lambda: fetch_agro_soil(center_lat, center_lon))
+
+
+def get_field_ndvi(polygon, field, start=None, end=None, latest=False):
+    """Statistiques NDVI de la parcelle pour chaque scène de la période (ou la plus récente)"""
+    if latest:
+        scene = ndvi_catalog.latest(field["bbox"])
+        scenes = [scene] if scene is not None else []
+    else:
+        scenes = ndvi_catalog.scenes(field["bbox"], start, end)[-NDVI_SETTINGS.get("max_scenes", 50):]
+
+    # Polygone relu seulement si une scène n'est pas déjà en cache
+    shape = []
+
+    def compute(scene):
+        if not shape:
+            shape.append(field_shape(polygon))
+        return ndvi.zonal_stats(
+            scene,
+            shape[0],
+            field["bbox"],
+            chunk_rows=NDVI_SETTINGS.get("chunk_rows", 256),
+            bins=NDVI_SETTINGS.get("histogram_bins", 20),
+        )
+
+    return [
+        ndvi_cache.get_or_load(f"{scene.id}:{scene.version}:{field['hash']}", lambda scene=scene: compute(scene))
+        for scene in scenes
+    ]
+
+
+def latest_field_ndvi(polygon, field):
+    """NDVI moyen de la scène la plus récente couvrant la parcelle, None si indisponible"""
+    try:
+        stats = get_field_ndvi(polygon, field, latest=True)
+    except (ndvi.SceneError, OSError, ValueError) as e:
+        print(f"Erreur lecture scène NDVI: {str(e)}")
+        return None
+    if not stats or stats[0]["mean"] is None:
+        return None
+    return round(stats[0]["mean"], 2)
+
+
+def format_climate(soil_data):
+    return {
+        "soilMoisture": soil_data.get("moisture", 0),
+        "ndvi": soil_data.get("ndvi", 0),
+        "precipitation": soil_data.get("precipitation", 0)
+    }
+
+
+def climate_from_weather(weather_data):
+    """Estime les données climatiques à partir des données météo (fallback)"""
+    # Extraire les données pertinentes
+    main = weather_data.get("main", {})
+    humidity = main.get("humidity", 50)  # Humidité atmosphérique
+    clouds = weather_data.get("clouds", {}).get("all", 0)  # Couverture nuageuse
+
+    # Estimer l'humidité du sol basée sur l'humidité atmosphérique
+    # et la pression (indicateur approximatif de conditions météo)
+    pressure = main.get("pressure", 1013)
+    soil_moisture = max(20, min(70, humidity - 10 + (pressure - 1013) / 10))
+
+    # NDVI approximatif basé sur la couverture nuageuse et la saison
+    # (très approximatif, juste pour avoir des données)
+    current_month = datetime.now().month
+    season_factor = 0.8 if 4 <= current_month <= 9 else 0.5  # Été vs hiver
+    ndvi = (1 - clouds / 200) * season_factor  # Entre 0 et ~0.8
+
+    # Precipitation des dernières 24h (approximation)
+    rain_1h = weather_data.get("rain", {}).get("1h", 0)
+    rain_3h = weather_data.get("rain", {}).get("3h", 0)
+    precipitation = rain_3h if rain_3h > 0 else rain_1h * 3
+
+    climate_data = {
+        "soilMoisture": round(soil_moisture, 1),
+        "ndvi": round(ndvi, 2),
+        "precipitation": round(precipitation, 1)
+    }
+
+    return climate_data
+
+
+def analyze_soil(weather_data, air_data):
+    """Analyse de sol dérivée de la météo et de la qualité de l'air"""
+    # Créer des données de sol basées sur une combinaison de facteurs
+    # météo, prévisions et qualité de l'air
+    main = weather_data.get("main", {})
+    humidity = main.get("humidity", 50)
+
+    # Facteurs de pollution
+    pollution = {}
+    if "list" in air_data and len(air_data["list"]) > 0:
+        pollution = air_data["list"][0].get("components", {})
+
+    # Génération de données de sol cohérentes avec les conditions météo
+    properties = soil.soil_properties(
+        temp=main.get("temp", 15),
+        humidity=humidity,
+        wind=weather_data.get("wind", {}).get("speed", 3),
+        rain_mm=weather_data.get("rain", {}).get("1h", 0),
+        so2=pollution.get("so2", 0),
+        month=datetime.now().month,
+    )
+    soil_data = {name: float(properties[name]) for name in soil.PROPERTIES}
+
+    # Générer des recommandations basées sur ces valeurs
+    soil_data["recommendations"] = soil.recommendations(soil_data["ph_level"], soil_data["nitrogen"], humidity)
+
+    return soil_data
+
+
+def build_dashboard(lat, lon, sections):
+    """
+    Construit les sections demandées du tableau de bord à partir d'un seul
+    jeu d'appels : la météo sert à la fois aux sections weather, climate
+    (fallback) et soil, la qualité de l'air à airquality et soil.
+    """
+    calls = {}
+    if set(sections) & {"weather", "climate", "soil"}:
+        calls["weather"] = lambda: get_current_weather(lat, lon)
+    if set(sections) & {"airquality", "soil"}:
+        calls["air"] = lambda: get_air_pollution(lat, lon)
+    if "climate" in sections:
+        calls["agro_soil"] = lambda: get_agro_soil(lat, lon)
+    sources = upstream.fan_out(calls)
+
+    weather_data = sources.get("weather")
+    air_data = sources.get("air")
+    dashboard = {}
+
+    if "weather" in sections:
+        dashboard["weather"] = format_weather(weather_data) if weather_data else {"error": "Données météo non disponibles"}
+
+    if "airquality" in sections:
+        formatted_air = format_air_quality(air_data) if air_data else None
+        dashboard["airquality"] = formatted_air or {"error": "Données de qualité d'air non disponibles"}
+
+    if "climate" in sections:
+        agro_soil = sources.get("agro_soil")
+        if isinstance(agro_soil, dict):
+            dashboard["climate"] = format_climate(agro_soil)
+        elif weather_data:
+            dashboard["climate"] = climate_from_weather(weather_data)
+        else:
+            dashboard["climate"] = {"error": "Données climatiques non disponibles"}
+
+    if "soil" in sections:
+        if weather_data:
+            dashboard["soil"] = analyze_soil(weather_data, air_data or {})
+        else:
+            dashboard["soil"] = {"error": "Analyse de sol non disponible"}
+
+    return dashboard
@@ -0,0 +1,174 @@
+"""
+Gestion du quota d'appels vers les fournisseurs externes.
+
+Chaque fournisseur a un seau à jetons (token bucket) alimenté au rythme de
+son quota par minute. Les appels interactifs attendent brièvement un jeton ;
+les appels de faible priorité (préchargement, rattrapage) sont refusés dès
+que le budget descend sous une réserve gardée pour les utilisateurs. Une
+réponse 429 du fournisseur vide le seau jusqu'à la fin du délai indiqué.
+"""
+
+import asyncio
+import contextlib
+import contextvars
+import threading
+import time
+
+try:
+    from config import CONFIG
+except ImportError:
+    CONFIG = {}
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+
+_priority = contextvars.ContextVar("upstream_priority", default=INTERACTIVE)
+
+
+class QuotaExceeded(Exception):
+    def __init__(self, provider, retry_after=None, shed=False):
+        self.provider = provider
+        self.retry_after = retry_after
+        self.shed = shed
+        super().__init__(f"Quota {provider} épuisé")
+
+
+class TokenBucket:
+    def __init__(self, per_minute, burst=None):
+        self.rate = per_minute / 60.0
+        self.capacity = burst or per_minute
+        self.tokens = float(self.capacity)
+        self.blocked_until = 0.0
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def try_acquire(self, reserve=0):
+        """Retourne 0 si un jeton est accordé, sinon le délai estimé avant le prochain"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if now < self.blocked_until:
+                return self.blocked_until - now
+            if self.tokens - 1 >= reserve:
+                self.tokens -= 1
+                return 0
+            return (reserve + 1 - self.tokens) / self.rate
+
+    def drain(self, retry_after=None):
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = 0.0
+            self.updated_at = now
+            if retry_after:
+                self.blocked_until = max(self.blocked_until, now + retry_after)
+
+    def remaining(self):
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if now < self.blocked_until:
+                return 0
+            return int(self.tokens)
+
+
+class QuotaManager:
+    def __init__(self, settings):
+        self.settings = settings
+        self.buckets = {
+            provider: TokenBucket(options["per_minute"], options.get("burst"))
+            for provider, options in settings.items()
+        }
+        self._stats = {
+            provider: {"granted": 0, "background_granted": 0, "shed": 0, "rejected": 0, "rate_limited": 0}
+            for provider in settings
+        }
+        self._lock = threading.Lock()
+
+    def _count(self, provider, name):
+        with self._lock:
+            self._stats[provider][name] += 1
+
+    def _reserve_for(self, provider, priority):
+        if priority == INTERACTIVE:
+            return 0
+        bucket = self.buckets[provider]
+        return self.settings[provider].get("background_reserve", 0.3) * bucket.capacity
+
+    def _check(self, provider, priority):
+        """None si l'appel peut partir, sinon le délai d'attente avant un nouvel essai"""
+        wait = self.buckets[provider].try_acquire(self._reserve_for(provider, priority))
+        if wait == 0:
+            self._count(provider, "granted" if priority == INTERACTIVE else "background_granted")
+            return None
+        if priority != INTERACTIVE:
+            self._count(provider, "shed")
+            raise QuotaExceeded(provider, retry_after=wait, shed=True)
+        return wait
+
+    def acquire(self, provider):
+        if provider not in self.buckets:
+            return
+        priority = _priority.get()
+        deadline = time.monotonic() + self.settings[provider].get("max_wait", 0.5)
+        while True:
+            wait = self._check(provider, priority)
+            if wait is None:
+                return
+            if time.monotonic() + wait > deadline:
+                self._count(provider, "rejected")
+                raise QuotaExceeded(provider, retry_after=wait)
+            time.sleep(wait)
+
+    async def acquire_async(self, provider):
+        if provider not in self.buckets:
+            return
+        priority = _priority.get()
+        deadline = time.monotonic() + self.settings[provider].get("max_wait", 0.5)
+        while True:
+            wait = self._check(provider, priority)
+            if wait is None:
+                return
+            if time.monotonic() + wait > deadline:
+                self._count(provider, "rejected")
+                raise QuotaExceeded(provider, retry_after=wait)
+            await asyncio.sleep(wait)
+
+    def rate_limited(self, provider, retry_after=None):
+        """Le fournisseur a répondu 429 : plus aucun appel avant retry_after"""
+        if provider not in self.buckets:
+            return
+        self._count(provider, "rate_limited")
+        self.buckets[provider].drain(retry_after or 60)
+
+    def get_stats(self):
+        stats = {}
+        for provider, bucket in self.buckets.items():
+            with self._lock:
+                stats[provider] = dict(self._stats[provider])
+            stats[provider]["remaining"] = bucket.remaining()
+            stats[provider]["per_minute"] = self.settings[provider]["per_minute"]
+        return stats
+
+
+@contextlib.contextmanager
+def priority(level):
+    """Les appels effectués dans ce bloc ont la priorité donnée"""
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def parse_retry_after(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+manager = QuotaManager(CONFIG.get("QUOTAS", {}))
@@ -8,5 +8,10 @@ if [ -f .env ]; then
   export $(grep -v '^#' .env | xargs)
 fi
 
-# Démarrer le serveur Flask
-python main.py 
\ No newline at end of file
+# Démarrer le serveur : SERVER_MODE=async pour le mode ASGI (boucle d'événements),
+# sinon serveur Flask synchrone
+if [ "$SERVER_MODE" = "async" ]; then
+  python asgi_app.py
+else
+  python main.py
+fi 
\ No newline at end of file
@@ -0,0 +1,132 @@
+"""
+Second niveau de cache persistant sur disque (SQLite en mode WAL).
+
+Les caches en mémoire y écrivent chaque valeur chargée depuis un fournisseur
+(write-through) et le consultent avant de repartir vers l'amont. Au
+démarrage, les entrées encore valides sont rechargées en mémoire : un
+redémarrage ne se traduit plus par une rafale d'appels limitée par le quota.
+Les lignes expirées sont supprimées en arrière-plan.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+class SnapshotStore:
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS snapshots ("
+            " namespace TEXT NOT NULL,"
+            " key TEXT NOT NULL,"
+            " value TEXT NOT NULL,"
+            " stored_at REAL NOT NULL,"
+            " expires_at REAL NOT NULL,"
+            " PRIMARY KEY (namespace, key)"
+            ") WITHOUT ROWID"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS snapshots_expires_at ON snapshots (expires_at)")
+        self._lock = threading.Lock()
+        self._compactor = None
+        self._stats = {"reads": 0, "hits": 0, "writes": 0, "errors": 0, "compacted": 0}
+
+    def get(self, namespace, key):
+        """Retourne (valeur, stocké_à) ou None si absente ou expirée"""
+        try:
+            with self._lock:
+                self._stats["reads"] += 1
+                row = self._conn.execute(
+                    "SELECT value, stored_at FROM snapshots WHERE namespace = ? AND key = ? AND expires_at > ?",
+                    (namespace, key, time.time()),
+                ).fetchone()
+                if row is not None:
+                    self._stats["hits"] += 1
+        except sqlite3.Error as e:
+            self._error("lecture", e)
+            return None
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def put(self, namespace, key, value, stored_at, expires_at):
+        try:
+            payload = json.dumps(value)
+            with self._lock:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO snapshots (namespace, key, value, stored_at, expires_at) VALUES (?, ?, ?, ?, ?)",
+                    (namespace, key, payload, stored_at, expires_at),
+                )
+                self._stats["writes"] += 1
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            self._error("écriture", e)
+
+    def delete(self, namespace, key):
+        try:
+            with self._lock:
+                self._conn.execute("DELETE FROM snapshots WHERE namespace = ? AND key = ?", (namespace, key))
+        except sqlite3.Error as e:
+            self._error("suppression", e)
+
+    def load(self, namespace, limit):
+        """Entrées encore valides d'un espace de noms, des plus anciennes aux plus récentes"""
+        try:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT key, value, stored_at FROM ("
+                    " SELECT key, value, stored_at FROM snapshots"
+                    " WHERE namespace = ? AND expires_at > ?"
+                    " ORDER BY stored_at DESC LIMIT ?"
+                    ") ORDER BY stored_at ASC",
+                    (namespace, time.time(), limit),
+                ).fetchall()
+        except sqlite3.Error as e:
+            self._error("chargement", e)
+            return []
+        return [(key, json.loads(value), stored_at) for key, value, stored_at in rows]
+
+    def compact(self):
+        try:
+            with self._lock:
+                deleted = self._conn.execute("DELETE FROM snapshots WHERE expires_at <= ?", (time.time(),)).rowcount
+                self._stats["compacted"] += deleted
+                if deleted:
+                    self._conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+            return deleted
+        except sqlite3.Error as e:
+            self._error("compaction", e)
+            return 0
+
+    def start_compaction(self, interval=600):
+        if self._compactor is not None:
+            return
+
+        def run():
+            while True:
+                time.sleep(interval)
+                self.compact()
+
+        self._compactor = threading.Thread(target=run, name="snapshot-compaction", daemon=True)
+        self._compactor.start()
+
+    def _error(self, operation, error):
+        with self._lock:
+            self._stats["errors"] += 1
+        print(f"Erreur {operation} cache disque ({self.path}): {str(error)}")
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        try:
+            stats["size_bytes"] = os.path.getsize(self.path)
+        except OSError:
+            stats["size_bytes"] = 0
+        return stats
@@ -0,0 +1,199 @@
+"""
+Formules d'analyse de sol, vectorisées avec NumPy.
+
+Les mêmes formules servent à l'analyse ponctuelle (/api/soil-analysis,
+entrées scalaires) et à la carte d'une parcelle entière
+(/api/soil-analysis/grid, une valeur par maille). Pour la carte, la météo
+et la qualité de l'air sont communes à toutes les mailles ; la variabilité
+intra-parcellaire vient du NDVI de chaque maille lorsqu'une scène couvre la
+parcelle (estimation approximative, comme le reste de l'analyse).
+"""
+
+import math
+
+import numpy as np
+
+import geometry
+
+PROPERTIES = ("ph_level", "nitrogen", "phosphorus", "potassium", "organic_matter")
+
+# Effet d'un écart de NDVI à la moyenne de la parcelle :
+# végétation plus dense -> sol plus humide et plus riche en matière organique
+NDVI_HUMIDITY_FACTOR = 30
+NDVI_ORGANIC_FACTOR = 2
+
+
+def soil_properties(temp, humidity, wind, rain_mm, so2, month, organic_offset=0):
+    """Propriétés du sol ; chaque entrée peut être un scalaire ou un tableau"""
+    temp = np.asarray(temp, dtype=np.float64)
+    humidity = np.asarray(humidity, dtype=np.float64)
+    wind = np.asarray(wind, dtype=np.float64)
+    rain_mm = np.asarray(rain_mm, dtype=np.float64)
+
+    # Le pH est influencé par les pluies (acidification) et pollution
+    ph_rain_factor = np.where(rain_mm > 0, -0.02 * rain_mm, 0)
+    ph_pollution_factor = -0.01 * (so2 / 10)  # SO2 acidifie
+    ph_level = np.round(np.clip(6.8 + ph_rain_factor + ph_pollution_factor, 5.5, 7.5), 1)
+
+    # Azote: influencé par l'humidité, la température (activité microbienne)
+    nitrogen = np.round(np.clip(0.25 + 0.1 * (humidity / 100) + 0.05 * ((temp - 10) / 20), 0.1, 0.6), 2)
+
+    # Phosphore: plus stable, mais influencé par pH (optimal à pH 6.5)
+    phosphorus = np.round(np.clip(25 + 5 * (1 - np.abs(ph_level - 6.5) / 2), 10, 50), 1)
+
+    # Potassium: influencé par l'humidité et érosion (vent)
+    potassium = np.round(np.clip(150 + 20 * (humidity / 100) - 5 * (wind / 5), 100, 300), 1)
+
+    # Matière organique: fonction de la saison (printemps-été-automne)
+    organic_season_factor = 0.5 if 3 <= month <= 10 else -0.5
+    organic_matter = np.round(np.clip(3.0 + organic_season_factor + organic_offset, 1.5, 6.0), 1)
+
+    shape = np.broadcast(ph_level, nitrogen, phosphorus, potassium, organic_matter).shape
+    return {
+        "ph_level": np.broadcast_to(ph_level, shape),
+        "nitrogen": np.broadcast_to(nitrogen, shape),
+        "phosphorus": np.broadcast_to(phosphorus, shape),
+        "potassium": np.broadcast_to(potassium, shape),
+        "organic_matter": np.broadcast_to(organic_matter, shape),
+    }
+
+
+def recommendations(ph_level, nitrogen, humidity):
+    recommendations = []
+
+    if ph_level < 6.0:
+        recommendations.append("Le sol est acide, envisager un chaulage pour augmenter le pH")
+    elif ph_level > 7.2:
+        recommendations.append("Le sol est alcalin, privilégier des cultures adaptées ou des amendements acidifiants")
+
+    if nitrogen < 0.2:
+        recommendations.append("Niveau d'azote faible, envisager un apport d'engrais azotés ou de légumineuses")
+    elif nitrogen > 0.4:
+        recommendations.append("Bon niveau d'azote, limiter les apports supplémentaires")
+
+    if humidity > 70:
+        recommendations.append("Humidité élevée, surveiller les risques de maladies fongiques")
+    elif humidity < 40:
+        recommendations.append("Conditions sèches, optimiser l'irrigation")
+
+    # Limiter à 3 recommandations maximum
+    if len(recommendations) > 3:
+        recommendations = recommendations[:3]
+    elif len(recommendations) < 2:
+        recommendations.append("Surveiller les conditions météo et ajuster les pratiques culturales en conséquence")
+
+    return recommendations
+
+
+def build_grid(shape, cell_size):
+    """Centres des mailles (lons, lats du nord au sud) et masque des mailles dans la parcelle"""
+    min_lon, min_lat, max_lon, max_lat = geometry.bbox(shape)
+    center_lat = (min_lat + max_lat) / 2
+    lat_step = cell_size / geometry.METERS_PER_DEGREE
+    lon_step = cell_size / (geometry.METERS_PER_DEGREE * math.cos(math.radians(center_lat)))
+    cols = max(1, math.ceil((max_lon - min_lon) / lon_step))
+    rows = max(1, math.ceil((max_lat - min_lat) / lat_step))
+    lons = min_lon + (np.arange(cols) + 0.5) * lon_step
+    lats = max_lat - (np.arange(rows) + 0.5) * lat_step
+    mask = geometry.grid_mask(geometry.ring_edges(shape), lons, lats)
+    return lons, lats, mask, (lon_step, lat_step)
+
+
+def grid_size(bbox, cell_size):
+    """(lignes, colonnes) de la grille de l'emprise, avant tout calcul (pour borner son coût)"""
+    min_lon, min_lat, max_lon, max_lat = bbox
+    height = (max_lat - min_lat) * geometry.METERS_PER_DEGREE
+    width = (max_lon - min_lon) * geometry.METERS_PER_DEGREE * math.cos(math.radians((min_lat + max_lat) / 2))
+    return max(1, math.ceil(height / cell_size)), max(1, math.ceil(width / cell_size))
+
+
+def grid_cell_count(bbox, cell_size):
+    """Nombre de mailles de l'emprise"""
+    rows, cols = grid_size(bbox, cell_size)
+    return rows * cols
+
+
+def mask_work(bbox, cell_size, edges):
+    """Croisements lignes x arêtes évalués au pire par grid_mask pour cette grille"""
+    return grid_size(bbox, cell_size)[0] * edges
+
+
+def _runs(mask):
+    """Mailles de la parcelle en plages [indice de départ, longueur] (indices ligne par ligne)"""
+    flat = np.concatenate(([False], mask.ravel(), [False])).astype(np.int8)
+    changes = np.flatnonzero(np.diff(flat))
+    starts, stops = changes[::2], changes[1::2]
+    return np.stack([starts, stops - starts], axis=1).tolist()
+
+
+def _summary(values):
+    p10, p50, p90 = np.percentile(values, (10, 50, 90))
+    return {
+        "min": round(float(values.min()), 2),
+        "max": round(float(values.max()), 2),
+        "mean": round(float(values.mean()), 2),
+        "std": round(float(values.std()), 3),
+        "p10": round(float(p10), 2),
+        "p50": round(float(p50), 2),
+        "p90": round(float(p90), 2),
+    }
+
+
+def analyze_grid(shape, cell_size, weather_data, air_data, month, ndvi_values=None):
+    """
+    Carte de sol de la parcelle. ndvi_values(lons, lats) -> tableau NDVI
+    (NaN sans donnée) ou None si aucune scène ne couvre la parcelle.
+    """
+    lons, lats, mask, (lon_step, lat_step) = build_grid(shape, cell_size)
+    if not mask.any():
+        raise geometry.InvalidGeometry("Aucune maille dans la parcelle, réduire cell_size")
+
+    main = weather_data.get("main", {})
+    humidity = np.full(mask.shape, float(main.get("humidity", 50)))
+    organic_offset = np.zeros(mask.shape)
+
+    ndvi_grid = ndvi_values(lons, lats) if ndvi_values is not None else None
+    if ndvi_grid is not None:
+        inside = ndvi_grid[mask]
+        if np.isfinite(inside).any():
+            anomaly = np.nan_to_num(ndvi_grid - np.nanmean(inside))
+            humidity = np.clip(humidity + NDVI_HUMIDITY_FACTOR * anomaly, 0, 100)
+            organic_offset = NDVI_ORGANIC_FACTOR * anomaly
+        else:
+            ndvi_grid = None
+
+    pollution = {}
+    if "list" in air_data and len(air_data["list"]) > 0:
+        pollution = air_data["list"][0].get("components", {})
+
+    properties = soil_properties(
+        temp=main.get("temp", 15),
+        humidity=humidity,
+        wind=weather_data.get("wind", {}).get("speed", 3),
+        rain_mm=weather_data.get("rain", {}).get("1h", 0),
+        so2=pollution.get("so2", 0),
+        month=month,
+        organic_offset=organic_offset,
+    )
+
+    # Valeurs des seules mailles dans la parcelle, dans l'ordre des plages (runs)
+    values = {name: properties[name][mask] for name in PROPERTIES}
+    summary = {name: _summary(values[name]) for name in PROPERTIES}
+    mean_humidity = float(humidity[mask].mean())
+
+    return {
+        "grid": {
+            "rows": int(mask.shape[0]),
+            "cols": int(mask.shape[1]),
+            "cell_size": cell_size,
+            # Coin nord-ouest de la grille et pas en degrés
+            "origin": [round(float(lons[0] - lon_step / 2), 7), round(float(lats[0] + lat_step / 2), 7)],
+            "step": [round(lon_step, 9), round(lat_step, 9)],
+            "cells": int(mask.sum()),
+        },
+        "runs": _runs(mask),
+        "values": {name: column.tolist() for name, column in values.items()},
+        "summary": summary,
+        "ndvi_driven": ndvi_grid is not None,
+        "recommendations": recommendations(summary["ph_level"]["mean"], summary["nitrogen"]["mean"], mean_humidity),
+    }
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Les modules de l'API sont à plat dans api/ (lancés depuis ce dossier)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
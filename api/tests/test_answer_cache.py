@@ -0,0 +1,28 @@
+import pytest
+
+from answer_cache import AnswerCache, normalize
+
+
+# Questions voisines mais de sens différent : clés distinctes
+@pytest.mark.parametrize("first, second", [
+    ("Quand planter le riz ?", "Comment planter le riz ?"),
+    ("Quand planter le riz ?", "Où planter le riz ?"),
+    ("Faut-il irriguer le maïs ?", "Ne faut-il pas irriguer le maïs ?"),
+    ("Faut-il irriguer le maïs ?", "Faut-il trop irriguer le maïs ?"),
+    ("Combien d'engrais pour le blé ?", "Pourquoi de l'engrais pour le blé ?"),
+    ("Arroser sans pluie ?", "Arroser avec pluie ?"),
+])
+def test_distinct_questions_have_distinct_keys(first, second):
+    assert normalize(first) != normalize(second)
+
+
+def test_word_order_and_stopwords_do_not_change_key():
+    assert normalize("Quand faut-il irriguer le maïs ?") == normalize("Le maïs, quand faut-il l'irriguer ?")
+
+
+def test_near_match_requires_same_markers():
+    cache = AnswerCache()
+    cache.put("Faut-il irriguer le maïs ?", "Oui")
+    assert cache.get("Ne faut-il pas irriguer le maïs ?") is None
+    assert cache.get("Faut-il trop irriguer le maïs ?") is None
+    assert cache.get("Faut-il irriguer les maïs ?") == "Oui"
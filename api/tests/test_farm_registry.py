@@ -0,0 +1,104 @@
+import random
+
+import pytest
+
+from farm_registry import FarmRegistry, decode_cursor, encode_cursor, haversine_km, ID_KEY, DISTANCE_KEY
+
+
+def square(lon, lat, size=0.001):
+    return [[lon, lat], [lon + size, lat], [lon + size, lat + size], [lon, lat + size]]
+
+
+@pytest.fixture
+def registry(tmp_path):
+    registry = FarmRegistry(str(tmp_path / "farms.db"))
+    rng = random.Random(0)
+    for index in range(120):
+        lon, lat = 2 + rng.uniform(0, 0.5), 45 + rng.uniform(0, 0.5)
+        registry.add("owner", f"Ferme {index}", polygon=square(lon, lat), farm_id=f"farm_{index:03d}")
+    registry.add("other", "Voisine", location={"lat": 45.2, "lon": 2.2}, farm_id="farm_other")
+    return registry
+
+
+def pages(query, **kwargs):
+    """Toutes les pages d'une requête, en suivant les curseurs"""
+    results, cursor = [], None
+    while True:
+        page, cursor = query(limit=7, cursor=cursor, **kwargs)
+        assert len(page) <= 7
+        results.extend(page)
+        if cursor is None:
+            return results
+
+
+@pytest.mark.parametrize("bbox", [None, [2.1, 45.1, 2.3, 45.3], [-10, 30, 20, 60]])
+def test_search_pages_cover_every_farm_once_in_id_order(registry, bbox):
+    farms = pages(lambda **kwargs: registry.search("owner", bbox=bbox, **kwargs))
+    ids = [farm["id"] for farm in farms]
+    assert ids == sorted(set(ids))
+    expected = [
+        farm_id for farm_id, record in sorted(registry._farms.items())
+        if record["owner_id"] == "owner" and (bbox is None or (
+            record["min_lon"] <= bbox[2] and record["max_lon"] >= bbox[0]
+            and record["min_lat"] <= bbox[3] and record["max_lat"] >= bbox[1]))
+    ]
+    assert ids == expected
+
+
+def test_near_pages_are_sorted_by_distance(registry):
+    farms = pages(lambda **kwargs: registry.near("owner", 45.25, 2.25, 15, **kwargs))
+    keys = [(farm["distance_km"], farm["id"]) for farm in farms]
+    assert keys == sorted(keys) and len(set(keys)) == len(keys)
+    expected = {
+        farm_id for farm_id, record in registry._farms.items()
+        if record["owner_id"] == "owner" and haversine_km(45.25, 2.25, record["lat"], record["lon"]) <= 15
+    }
+    assert {farm["id"] for farm in farms} == expected
+
+
+def test_page_is_stable_when_farms_are_added_before_cursor(registry):
+    first, cursor = registry.search("owner", limit=10)
+    registry.add("owner", "Nouvelle", polygon=square(2.1, 45.1), farm_id="farm_000a")
+    second, _ = registry.search("owner", limit=10, cursor=cursor)
+    assert second[0]["id"] > first[-1]["id"]
+    assert "farm_000a" not in [farm["id"] for farm in second]
+
+
+def test_search_by_point_uses_polygon(registry):
+    record = registry._farms["farm_010"]
+    inside, _ = registry.search("owner", point=(record["min_lat"] + 0.0005, record["min_lon"] + 0.0005))
+    assert "farm_010" in [farm["id"] for farm in inside]
+    outside, _ = registry.search("owner", point=(record["min_lat"] - 0.0005, record["min_lon"] - 0.0005))
+    assert "farm_010" not in [farm["id"] for farm in outside]
+
+
+def test_owners_are_isolated(registry):
+    assert [farm["id"] for farm in pages(lambda **kwargs: registry.search("other", **kwargs))] == ["farm_other"]
+    assert registry.get("owner", "farm_other") is None
+
+
+@pytest.mark.parametrize("cursor, types", [
+    ("not-base64!", ID_KEY),
+    (encode_cursor({"id": "farm_001"}), ID_KEY),
+    (encode_cursor([1.5, "farm_001"]), ID_KEY),
+    (encode_cursor(["farm_001"]), DISTANCE_KEY),
+    (encode_cursor([True, "farm_001"]), DISTANCE_KEY),
+])
+def test_mismatched_cursors_are_rejected(cursor, types):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor, types)
+
+
+def test_cursor_from_another_query_is_rejected(registry):
+    _, near_cursor = registry.near("owner", 45.25, 2.25, 50, limit=5)
+    with pytest.raises(ValueError):
+        registry.search("owner", limit=5, cursor=near_cursor)
+    _, search_cursor = registry.search("owner", limit=5)
+    with pytest.raises(ValueError):
+        registry.near("owner", 45.25, 2.25, 50, limit=5, cursor=search_cursor)
+
+
+def test_registry_reloads_from_disk(registry, tmp_path):
+    reloaded = FarmRegistry(str(tmp_path / "farms.db"))
+    assert pages(lambda **kwargs: reloaded.search("owner", **kwargs)) == pages(
+        lambda **kwargs: registry.search("owner", **kwargs))
@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+
+import geometry
+
+OUTER = [[0, 0], [1, 0], [1, 1], [0, 1]]
+HOLE = [[0.2, 0.2], [0.2, 0.6], [0.6, 0.6], [0.6, 0.2]]
+
+
+def point_in_rings(rings, x, y):
+    """Référence : règle pair-impair, point par point"""
+    inside = False
+    for ring in rings:
+        for (x0, y0), (x1, y1) in zip(ring, ring[1:] + ring[:1]):
+            if (y0 <= y) != (y1 <= y) and x < x0 + (y - y0) * (x1 - x0) / (y1 - y0):
+                inside = not inside
+    return inside
+
+
+@pytest.mark.parametrize("budget", [1, 7, 64, geometry.MASK_BUDGET])
+def test_grid_mask_matches_point_tests_with_hole(budget):
+    rng = np.random.default_rng(0)
+    lons = rng.uniform(-0.1, 1.1, 60)
+    lats = rng.uniform(-0.1, 1.1, 40)
+    shape = geometry.parse([OUTER, HOLE])
+    mask = geometry.grid_mask(geometry.ring_edges(shape), lons, lats, budget=budget)
+    expected = [[point_in_rings([OUTER, HOLE], x, y) for x in lons] for y in lats]
+    assert mask.tolist() == expected
+
+
+def test_grid_mask_multipolygon():
+    second = [[2, 0], [3, 0], [3, 1], [2, 1]]
+    shape = geometry.parse([[OUTER], [second]])
+    mask = geometry.grid_mask(geometry.ring_edges(shape), np.array([0.5, 1.5, 2.5]), np.array([0.5]))
+    assert mask.tolist() == [[True, False, True]]
+
+
+def test_measure_subtracts_holes():
+    lat = 45.0
+    scale = 0.001
+    outer = [[x * scale, lat + y * scale] for x, y in OUTER]
+    hole = [[x * scale, lat + y * scale] for x, y in HOLE]
+    full = geometry.measure(geometry.parse(outer))
+    holed = geometry.measure(geometry.parse([outer, hole]))
+    assert holed["area_m2"] == pytest.approx(full["area_m2"] * (1 - 0.16), rel=1e-3)
+
+
+def test_canonical_hash_ignores_orientation_and_start():
+    ring = [[2.0, 45.0], [2.01, 45.0], [2.01, 45.01], [2.0, 45.01]]
+    rotated = ring[2:] + ring[:2]
+    closed_reversed = list(reversed(ring)) + [ring[-1]]
+    hashes = {geometry.canonical_hash(geometry.parse(r)) for r in (ring, rotated, closed_reversed)}
+    assert len(hashes) == 1
+
+
+@pytest.mark.parametrize("polygon, message", [
+    ([[0, 0], [1, 1]], "au moins 3 sommets"),
+    ([[0, 0], [200, 0], [0, 1]], "hors limites"),
+    ([[0, 0], [1, 1], [1, 0], [0, 1]], "se recoupe"),
+    ([OUTER, [[0.2, 0.2], [0.6, 0.6], [0.6, 0.2], [0.2, 0.6]]], "se recoupe"),
+])
+def test_validate_rejects(polygon, message):
+    with pytest.raises(geometry.InvalidGeometry, match=message):
+        geometry.validate(geometry.parse(polygon))
+
+
+def test_validate_rejects_too_many_vertices():
+    angles = np.linspace(0, 2 * np.pi, 50, endpoint=False)
+    ring = np.stack([np.cos(angles), np.sin(angles)], axis=1).tolist()
+    with pytest.raises(geometry.InvalidGeometry, match="trop détaillé"):
+        geometry.validate(geometry.parse(ring), max_vertices=40)
+
+
+def test_validate_simplifies_detailed_rings():
+    # Cercle de 1 km finement échantillonné : simplifié sous la limite de la recherche d'auto-intersections
+    angles = np.linspace(0, 2 * np.pi, 8000, endpoint=False)
+    ring = np.stack([2 + 0.01 * np.cos(angles), 45 + 0.01 * np.sin(angles)], axis=1)
+    shape = geometry.validate(geometry.parse(ring.tolist()))
+    assert len(shape[0][0]) <= geometry.MAX_SIMPLE_CHECK_VERTICES
+
+
+def test_validate_rejects_ring_still_detailed_after_simplification():
+    # Zigzag plus large que la tolérance : rien à simplifier
+    count = geometry.MAX_SIMPLE_CHECK_VERTICES + 2
+    angles = np.linspace(0, 2 * np.pi, count, endpoint=False)
+    radius = 0.01 * (1 + 0.05 * (np.arange(count) % 2))
+    ring = np.stack([2 + radius * np.cos(angles), 45 + radius * np.sin(angles)], axis=1)
+    with pytest.raises(geometry.InvalidGeometry, match="après simplification"):
+        geometry.validate(geometry.parse(ring.tolist()))
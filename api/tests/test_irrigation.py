@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+import irrigation
+
+
+def test_extraterrestrial_radiation_fao56_example_8():
+    # 3 septembre, 20° S : Ra = 32.2 MJ m-2 jour-1
+    assert irrigation.extraterrestrial_radiation(-20, 246) == pytest.approx(32.2, abs=0.05)
+
+
+def test_saturation_vapour_pressure_fao56_table():
+    assert irrigation.saturation_vapour_pressure(25.0) == pytest.approx(3.168, abs=0.001)
+
+
+def test_penman_monteith_fao56_example_18():
+    # Bruxelles, 6 juillet : ET0 = 3.9 mm/jour (ensoleillement n/N = 9.25/16.1 exprimé en nébulosité)
+    es = (irrigation.saturation_vapour_pressure(21.5) + irrigation.saturation_vapour_pressure(12.3)) / 2
+    et0 = irrigation.penman_monteith(
+        t_min=np.array([12.3]),
+        t_max=np.array([21.5]),
+        humidity=np.array([1.409 / es * 100]),
+        wind_10m=np.array([10 / 3.6]),
+        clouds=np.array([100 * (1 - 9.25 / 16.1)]),
+        pressure_hpa=np.array([1001.0]),
+        lat=np.array([50.8]),
+        day_of_year=np.array([187]),
+    )
+    assert et0[0] == pytest.approx(3.9, abs=0.1)
+
+
+def test_penman_monteith_grows_with_dry_air_and_wind():
+    def et0(humidity, wind):
+        return irrigation.penman_monteith(
+            np.array([15.0]), np.array([28.0]), np.array([humidity]), np.array([wind]),
+            np.array([20.0]), np.array([1013.0]), np.array([44.0]), np.array([180]),
+        )[0]
+    assert et0(30, 3) > et0(80, 3)
+    assert et0(50, 6) > et0(50, 1)
+
+
+def test_crop_coefficient_follows_stage_curve():
+    kc = np.array([[0.3, 1.2, 0.35]])
+    stages = np.array([[20.0, 35.0, 40.0, 30.0]])
+    days = np.array([[0.0, 20.0, 37.5, 55.0, 94.0, 125.0, 200.0]])
+    values = irrigation.crop_coefficient(days, kc, stages)[0]
+    assert values[0] == pytest.approx(0.3)
+    assert values[2] == pytest.approx(0.75)  # milieu du développement
+    assert values[3] == pytest.approx(1.2)
+    assert values[4] == pytest.approx(1.2)
+    assert values[5] == pytest.approx(0.35)
+    assert values[6] == pytest.approx(0.35)
+
+
+def test_water_balance_irrigates_above_raw():
+    # ETc 5 mm/jour, RAW = 0.5 x 100 mm : irrigation le 11e jour, retour à la capacité au champ
+    result = irrigation.simulate(
+        et0=np.full((1, 12), 5.0), rain=np.zeros((1, 12)), kc=np.ones((1, 12)),
+        taw=np.array([100.0]), p=np.array([0.5]), initial_depletion=np.array([0.0]), efficiency=np.array([0.8]),
+    )
+    assert result["net"][0].tolist() == [0] * 10 + [55.0, 0]
+    assert result["depletion"][0, -1] == pytest.approx(5.0)
+    assert result["gross"].sum() == pytest.approx(55.0 / 0.8)
+
+
+def test_water_balance_stress_reduces_etc():
+    # Épuisement 50 mm > RAW 20 mm : Ks = (100 - 50) / (0.8 x 100) = 0.625
+    result = irrigation.simulate(
+        et0=np.array([[5.0]]), rain=np.zeros((1, 1)), kc=np.ones((1, 1)),
+        taw=np.array([100.0]), p=np.array([0.2]), initial_depletion=np.array([0.5]), efficiency=np.array([1.0]),
+    )
+    assert result["etc"][0, 0] == pytest.approx(3.125)
+    assert result["net"][0, 0] == pytest.approx(53.125)
+
+
+def test_water_balance_percolation():
+    # Pluie efficace (80 %) au-delà de la capacité au champ : percolation profonde
+    result = irrigation.simulate(
+        et0=np.array([[5.0, 5.0]]), rain=np.array([[0.0, 100.0]]), kc=np.ones((1, 2)),
+        taw=np.array([100.0]), p=np.array([0.5]), initial_depletion=np.array([0.1]), efficiency=np.array([1.0]),
+    )
+    assert result["percolation"][0] == pytest.approx(0.8 * 100 - 15 - 5)
+    assert result["depletion"][0, -1] == 0
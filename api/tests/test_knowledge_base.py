@@ -0,0 +1,65 @@
+import math
+
+import pytest
+
+import knowledge_base
+from knowledge_base import KnowledgeBase, tokenize
+
+ENTRIES = [
+    {"id": "riz", "questions": ["Quand planter le riz ?"], "keywords": ["riz", "semis"], "answer": "Riz : en saison des pluies."},
+    {"id": "mais", "questions": ["Comment irriguer le maïs ?"], "keywords": ["maïs", "irrigation"], "answer": "Maïs : goutte à goutte."},
+    {"id": "engrais", "questions": ["Quel engrais pour le blé ?"], "keywords": ["engrais", "blé"],
+     "answer": "Blé : engrais azoté au tallage, le riz et le maïs ont d'autres besoins."},
+]
+
+
+@pytest.fixture
+def kb():
+    return KnowledgeBase(ENTRIES)
+
+
+def test_tokenize_folds_accents_stopwords_and_plurals():
+    assert tokenize("Les tomates de l'été") == ["tomate", "ete"]
+    # maïs, distinct de « mais », et engrais ne perdent pas leur s
+    assert tokenize("maïs engrais") == ["mais", "engrais"]
+
+
+def test_search_ranks_matching_entry_first(kb):
+    assert kb.search("planter du riz")[0][1]["id"] == "riz"
+    assert kb.search("irrigation du maïs")[0][1]["id"] == "mais"
+    assert kb.search("quel engrais ?")[0][1]["id"] == "engrais"
+
+
+def test_questions_and_keywords_outweigh_answer_text(kb):
+    # « riz » figure aussi dans la réponse sur l'engrais, avec un poids 1 seulement
+    ranking = [entry["id"] for _, entry in kb.search("riz", limit=3)]
+    assert ranking == ["riz", "engrais"]
+
+
+def test_scores_match_bm25_formula(kb):
+    documents = [kb._document_terms(entry) for entry in ENTRIES]
+    lengths = [sum(document.values()) for document in documents]
+    average = sum(lengths) / len(lengths)
+    matches = [index for index, document in enumerate(documents) if "riz" in document]
+    idf = math.log(1 + (len(ENTRIES) - len(matches) + 0.5) / (len(matches) + 0.5))
+    frequency = documents[0]["riz"]
+    norm = knowledge_base.K1 * (1 - knowledge_base.B + knowledge_base.B * lengths[0] / average)
+    expected = idf * frequency * (knowledge_base.K1 + 1) / (frequency + norm)
+    assert kb.search("riz")[0][0] == pytest.approx(expected, rel=1e-5)
+
+
+def test_unknown_terms_and_min_score(kb):
+    assert kb.search("tracteur") == []
+    assert kb.answer("tracteur") is None
+    assert kb.answer("riz", min_score=1000) is None
+    assert kb.answer("riz") == ENTRIES[0]["answer"]
+
+
+def test_index_reloaded_from_disk_and_rebuilt_when_corpus_changes(tmp_path):
+    path = str(tmp_path / "index.npz")
+    built = KnowledgeBase(ENTRIES, path)
+    loaded = KnowledgeBase(ENTRIES, path)
+    assert loaded.search("riz")[0][0] == pytest.approx(built.search("riz")[0][0])
+
+    changed = ENTRIES + [{"id": "tomate", "questions": ["Tailler les tomates ?"], "keywords": [], "answer": "Oui."}]
+    assert KnowledgeBase(changed, path).search("tomate")[0][1]["id"] == "tomate"
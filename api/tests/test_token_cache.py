@@ -0,0 +1,65 @@
+import time
+
+from token_cache import BloomFilter, RevocationList, VerifiedTokens, token_hash
+from user_store import UserStore
+
+
+def test_token_hash_is_stable_and_short():
+    assert token_hash("abc") == token_hash("abc")
+    assert token_hash("abc") != token_hash("abd")
+    assert len(token_hash("abc")) == 16
+
+
+def test_verified_tokens_lru_and_expiry():
+    cache = VerifiedTokens(max_entries=2)
+    now = time.time()
+    cache.put(b"a", {"user_id": "1"}, now + 60)
+    cache.put(b"b", {"user_id": "2"}, now + 60)
+    assert cache.get(b"a") == {"user_id": "1"}
+    # « a » vient d'être lu : « b » est le moins récent
+    cache.put(b"c", {"user_id": "3"}, now + 60)
+    assert cache.get(b"b") is None
+    assert cache.get(b"a") is not None
+
+    cache.put(b"old", {"user_id": "4"}, now - 1)
+    assert cache.get(b"old") is None
+    stats = cache.get_stats()
+    # « old » a évincé « a », puis a été retiré à la lecture (expiré)
+    assert stats["evictions"] == 2 and stats["entries"] == 1
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(1000, 0.01)
+    keys = [token_hash(f"token-{i}") for i in range(1000)]
+    for key in keys:
+        bloom.add(key)
+    assert all(key in bloom for key in keys)
+    others = [token_hash(f"other-{i}") for i in range(5000)]
+    false_positives = sum(key in bloom for key in others)
+    assert false_positives < 5000 * 0.03
+
+
+def test_revocation_is_exact_and_expires():
+    revoked = RevocationList(capacity=100)
+    key = token_hash("revoked")
+    revoked.revoke(key, time.time() + 60)
+    assert revoked.is_revoked(key)
+    assert not revoked.is_revoked(token_hash("valid"))
+
+    expired = token_hash("expired")
+    revoked.revoke(expired, time.time() - 1)
+    assert not revoked.is_revoked(expired)
+    assert revoked.purge() == 1
+    assert revoked.is_revoked(key)
+    assert revoked.get_stats()["entries"] == 1
+
+
+def test_revocations_survive_restart(tmp_path):
+    store = UserStore(str(tmp_path / "users.db"))
+    key = token_hash("logged-out")
+    RevocationList(store=store).revoke(key, time.time() + 60)
+    RevocationList(store=store).revoke(token_hash("stale"), time.time() - 1)
+
+    reloaded = RevocationList(store=store)
+    assert reloaded.is_revoked(key)
+    assert reloaded.get_stats()["entries"] == 1
@@ -0,0 +1,276 @@
+"""
+Historique météo par emplacement de ferme.
+
+Chaque observation récupérée auprès d'OpenWeather est ajoutée à une série
+(colonnes array('d'), en ajout seul) et agrégée au fil de l'eau dans des
+cumuls horaires, journaliers et hebdomadaires (min, max, moyenne, cumul de
+précipitations). Une requête de plage lit directement les cumuls par
+recherche dichotomique : O(nombre de buckets), sans appel amont. Les données
+plus anciennes que la rétention de chaque niveau sont compactées.
+"""
+
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+
+from cache import geohash_encode
+
+FIELDS = ("temperature", "humidity", "pressure", "wind_speed")
+
+RESOLUTIONS = {
+    "hourly": 3600,
+    "daily": 86400,
+    "weekly": 7 * 86400,
+}
+
+# Période renvoyée par défaut quand "from" n'est pas fourni
+DEFAULT_SPANS = {
+    "hourly": 2 * 86400,
+    "daily": 30 * 86400,
+    "weekly": 26 * 7 * 86400,
+}
+
+# Le 1er janvier 1970 est un jeudi : décalage pour aligner les semaines sur le lundi
+_WEEK_OFFSET = 4 * 86400
+
+# Durée maximale couverte par une mesure de pluie "1h"
+_MAX_RAIN_INTERVAL = 3600
+
+
+def rain_amount(rain_rate, timestamp, previous):
+    """
+    La pluie "1h" est une intensité : elle est répartie sur l'intervalle écoulé
+    depuis l'observation précédente (au plus une heure, 10 minutes sans précédente)
+    """
+    interval = min(timestamp - previous, _MAX_RAIN_INTERVAL) if previous is not None else 600
+    return rain_rate * interval / 3600
+
+
+def bucket_start(timestamp, resolution):
+    width = RESOLUTIONS[resolution]
+    offset = _WEEK_OFFSET if resolution == "weekly" else 0
+    return ((int(timestamp) - offset) // width) * width + offset
+
+
+def observation_from_weather(weather_data):
+    """Extrait une observation d'une réponse OpenWeather /weather"""
+    main = weather_data.get("main", {})
+    rain = weather_data.get("rain", {})
+    return {
+        "timestamp": weather_data.get("dt") or time.time(),
+        "temperature": main.get("temp"),
+        "humidity": main.get("humidity"),
+        "pressure": main.get("pressure"),
+        "wind_speed": weather_data.get("wind", {}).get("speed"),
+        # Intensité de pluie en mm/h
+        "rain_rate": rain.get("1h", rain.get("3h", 0) / 3),
+    }
+
+
+class Rollup:
+    """Cumuls d'une résolution : une entrée par bucket, en colonnes"""
+
+    def __init__(self, resolution):
+        self.resolution = resolution
+        self.starts = array("d")
+        self.counts = array("d")
+        self.precipitation = array("d")
+        self.columns = {
+            field: {"min": array("d"), "max": array("d"), "sum": array("d"), "count": array("d")}
+            for field in FIELDS
+        }
+
+    def add(self, timestamp, values, precipitation):
+        start = bucket_start(timestamp, self.resolution)
+        index = bisect_left(self.starts, start)
+        if index == len(self.starts) or self.starts[index] != start:
+            self._insert_bucket(index, start)
+
+        self.counts[index] += 1
+        self.precipitation[index] += precipitation
+        for field in FIELDS:
+            value = values.get(field)
+            if value is None:
+                continue
+            column = self.columns[field]
+            if column["count"][index] == 0:
+                column["min"][index] = value
+                column["max"][index] = value
+            else:
+                column["min"][index] = min(column["min"][index], value)
+                column["max"][index] = max(column["max"][index], value)
+            column["sum"][index] += value
+            column["count"][index] += 1
+
+    def add_precipitation(self, timestamp, amount):
+        """Correction du cumul de pluie du bucket de timestamp (ignorée s'il est compacté)"""
+        start = bucket_start(timestamp, self.resolution)
+        index = bisect_left(self.starts, start)
+        if index < len(self.starts) and self.starts[index] == start:
+            self.precipitation[index] += amount
+
+    def _insert_bucket(self, index, start):
+        # Cas courant : nouveau bucket en fin de série (append) ; insertion au
+        # milieu seulement pour une observation arrivée en retard
+        self.starts.insert(index, start)
+        self.counts.insert(index, 0)
+        self.precipitation.insert(index, 0)
+        for column in self.columns.values():
+            for values in column.values():
+                values.insert(index, 0)
+
+    def compact(self, cutoff):
+        index = bisect_left(self.starts, bucket_start(cutoff, self.resolution))
+        if index == 0:
+            return 0
+        for values in self._all_arrays():
+            del values[:index]
+        return index
+
+    def _all_arrays(self):
+        yield self.starts
+        yield self.counts
+        yield self.precipitation
+        for column in self.columns.values():
+            yield from column.values()
+
+    def query(self, start, end):
+        lo = bisect_left(self.starts, bucket_start(start, self.resolution))
+        hi = bisect_right(self.starts, end)
+        result = {
+            "timestamps": [int(value) for value in self.starts[lo:hi]],
+            "observations": [int(value) for value in self.counts[lo:hi]],
+            "precipitation": [round(value, 2) for value in self.precipitation[lo:hi]],
+        }
+        for field in FIELDS:
+            column = self.columns[field]
+            counts = column["count"][lo:hi]
+            result[field] = {
+                "min": [round(v, 2) if n else None for v, n in zip(column["min"][lo:hi], counts)],
+                "max": [round(v, 2) if n else None for v, n in zip(column["max"][lo:hi], counts)],
+                "mean": [round(v / n, 2) if n else None for v, n in zip(column["sum"][lo:hi], counts)],
+            }
+        return result
+
+
+class Series:
+    def __init__(self):
+        self.timestamps = array("d")
+        # Intensité de pluie gardée avec les mesures brutes : recalcul après une observation en retard
+        self.raw = {field: array("d") for field in FIELDS + ("rain_rate",)}
+        self.rollups = {resolution: Rollup(resolution) for resolution in RESOLUTIONS}
+
+    def append(self, observation):
+        timestamp = float(observation["timestamp"])
+        index = bisect_left(self.timestamps, timestamp)
+        # Même observation renvoyée par un rafraîchissement du cache : ignorée
+        if index < len(self.timestamps) and self.timestamps[index] == timestamp:
+            return False
+
+        previous = self.timestamps[index - 1] if index else None
+        rain_rate = observation.get("rain_rate") or 0
+        precipitation = rain_amount(rain_rate, timestamp, previous)
+
+        if index < len(self.timestamps):
+            # Observation en retard : l'intervalle de la suivante, crédité depuis l'ancienne
+            # précédente, commence désormais à celle-ci (recouvrement retiré des cumuls)
+            following = self.timestamps[index]
+            following_rate = self.raw["rain_rate"][index]
+            correction = (rain_amount(following_rate, following, timestamp)
+                          - rain_amount(following_rate, following, previous))
+            if correction:
+                for rollup in self.rollups.values():
+                    rollup.add_precipitation(following, correction)
+
+        # Ajout en fin de série dans le cas courant, insertion pour une observation en retard
+        self.timestamps.insert(index, timestamp)
+        for field in FIELDS:
+            value = observation.get(field)
+            self.raw[field].insert(index, float("nan") if value is None else value)
+        self.raw["rain_rate"].insert(index, rain_rate)
+
+        for rollup in self.rollups.values():
+            rollup.add(timestamp, observation, precipitation)
+        return True
+
+    def compact(self, retention, now):
+        removed = 0
+        cutoff = now - retention.get("raw", 2 * 86400)
+        index = bisect_left(self.timestamps, cutoff)
+        if index:
+            del self.timestamps[:index]
+            for values in self.raw.values():
+                del values[:index]
+            removed += index
+        for resolution, rollup in self.rollups.items():
+            removed += rollup.compact(now - retention.get(resolution, 365 * 86400))
+        return removed
+
+    def is_empty(self):
+        return not self.timestamps and not any(rollup.starts for rollup in self.rollups.values())
+
+
+class WeatherHistory:
+    def __init__(self, precision=6, retention=None, compaction_interval=3600, max_series=10000):
+        self.precision = precision
+        self.retention = retention or {}
+        self.compaction_interval = compaction_interval
+        self.max_series = max_series
+        # cellule -> série, LRU borné : toute coordonnée interrogée crée une série, mais les
+        # cellules des fermes, rafraîchies à chaque cycle de préchargement, restent les plus récentes
+        self._series = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_compaction = time.time()
+        self._stats = {"observations": 0, "duplicates": 0, "compacted": 0, "evicted": 0}
+
+    def cell(self, lat, lon):
+        return geohash_encode(lat, lon, self.precision)
+
+    def record(self, lat, lon, weather_data):
+        observation = observation_from_weather(weather_data)
+        cell = self.cell(lat, lon)
+        with self._lock:
+            series = self._series.get(cell)
+            if series is None:
+                series = self._series[cell] = Series()
+                while len(self._series) > self.max_series:
+                    self._series.popitem(last=False)
+                    self._stats["evicted"] += 1
+            self._series.move_to_end(cell)
+            if series.append(observation):
+                self._stats["observations"] += 1
+            else:
+                self._stats["duplicates"] += 1
+            if time.time() - self._last_compaction > self.compaction_interval:
+                self._compact_locked()
+
+    def _compact_locked(self):
+        now = time.time()
+        empty = []
+        for cell, series in self._series.items():
+            self._stats["compacted"] += series.compact(self.retention, now)
+            if series.is_empty():
+                empty.append(cell)
+        # Séries dont tout l'historique a expiré
+        for cell in empty:
+            del self._series[cell]
+        self._last_compaction = now
+
+    def compact(self):
+        with self._lock:
+            self._compact_locked()
+
+    def query(self, lat, lon, resolution, start, end):
+        with self._lock:
+            series = self._series.get(self.cell(lat, lon))
+            if series is None:
+                return Rollup(resolution).query(start, end)
+            return series.rollups[resolution].query(start, end)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["series"] = len(self._series)
+        return stats
@@ -0,0 +1,158 @@
+"""
+Chemin rapide de l'authentification.
+
+- VerifiedTokens : LRU borné des jetons déjà vérifiés (empreinte du jeton ->
+  claims et expiration). Une requête authentifiée avec un jeton connu évite
+  la vérification HMAC et le décodage JSON de jwt.decode.
+- RevocationList : jetons révoqués (déconnexion) jusqu'à leur expiration.
+  Un filtre de Bloom répond en O(1) « sûrement pas révoqué » pour l'immense
+  majorité des requêtes ; un ensemble exact confirme les réponses positives
+  (pas de faux positif au final). Les entrées expirées sont purgées
+  périodiquement et le filtre reconstruit.
+
+Les jetons ne sont jamais conservés en clair, seulement leur empreinte.
+"""
+
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict
+
+
+def token_hash(token):
+    return hashlib.blake2b(token.encode(), digest_size=16).digest()
+
+
+class VerifiedTokens:
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # empreinte -> (claims, expiration)
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= now:
+                if entry is not None:
+                    del self._entries[key]
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return entry[0]
+
+    def put(self, key, claims, expires_at):
+        with self._lock:
+            self._entries[key] = (claims, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+        return stats
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate=0.001):
+        # Taille et nombre de fonctions de hachage optimaux pour capacity éléments
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key):
+        # Double hachage (Kirsch-Mitzenmacher) à partir d'une empreinte de 16 octets
+        h1 = int.from_bytes(key[:8], "little")
+        h2 = int.from_bytes(key[8:16], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class RevocationList:
+    def __init__(self, capacity=100000, error_rate=0.001, purge_interval=600, store=None):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.purge_interval = purge_interval
+        # Niveau persistant optionnel : objet avec revoke_token(empreinte, expiration) et revoked_tokens()
+        self.store = store
+        self._revoked = {}  # empreinte -> expiration
+        self._bloom = BloomFilter(capacity, error_rate)
+        self._last_purge = time.time()
+        self._lock = threading.Lock()
+        self._stats = {"revoked": 0, "bloom_negatives": 0, "bloom_false_positives": 0, "purged": 0}
+        if store is not None:
+            now = time.time()
+            for key, expires_at in store.revoked_tokens():
+                if expires_at > now:
+                    self._revoked[key] = expires_at
+                    self._bloom.add(key)
+
+    def revoke(self, key, expires_at):
+        with self._lock:
+            self._revoked[key] = expires_at
+            self._bloom.add(key)
+            self._stats["revoked"] += 1
+            if len(self._revoked) > self.capacity:
+                # Au-delà de la capacité, le taux de faux positifs du filtre augmente : purge anticipée
+                self._purge_locked()
+        if self.store is not None:
+            self.store.revoke_token(key, expires_at)
+
+    def is_revoked(self, key):
+        if time.time() - self._last_purge > self.purge_interval:
+            self.purge()
+        # Lecture sans verrou : le filtre n'est jamais modifié en place lors d'une purge (remplacé)
+        if key not in self._bloom:
+            self._stats["bloom_negatives"] += 1
+            return False
+        with self._lock:
+            expires_at = self._revoked.get(key)
+            if expires_at is None:
+                self._stats["bloom_false_positives"] += 1
+                return False
+            return expires_at > time.time()
+
+    def _purge_locked(self):
+        now = time.time()
+        expired = [key for key, expires_at in self._revoked.items() if expires_at <= now]
+        for key in expired:
+            del self._revoked[key]
+        # Un filtre de Bloom ne supporte pas la suppression : reconstruction
+        bloom = BloomFilter(max(self.capacity, len(self._revoked)), self.error_rate)
+        for key in self._revoked:
+            bloom.add(key)
+        self._bloom = bloom
+        self._last_purge = now
+        self._stats["purged"] += len(expired)
+        return len(expired)
+
+    def purge(self):
+        with self._lock:
+            purged = self._purge_locked()
+        if self.store is not None:
+            self.store.purge_revoked_tokens()
+        return purged
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._revoked)
+        return stats
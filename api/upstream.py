@@ -0,0 +1,231 @@
+"""
+Client HTTP partagé pour tous les appels vers les fournisseurs externes
+(OpenWeather, Agromonitoring, OpenRouter).
+
+Chaque fournisseur dispose de sa propre requests.Session avec un pool de
+connexions persistantes (keep-alive) et de timeouts connexion/lecture
+explicites, pour ne plus payer une poignée de main TCP+TLS à chaque appel
+ni bloquer un worker indéfiniment sur une réponse lente.
+"""
+
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import quota
+
+try:
+    from config import CONFIG
+except ImportError:
+    CONFIG = {}
+
+# Timeouts par défaut (connexion, lecture) en secondes
+DEFAULT_TIMEOUTS = {
+    "openweather": (3.05, 10),
+    "agromonitoring": (3.05, 15),
+    "openrouter": (3.05, 60),
+}
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+# Pool borné partagé par les handlers qui combinent plusieurs sources
+_fanout_executor = ThreadPoolExecutor(
+    max_workers=CONFIG.get("FANOUT_MAX_WORKERS", 16),
+    thread_name_prefix="upstream-fanout",
+)
+
+# Pool séparé pour les endpoints batch, pour qu'un gros lot ne prive pas
+# les autres handlers de workers
+_batch_executor = ThreadPoolExecutor(
+    max_workers=CONFIG.get("BATCH_MAX_CONCURRENCY", 8),
+    thread_name_prefix="upstream-batch",
+)
+
+
+def get_timeout(provider):
+    timeouts = CONFIG.get("HTTP_TIMEOUTS", {})
+    timeout = timeouts.get(provider) or DEFAULT_TIMEOUTS.get(provider, (3.05, 10))
+    return tuple(timeout)
+
+
+def get_session(provider):
+    """Retourne la session (et donc le pool de connexions) du fournisseur"""
+    session = _sessions.get(provider)
+    if session is not None:
+        return session
+
+    with _sessions_lock:
+        session = _sessions.get(provider)
+        if session is None:
+            adapter = HTTPAdapter(
+                pool_connections=CONFIG.get("HTTP_POOL_CONNECTIONS", 10),
+                pool_maxsize=CONFIG.get("HTTP_POOL_MAXSIZE", 20),
+                max_retries=CONFIG.get("HTTP_MAX_RETRIES", 0),
+            )
+            session = requests.Session()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _sessions[provider] = session
+    return session
+
+
+def check_rate_limited(provider, response):
+    """Une réponse 429 vide le budget du fournisseur et lève QuotaExceeded"""
+    if response.status_code == 429:
+        retry_after = quota.parse_retry_after(response.headers.get("Retry-After"))
+        quota.manager.rate_limited(provider, retry_after)
+        raise quota.QuotaExceeded(provider, retry_after=retry_after)
+    return response
+
+
+def get(provider, url, **kwargs):
+    quota.manager.acquire(provider)
+    kwargs.setdefault("timeout", get_timeout(provider))
+    return check_rate_limited(provider, get_session(provider).get(url, **kwargs))
+
+
+def post(provider, url, **kwargs):
+    quota.manager.acquire(provider)
+    kwargs.setdefault("timeout", get_timeout(provider))
+    return check_rate_limited(provider, get_session(provider).post(url, **kwargs))
+
+
+class SingleFlight:
+    """
+    Regroupe les appels concurrents portant sur la même clé : un seul appel
+    sortant est effectué et tous les appelants reçoivent son résultat (ou son
+    erreur).
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "collapsed": 0, "errors": 0}
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self._stats["collapsed"] += 1
+                leader = False
+            else:
+                call = {"event": threading.Event(), "result": None, "error": None}
+                self._calls[key] = call
+                self._stats["calls"] += 1
+                leader = True
+
+        if not leader:
+            call["event"].wait()
+            if call["error"] is not None:
+                raise call["error"]
+            return call["result"]
+
+        try:
+            call["result"] = fn()
+            return call["result"]
+        except Exception as e:
+            call["error"] = e
+            with self._lock:
+                self._stats["errors"] += 1
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call["event"].set()
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["in_flight"] = len(self._calls)
+        total = stats["calls"] + stats["collapsed"]
+        stats["collapse_rate"] = round(stats["collapsed"] / total, 3) if total else 0.0
+        return stats
+
+
+_single_flight = SingleFlight()
+
+
+def fetch_json(provider, url, **kwargs):
+    """GET coalescé : les requêtes identiques en vol partagent un seul appel"""
+    def call():
+        response = get(provider, url, **kwargs)
+        response.raise_for_status()
+        return response.json()
+
+    key = (provider, url, tuple(sorted((kwargs.get("params") or {}).items())))
+    return _single_flight.do(key, call)
+
+
+def get_singleflight_stats():
+    return _single_flight.get_stats()
+
+
+def fan_out(calls, timeout=None, required=()):
+    """
+    Exécute les appels {nom: callable} en parallèle sous une échéance commune.
+    Les appels optionnels en échec ou en retard valent None ; une erreur ou un
+    retard sur un appel listé dans required est propagé.
+    """
+    if timeout is None:
+        timeout = CONFIG.get("FANOUT_TIMEOUT", 8)
+
+    # Chaque appel hérite du contexte de l'appelant (priorité de quota)
+    futures = {
+        name: _fanout_executor.submit(contextvars.copy_context().run, call)
+        for name, call in calls.items()
+    }
+    done, _ = wait(futures.values(), timeout=timeout)
+
+    results = {}
+    for name, future in futures.items():
+        if future not in done:
+            future.cancel()
+            if name in required:
+                raise TimeoutError(f"Délai dépassé pour {name} ({timeout}s)")
+            print(f"Appel {name} abandonné après {timeout}s")
+            results[name] = None
+            continue
+        try:
+            results[name] = future.result()
+        except Exception as e:
+            if name in required:
+                raise
+            print(f"Appel {name} en échec: {str(e)}")
+            results[name] = None
+    return results
+
+
+def map_concurrent(fn, items, timeout=None):
+    """
+    Applique fn à chaque élément avec une concurrence bornée, sous une
+    échéance commune. Retourne la liste des résultats dans l'ordre des
+    éléments ; un échec ou un retard y figure sous forme d'exception.
+    """
+    if timeout is None:
+        timeout = CONFIG.get("FANOUT_TIMEOUT", 8)
+
+    futures = [_batch_executor.submit(contextvars.copy_context().run, fn, item) for item in items]
+    done, _ = wait(futures, timeout=timeout)
+
+    results = []
+    for future in futures:
+        if future not in done:
+            future.cancel()
+            results.append(TimeoutError(f"Délai dépassé ({timeout}s)"))
+            continue
+        try:
+            results.append(future.result())
+        except Exception as e:
+            results.append(e)
+    return results
+
+
+def close_sessions():
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
@@ -0,0 +1,202 @@
+"""
+Comptes utilisateurs persistants (SQLite en mode WAL).
+
+Les utilisateurs sont indexés par identifiant (clé primaire) et par email
+(index unique, insensible à la casse) : une recherche est une lecture
+d'index, quel que soit le nombre de comptes. Les connexions SQLite sont
+réutilisées via un petit pool. Un cache en mémoire évite la base pour les
+utilisateurs actifs (chaque requête authentifiée relit son utilisateur) ;
+toute modification invalide les entrées concernées.
+"""
+
+import contextlib
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from cache import TTLCache
+
+
+class UserExists(Exception):
+    pass
+
+
+class ConnectionPool:
+    """Connexions SQLite réutilisées entre requêtes (une à la fois par thread emprunteur)"""
+
+    def __init__(self, path, size=4, timeout=5):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.timeout = timeout
+        self._connections = queue.Queue(maxsize=size)
+        for _ in range(size):
+            self._connections.put(self._connect())
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=self.timeout)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @contextlib.contextmanager
+    def connection(self):
+        conn = self._connections.get(timeout=self.timeout)
+        try:
+            yield conn
+        finally:
+            self._connections.put(conn)
+
+    def close(self):
+        while not self._connections.empty():
+            self._connections.get_nowait().close()
+
+
+_COLUMNS = ("id", "email", "name", "password_hash", "role", "created_at", "farms")
+
+
+def _row_to_user(row):
+    user = dict(zip(_COLUMNS, row))
+    user["createdAt"] = user.pop("created_at")
+    user["farms"] = json.loads(user["farms"] or "[]")
+    return user
+
+
+class UserStore:
+    def __init__(self, path, pool_size=4, cache_ttl=300, cache_max_entries=10000):
+        self.pool = ConnectionPool(path, size=pool_size)
+        with self.pool.connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS users ("
+                " id TEXT PRIMARY KEY,"
+                " email TEXT NOT NULL UNIQUE COLLATE NOCASE,"
+                " name TEXT NOT NULL,"
+                " password_hash TEXT NOT NULL,"
+                " role TEXT NOT NULL,"
+                " created_at TEXT NOT NULL,"
+                " farms TEXT NOT NULL DEFAULT '[]'"
+                ") WITHOUT ROWID"
+            )
+            # Jetons révoqués (empreinte) jusqu'à leur expiration, relus au démarrage
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS revoked_tokens ("
+                " token_hash BLOB PRIMARY KEY,"
+                " expires_at REAL NOT NULL"
+                ") WITHOUT ROWID"
+            )
+        # Lecture à travers le cache : "id:<id>" -> utilisateur, "email:<email>" -> id
+        self._cache = TTLCache("users", ttl=cache_ttl, max_entries=cache_max_entries)
+        self._lock = threading.Lock()
+        self._stats = {"reads": 0, "writes": 0}
+
+    def _query_one(self, where, value):
+        with self.pool.connection() as conn:
+            row = conn.execute(f"SELECT {', '.join(_COLUMNS)} FROM users WHERE {where} = ?", (value,)).fetchone()
+        with self._lock:
+            self._stats["reads"] += 1
+        return _row_to_user(row) if row is not None else None
+
+    def get_by_id(self, user_id):
+        if not user_id:
+            return None
+        key = f"id:{user_id}"
+        user, state = self._cache.lookup(key)
+        if state != "fresh":
+            user = self._query_one("id", user_id)
+            if user is None:
+                return None
+            self._cache.put(key, user)
+        # Copie : un appelant qui modifie l'utilisateur ne modifie pas le cache
+        return dict(user, farms=list(user["farms"]))
+
+    def get_by_email(self, email):
+        if not email:
+            return None
+        key = f"email:{email.lower()}"
+        user_id, state = self._cache.lookup(key)
+        if state == "fresh":
+            return self.get_by_id(user_id)
+        user = self._query_one("email", email)
+        if user is None:
+            return None
+        self._cache.put(key, user["id"])
+        self._cache.put(f"id:{user['id']}", user)
+        return dict(user, farms=list(user["farms"]))
+
+    def create(self, user):
+        try:
+            with self.pool.connection() as conn:
+                conn.execute(
+                    f"INSERT INTO users ({', '.join(_COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (user["id"], user["email"], user["name"], user["password_hash"], user["role"],
+                     user["createdAt"], json.dumps(user.get("farms", []))),
+                )
+        except sqlite3.IntegrityError:
+            raise UserExists(user["email"])
+        with self._lock:
+            self._stats["writes"] += 1
+        return user
+
+    def update(self, user_id, **fields):
+        """Met à jour les champs donnés (name, email, password_hash, role, farms)"""
+        previous = self.get_by_id(user_id)
+        if previous is None:
+            return None
+        columns = {name: value for name, value in fields.items()
+                   if name in ("name", "email", "password_hash", "role", "farms")}
+        if "farms" in columns:
+            columns["farms"] = json.dumps(columns["farms"])
+        if columns:
+            assignments = ", ".join(f"{name} = ?" for name in columns)
+            try:
+                with self.pool.connection() as conn:
+                    conn.execute(f"UPDATE users SET {assignments} WHERE id = ?", (*columns.values(), user_id))
+            except sqlite3.IntegrityError:
+                raise UserExists(fields.get("email"))
+            with self._lock:
+                self._stats["writes"] += 1
+        self.invalidate(previous)
+        return self.get_by_id(user_id)
+
+    def invalidate(self, user):
+        self._cache.invalidate(f"id:{user['id']}")
+        self._cache.invalidate(f"email:{user['email'].lower()}")
+
+    def ensure(self, user):
+        """Crée l'utilisateur s'il n'existe pas encore (compte de démonstration)"""
+        if self.get_by_email(user["email"]) is None:
+            try:
+                self.create(user)
+            except UserExists:
+                pass
+
+    def iter_farms(self):
+        """(id utilisateur, ferme) des fermes enregistrées dans les comptes"""
+        with self.pool.connection() as conn:
+            rows = conn.execute("SELECT id, farms FROM users WHERE farms != '[]'").fetchall()
+        for user_id, farms in rows:
+            for farm in json.loads(farms):
+                yield user_id, farm
+
+    def revoke_token(self, token_hash, expires_at):
+        with self.pool.connection() as conn:
+            conn.execute("INSERT OR REPLACE INTO revoked_tokens VALUES (?, ?)", (token_hash, expires_at))
+
+    def revoked_tokens(self):
+        with self.pool.connection() as conn:
+            return conn.execute("SELECT token_hash, expires_at FROM revoked_tokens").fetchall()
+
+    def purge_revoked_tokens(self):
+        with self.pool.connection() as conn:
+            conn.execute("DELETE FROM revoked_tokens WHERE expires_at <= ?", (time.time(),))
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        cache_stats = self._cache.get_stats()
+        stats.update({"cache_hit_rate": cache_stats["hit_rate"], "cached": cache_stats["entries"]})
+        return stats
@@ -0,0 +1,178 @@
+"""
+Modèle de rendement des cultures (tonnes/hectare).
+
+Le rendement d'une culture est une réponse quadratique autour de conditions
+de référence : chaque variable x contribue a * (x - ref) + b * (x - ref)².
+Les coefficients (yield_coefficients.json) sont chargés une seule fois, au
+premier appel, puis réutilisés. La prédiction d'un lot est un seul calcul
+matriciel (lignes x variables), quelles que soient les cultures du lot.
+
+Les variables viennent de l'historique météo de la cellule (moyennes
+journalières), de la météo actuelle quand l'historique manque, et de
+l'analyse de sol. Une variable inconnue prend sa valeur de référence ; la
+confiance croît avec la part de jours d'historique disponibles.
+"""
+
+import hashlib
+import json
+import threading
+
+import numpy as np
+
+FEATURES = (
+    "temperature", "temperature_range", "precipitation", "humidity",
+    "ph_level", "nitrogen", "phosphorus", "potassium", "organic_matter",
+)
+
+SOIL_FEATURES = ("ph_level", "nitrogen", "phosphorus", "potassium", "organic_matter")
+
+# Libellés des facteurs renvoyés par /api/crop-prediction
+FACTOR_LABELS = {
+    "temperature": "temperature",
+    "temperature_range": "temperature range",
+    "precipitation": "rainfall",
+    "humidity": "humidity",
+    "ph_level": "soil pH",
+    "nitrogen": "nitrogen",
+    "phosphorus": "phosphorus",
+    "potassium": "potassium",
+    "organic_matter": "soil quality",
+}
+
+
+def _mean(values):
+    values = [value for value in values if value is not None]
+    return sum(values) / len(values) if values else None
+
+
+def build_features(history=None, weather_data=None, soil_data=None, window_days=30):
+    """
+    Variables d'une parcelle et couverture de l'historique (0 à 1).
+    history : cumuls journaliers de WeatherHistory.query ; valeurs absentes -> None
+    """
+    features = dict.fromkeys(FEATURES)
+    coverage = 0.0
+
+    days = [index for index, count in enumerate((history or {}).get("observations", [])) if count]
+    if days:
+        temperature = history["temperature"]
+        features["temperature"] = _mean([temperature["mean"][day] for day in days])
+        features["temperature_range"] = _mean([
+            temperature["max"][day] - temperature["min"][day]
+            for day in days if temperature["max"][day] is not None
+        ])
+        features["humidity"] = _mean([history["humidity"]["mean"][day] for day in days])
+        # Pluie moyenne par jour observé (mm/jour)
+        features["precipitation"] = sum(history["precipitation"][day] for day in days) / len(days)
+        coverage = min(1.0, len(days) / window_days)
+    elif weather_data:
+        # Sans historique : valeurs du moment (pas d'estimation de la pluie journalière)
+        main = weather_data.get("main", {})
+        features["temperature"] = main.get("temp")
+        features["humidity"] = main.get("humidity")
+        if main.get("temp_max") is not None and main.get("temp_min") is not None:
+            features["temperature_range"] = main["temp_max"] - main["temp_min"]
+
+    for name in SOIL_FEATURES:
+        if soil_data and soil_data.get(name) is not None:
+            features[name] = soil_data[name]
+    return features, coverage
+
+
+def input_hash(version, crop_type, features, coverage, decimals=2):
+    """Empreinte des entrées d'une prédiction (clé de cache)"""
+    payload = [version, crop_type, round(coverage, 2)] + [
+        None if features.get(name) is None else round(float(features[name]), decimals)
+        for name in FEATURES
+    ]
+    return hashlib.sha256(json.dumps(payload).encode()).hexdigest()[:24]
+
+
+class YieldModel:
+    def __init__(self, path):
+        self.path = path
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with open(self.path, "rb") as f:
+            raw = f.read()
+        spec = json.loads(raw)
+        crops = list(spec["crops"])
+
+        def matrix(section):
+            return np.array([
+                [float(spec["crops"][crop].get(section, {}).get(name, 0)) for name in FEATURES]
+                for crop in crops
+            ])
+
+        print(f"Modèle de rendement chargé ({len(crops)} cultures) depuis {self.path}")
+        return {
+            "version": f"{spec.get('version', 1)}-{hashlib.sha256(raw).hexdigest()[:8]}",
+            "crops": crops,
+            "index": {crop: index for index, crop in enumerate(crops)},
+            "base": np.array([spec["crops"][crop]["base"] for crop in crops], dtype=np.float64),
+            "bounds": np.array([[spec["crops"][crop]["min"], spec["crops"][crop]["max"]] for crop in crops]),
+            "confidence": np.array([spec["crops"][crop]["confidence"] for crop in crops], dtype=np.float64),
+            "factors": [spec["crops"][crop].get("factors", []) for crop in crops],
+            "reference": matrix("reference"),
+            "linear": matrix("linear"),
+            "quadratic": matrix("quadratic"),
+        }
+
+    def loaded(self):
+        """Coefficients, chargés au premier appel"""
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    self._model = self._load()
+        return self._model
+
+    @property
+    def version(self):
+        return self.loaded()["version"]
+
+    @property
+    def crops(self):
+        return self.loaded()["crops"]
+
+    def predict(self, crop_types, features, coverage):
+        """
+        crop_types : liste de n cultures connues ; features : liste de n dict
+        (valeur None = référence) ; coverage : n couvertures d'historique.
+        Retourne une liste de n prédictions {yield, confidence, factors}.
+        """
+        model = self.loaded()
+        if not crop_types:
+            return []
+        index = np.array([model["index"][crop] for crop in crop_types])
+        values = np.array(
+            [[np.nan if row.get(name) is None else float(row[name]) for name in FEATURES] for row in features],
+            dtype=np.float64,
+        )
+
+        # Écarts à la référence de chaque culture ; variable inconnue -> écart nul
+        deltas = np.nan_to_num(values - model["reference"][index])
+        contributions = model["linear"][index] * deltas + model["quadratic"][index] * deltas * deltas
+        bounds = model["bounds"][index]
+        yields = np.clip(model["base"][index] + contributions.sum(axis=1), bounds[:, 0], bounds[:, 1])
+
+        confidence_range = model["confidence"][index]
+        confidence = confidence_range[:, 0] + (confidence_range[:, 1] - confidence_range[:, 0]) * np.clip(
+            np.asarray(coverage, dtype=np.float64), 0, 1
+        )
+
+        # Facteurs : les 3 plus fortes contributions, sinon ceux déclarés pour la culture
+        order = np.argsort(-np.abs(contributions), axis=1, kind="stable")[:, :3]
+        predictions = []
+        for row, crop_index in enumerate(index):
+            factors = [FEATURES[column] for column in order[row] if contributions[row, column] != 0]
+            for name in model["factors"][crop_index]:
+                if len(factors) < 3 and name not in factors:
+                    factors.append(name)
+            predictions.append({
+                "yield": round(float(yields[row]), 2),  # tonnes/hectare
+                "confidence": round(float(confidence[row]), 2),
+                "factors": [FACTOR_LABELS.get(name, name) for name in factors],
+            })
+        return predictions